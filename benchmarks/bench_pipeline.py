@@ -0,0 +1,426 @@
+"""
+End-to-end benchmark of the manual generation, without network: YouTube is replayed from recorded
+yt-dlp results and subtitle files, and Ollama is replaced by a local stub server with configurable
+latency. Requests go through the Flask application at several concurrency levels and the throughput,
+the p50/p95 latency and the mean time of every pipeline stage are reported.
+
+Fixtures are a folder with search.json (the flat extract_info result of a ytsearch) and, for every video,
+<id>.json (the full extract_info result) and <id>.en.vtt (its English subtitles, absent if it has none).
+
+Usage (from the project root):
+    python benchmarks/bench_pipeline.py                          # synthetic fixtures, POST /api/video_search
+    python benchmarks/bench_pipeline.py --concurrency 1,4,16 --requests 32
+    python benchmarks/bench_pipeline.py --endpoint jobs          # /api/jobs and its event stream, streamed generation
+    python benchmarks/bench_pipeline.py --warm                   # same device and videos: caches and coalescing
+    python benchmarks/bench_pipeline.py --record "dell xps 13 9310 disassembly" --fixtures benchmarks/fixtures/xps
+    python benchmarks/bench_pipeline.py --fixtures benchmarks/fixtures/xps
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import contextlib
+import itertools
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+WORDS = ("remove the bottom cover screws then gently pry the clip release the battery connector "
+         "and lift the motherboard from the chassis using a plastic spudger heat the adhesive "
+         "under the display panel disconnect the ribbon cable and unscrew the fan bracket").split()
+
+"""
+Write a synthetic auto-generated caption file, with different sentences for every seed.
+@param path: path of the file to write
+@param minutes: length of the video in minutes
+@param seed: seed of the sentences
+@return: None
+"""
+def write_fixture_vtt(path, minutes, seed):
+    rng = random.Random(seed)
+
+    def ts(seconds):
+        return f"{int(seconds // 3600):02d}:{int(seconds % 3600 // 60):02d}:{seconds % 60:06.3f}"
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("WEBVTT\nKind: captions\nLanguage: en\n\n")
+        t = 0.0
+        while t < minutes * 60:
+            line = ' '.join(rng.choice(WORDS) for _ in range(8))
+            f.write(f"{ts(t)} --> {ts(t + 3)}\n{line}\n\n")
+            t += 3
+
+"""
+Write synthetic fixtures: a search with several videos, one of which has no subtitles.
+@param fixtures_dir: folder of the fixtures
+@param videos: number of videos of the search
+@param minutes: length of every video in minutes
+@return: None
+"""
+def write_synthetic_fixtures(fixtures_dir, videos, minutes):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    entries = []
+
+    for i in range(videos):
+        video_id = f"synthetic{i:02d}"
+        info = {
+            "id": video_id,
+            "title": f"Laptop disassembly and repair guide part {i + 1}",
+            "description": "Step by step teardown",
+            "uploader": f"Repair channel {i % 3}",
+            "channel": f"Repair channel {i % 3}",
+            "duration": int(minutes * 60),
+            "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+            "url": f"https://www.youtube.com/watch?v={video_id}",
+            "view_count": 1000 * (i + 1),
+            "like_count": 20 * (i + 1),
+            "timestamp": 1700000000 - 86400 * i
+        }
+        entries.append({key: info[key] for key in ("id", "title", "duration", "url", "view_count", "channel")})
+
+        with open(os.path.join(fixtures_dir, f"{video_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        if i != 1:
+            write_fixture_vtt(os.path.join(fixtures_dir, f"{video_id}.en.vtt"), minutes, i)
+
+    with open(os.path.join(fixtures_dir, 'search.json'), 'w', encoding='utf-8') as f:
+        json.dump({"entries": entries}, f)
+
+"""
+Record fixtures from YouTube with the same yt-dlp calls as the application. Needs network access.
+@param query: text searched on YouTube
+@param fixtures_dir: folder of the fixtures
+@return: None
+"""
+def record_fixtures(query, fixtures_dir):
+    from controllers import subtitles_controller
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+    with subtitles_controller.youtube_dl({"skip_download": True, "ignoreerrors": True, "extract_flat": "in_playlist"}) as ydl:
+        search = ydl.extract_info(f"ytsearch{subtitles_controller.MAX_SEARCH}:{query}", download=False) or {}
+
+    entries = [entry for entry in search.get("entries", []) if entry]
+    with open(os.path.join(fixtures_dir, 'search.json'), 'w', encoding='utf-8') as f:
+        json.dump({"entries": entries}, f)
+
+    with subtitles_controller.youtube_dl(subtitles_controller.downloader_options(fixtures_dir)) as ydl:
+        for entry in entries:
+            info = ydl.extract_info(entry.get("url") or entry["id"], download=True) or {}
+            info = {field: info.get(field) for field in subtitles_controller.SEARCH_ENTRY_FIELDS}
+            with open(os.path.join(fixtures_dir, f"{entry['id']}.json"), 'w', encoding='utf-8') as f:
+                json.dump(info, f)
+
+    print(f"Recorded {len(entries)} videos of '{query}' in {fixtures_dir}")
+
+"""
+Stand-in for YoutubeDL replaying the fixtures. In cold mode every search returns new video IDs,
+so that no subtitles, stats or manual are cached from a previous request.
+"""
+class ReplayYoutubeDL:
+
+    searches = itertools.count()
+    fixtures_dir = None
+    search_latency = 0.0
+    extract_latency = 0.0
+    cold = True
+
+    """
+    @param options: YoutubeDL options, the home path tells where the subtitles are written
+    @param tasks: thread-local holding the DownloadTask of the current thread, unused by the replay
+    """
+    def __init__(self, options, tasks=None):
+        self.params = dict(options)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+    """
+    Replay a search or the extraction of a video.
+    @param url: ytsearch query or video URL
+    @param download: True to write the subtitles of the video
+    @return: recorded extract_info result
+    """
+    def extract_info(self, url, download=False):
+        if url.startswith("ytsearch"):
+            time.sleep(self.search_latency)
+            with open(os.path.join(self.fixtures_dir, 'search.json'), encoding='utf-8') as f:
+                search = json.load(f)
+            suffix = f"-{next(self.searches)}" if self.cold else ""
+            for entry in search["entries"]:
+                entry["url"] = f"https://www.youtube.com/watch?v={entry['id']}{suffix}"
+                entry["id"] += suffix
+            return search
+
+        time.sleep(self.extract_latency)
+        video_id = url.rsplit("v=", 1)[-1]
+        fixture_id = video_id.rsplit("-", 1)[0] if self.cold else video_id
+
+        with open(os.path.join(self.fixtures_dir, f"{fixture_id}.json"), encoding='utf-8') as f:
+            info = dict(json.load(f), id=video_id, webpage_url=url, url=url)
+
+        vtt_path = os.path.join(self.fixtures_dir, f"{fixture_id}.en.vtt")
+        if download and self.params.get("writesubtitles") and os.path.exists(vtt_path):
+            shutil.copyfile(vtt_path, os.path.join(self.params["paths"]["home"], f"{video_id}.en.vtt"))
+        return info
+
+"""
+Ollama stand-in: answers the health checks and generates a fixed text after prompt_latency seconds,
+at tokens_per_second, streamed when asked, with the counters and durations of a real response.
+"""
+class StubOllamaHandler(BaseHTTPRequestHandler):
+
+    prompt_latency = 0.2
+    completion_tokens = 200
+    tokens_per_second = 200.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, body, content_type='application/json'):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._send_json({"models": []})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        start = time.perf_counter()
+        time.sleep(self.prompt_latency)
+        prompt_done = time.perf_counter()
+
+        tokens = [f"{WORDS[i % len(WORDS)]} " for i in range(self.completion_tokens if body.get("prompt") else 0)]
+        final = {
+            "model": body.get("model"),
+            "done": True,
+            "prompt_eval_count": len(body.get("prompt", "")) // 4,
+            "prompt_eval_duration": int((prompt_done - start) * 1e9),
+            "eval_count": len(tokens),
+            "load_duration": 0
+        }
+
+        if not body.get("stream"):
+            time.sleep(len(tokens) / self.tokens_per_second)
+            final.update(response="".join(tokens), eval_duration=int((time.perf_counter() - prompt_done) * 1e9),
+                         total_duration=int((time.perf_counter() - start) * 1e9))
+            self._send_json(final)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        for token in tokens:
+            time.sleep(1 / self.tokens_per_second)
+            self.wfile.write(json.dumps({"response": token, "done": False}).encode() + b"\n")
+            self.wfile.flush()
+        final.update(response="", eval_duration=int((time.perf_counter() - prompt_done) * 1e9),
+                     total_duration=int((time.perf_counter() - start) * 1e9))
+        self.wfile.write(json.dumps(final).encode() + b"\n")
+
+"""
+Start the stub Ollama server on a free local port.
+@return: base URL of the server
+"""
+def start_stub_ollama():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+"""
+Configure the application for the benchmark: temporary stores, the stub Ollama and no real Ollama process.
+Values already set in the environment are kept.
+@param workdir: folder of the temporary stores
+@param ollama_url: base URL of the stub Ollama
+@param warm: False to disable the search and manual caches and the reuse of finished generations
+@return: None
+"""
+def configure_environment(workdir, ollama_url, warm):
+    defaults = {
+        'OLLAMA_PATH': '',
+        'OLLAMA_SUPERVISE': '0',
+        'OLLAMA_CHECK_INTERVAL': '60',
+        'OLLAMA_MODEL': 'llama3.2:latest',
+        'PROMPT_MANUAL': 'utils/prompt_manual.txt',
+        'PROMPT_SUBTITLES': 'utils/prompt_subtitles_no_filter.txt',
+        'MAX_SEARCH': '5',
+        'MIN_DURATION': '60',
+        'COEF_VIEW': '1',
+        'COEF_LIKE': '1',
+        'MAX_RETRIES': '2',
+        'RETRY_DELAY': '1',
+        'REQUEST_TIMEOUT': '2'
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+    os.environ.update({
+        'OLLAMA_URL': f"{ollama_url}/api/generate",
+        'OLLAMA_URLS': f"{ollama_url}/api/generate",
+        'OLLAMA_TEST': f"{ollama_url}/api/tags",
+        'CACHE_DB_PATH': os.path.join(workdir, 'cache.sqlite'),
+        'MANUAL_DB_PATH': os.path.join(workdir, 'manuals.sqlite'),
+        'OLLAMA_LOCK_PATH': os.path.join(workdir, 'ollama.lock')
+    })
+    if not warm:
+        os.environ.update({'SEARCH_CACHE_TTL': '0', 'MANUAL_CACHE_TTL': '0', 'GENERATION_RETENTION': '0'})
+
+"""
+Pick device names that the application maps to models, distinct ones in cold mode
+so that concurrent requests are not coalesced.
+@param count: number of names
+@param warm: True to repeat a single name
+@return: list of device names
+"""
+def pick_devices(count, warm):
+    from controllers.subtitles_controller import get_device_db
+
+    rows = get_device_db().execute("SELECT DEVICE FROM devices ORDER BY DEVICE").fetchall()
+    names = [row[0] for row in rows if len(row[0].split()) >= 3]
+    if not names:
+        raise SystemExit("No device in the device database, run utils/create_db.py first")
+    return [names[0]] * count if warm else [names[i % len(names)] for i in range(count)]
+
+"""
+Run one request through the Flask application.
+@param flask_app: Flask application
+@param device: device name
+@param endpoint: video_search for the synchronous API, jobs for the background job and its event stream
+@return: tuple of the latency in seconds, the time to the first token or None, and whether it succeeded
+"""
+def run_request(flask_app, device, endpoint):
+    client = flask_app.test_client()
+    start = time.perf_counter()
+
+    if endpoint == 'video_search':
+        response = client.post('/api/video_search', json={"device": device})
+        return time.perf_counter() - start, None, response.status_code == 200 and response.get_json().get('success')
+
+    job = client.post('/api/jobs', json={"device": device}).get_json()
+    first_token = None
+    success = False
+    response = client.get(f"/api/jobs/{job['job_id']}/events", buffered=False)
+    for chunk in response.response:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if first_token is None and chunk.startswith('event: token'):
+            first_token = time.perf_counter() - start
+        if chunk.startswith('event: done'):
+            success = '"success": true' in chunk or '"success":true' in chunk
+    response.close()
+    return time.perf_counter() - start, first_token, success
+
+"""
+@param values: list of values
+@param q: quantile between 0 and 1
+@return: quantile of the values, nearest rank
+"""
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+"""
+Print the mean time of every pipeline stage recorded since the last call, then reset the stage metrics.
+@return: None
+"""
+def print_stages():
+    from controllers.metrics_controller import stage_seconds
+
+    with stage_seconds._lock:
+        series = dict(stage_seconds._series)
+        stage_seconds._series.clear()
+
+    stages = ', '.join(f"{stage} {values['sum'] / values['count'] * 1000:.0f}ms x{values['count']}"
+                       for stage, values in sorted(series.items(), key=lambda item: -item[1]['sum']))
+    print(f"      stages: {stages}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures', help='folder of recorded fixtures (default: synthetic fixtures)')
+    parser.add_argument('--record', metavar='QUERY', help='record the fixtures of a YouTube search into --fixtures and exit')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='comma-separated concurrent requests')
+    parser.add_argument('--requests', type=int, default=8, help='requests per concurrency level')
+    parser.add_argument('--endpoint', choices=('video_search', 'jobs'), default='video_search')
+    parser.add_argument('--warm', action='store_true', help='same device and videos for every request')
+    parser.add_argument('--search-latency', type=float, default=0.5, help='seconds of a replayed search')
+    parser.add_argument('--extract-latency', type=float, default=1.0, help='seconds of a replayed video extraction')
+    parser.add_argument('--prompt-latency', type=float, default=0.2, help='seconds before the stub Ollama answers')
+    parser.add_argument('--completion-tokens', type=int, default=200, help='tokens of every stub answer')
+    parser.add_argument('--tokens-per-second', type=float, default=200, help='generation speed of the stub Ollama')
+    parser.add_argument('--minutes', type=float, default=10, help='length of the synthetic videos')
+    parser.add_argument('--verbose', action='store_true', help='show the logs of the application')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        StubOllamaHandler.prompt_latency = args.prompt_latency
+        StubOllamaHandler.completion_tokens = args.completion_tokens
+        StubOllamaHandler.tokens_per_second = args.tokens_per_second
+        configure_environment(workdir, start_stub_ollama(), args.warm)
+        os.chdir(SRC_DIR)
+
+        if args.record:
+            if not args.fixtures:
+                raise SystemExit("--record needs --fixtures")
+            record_fixtures(args.record, os.path.abspath(os.path.join('..', args.fixtures)))
+            return
+
+        if args.fixtures:
+            fixtures_dir = os.path.abspath(os.path.join('..', args.fixtures))
+        else:
+            fixtures_dir = os.path.join(workdir, 'fixtures')
+            write_synthetic_fixtures(fixtures_dir, int(os.environ['MAX_SEARCH']), args.minutes)
+
+        from controllers import subtitles_controller
+        ReplayYoutubeDL.fixtures_dir = fixtures_dir
+        ReplayYoutubeDL.search_latency = args.search_latency
+        ReplayYoutubeDL.extract_latency = args.extract_latency
+        ReplayYoutubeDL.cold = not args.warm
+        subtitles_controller.youtube_dl = ReplayYoutubeDL
+
+        import app
+        print(f"{args.endpoint}, {'warm' if args.warm else 'cold'}, fixtures {fixtures_dir}")
+
+        levels = [int(level) for level in args.concurrency.split(',')]
+        devices = pick_devices(args.requests * len(levels), args.warm)
+
+        for level_index, concurrency in enumerate(levels):
+            level_devices = devices[level_index * args.requests:(level_index + 1) * args.requests]
+            logs = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+            start = time.perf_counter()
+            with logs, ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(lambda device: run_request(app.app, device, args.endpoint), level_devices))
+            elapsed = time.perf_counter() - start
+
+            latencies = [latency for latency, first_token, success in results]
+            first_tokens = [first_token for latency, first_token, success in results if first_token is not None]
+            errors = sum(1 for latency, first_token, success in results if not success)
+
+            line = (f"  c={concurrency:<3} {len(results)} requests  {errors} errors  "
+                    f"{len(results) / elapsed:6.2f} req/s  p50 {percentile(latencies, 0.5):6.2f}s  "
+                    f"p95 {percentile(latencies, 0.95):6.2f}s  max {max(latencies):6.2f}s  "
+                    f"mean {statistics.mean(latencies):6.2f}s")
+            if first_tokens:
+                line += f"  first token p50 {percentile(first_tokens, 0.5):6.2f}s"
+            print(line)
+            print_stages()
+
+if __name__ == '__main__':
+    main()
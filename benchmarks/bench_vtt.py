@@ -0,0 +1,122 @@
+"""
+Micro-benchmark of the VTT subtitle parsing: the streaming parser of controllers/vtt_controller.py
+against the previous readlines/regex pipeline of get_subtitles.
+
+Usage (from the project root):
+    python benchmarks/bench_vtt.py                      # synthetic hour-long auto-generated captions
+    python benchmarks/bench_vtt.py --minutes 180 --repeat 10
+    python benchmarks/bench_vtt.py path/to/video.en.vtt ...
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from controllers.vtt_controller import iter_cues
+
+WORDS = ("remove the bottom cover screws then gently pry the clip release the battery connector "
+         "and lift the motherboard from the chassis using a plastic spudger").split()
+
+"""
+Write a synthetic YouTube auto-generated caption file with rolling cues.
+@param path: path of the file to write
+@param minutes: length of the video in minutes
+@return: None
+"""
+def write_rolling_vtt(path, minutes):
+
+    def ts(seconds):
+        return f"{int(seconds // 3600):02d}:{int(seconds % 3600 // 60):02d}:{seconds % 60:06.3f}"
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("WEBVTT\nKind: captions\nLanguage: en\n\n")
+        previous = ""
+        t = 0.0
+        i = 0
+        while t < minutes * 60:
+            words = [WORDS[(i + k) % len(WORDS)] for k in range(6)]
+            timed = words[0] + ''.join(f"<{ts(t + 0.3 * k)}><c> {w}</c>" for k, w in enumerate(words[1:], 1))
+            line = ' '.join(words)
+            f.write(f"{ts(t)} --> {ts(t + 2)} align:start position:0%\n{previous if previous else ' '}\n{timed}\n\n")
+            f.write(f"{ts(t + 2)} --> {ts(t + 2.01)} align:start position:0%\n{line}\n \n\n")
+            previous = line
+            t += 2.01
+            i += 1
+
+"""
+Previous implementation of the VTT parsing in get_subtitles, kept as the baseline.
+@param vtt_path: path of the VTT file
+@return: list of subtitles lines with their start time
+"""
+def legacy_parse(vtt_path):
+    with open(vtt_path, 'r', encoding='utf-8') as f:
+        subtitles = f.readlines()
+
+    subtitles = subtitles[3:]
+    subtitles = [r for r in subtitles if not re.match("^\\s*\n", r)]
+    subtitles = [re.sub("<[^>]*>","",r) for r in subtitles]
+
+    complete = []
+    prev = ''
+    time_str = None
+    for r in subtitles:
+        if r != prev:
+            if mm := re.match("^([0-9]{2}:[0-9]{2}:[0-9]{2}.[0-9]{3}) --> ([0-9]{2}):([0-9]{2}):([0-9]{2}).([0-9]{3})", r):
+                time_str = mm.group(1)
+            else:
+                complete.append({'t': time_str, 's': r.strip()})
+                prev = r
+    return complete
+
+"""
+Parse a file with the streaming parser, in the same output format as get_subtitles.
+@param vtt_path: path of the VTT file
+@return: list of subtitles lines with their start time
+"""
+def streaming_parse(vtt_path):
+    return [{'t': start, 's': text} for start, end, text in iter_cues(vtt_path)]
+
+"""
+Time a parser on a file.
+@param parse: parsing function
+@param path: path of the VTT file
+@param repeat: number of timed runs
+@return: list of run times in seconds and the result of the last run
+"""
+def run(parse, path, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse(path)
+        times.append(time.perf_counter() - start)
+    return times, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='VTT files to parse (default: a synthetic file)')
+    parser.add_argument('--minutes', type=float, default=60, help='length of the synthetic video')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per parser')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        files = args.files
+        if not files:
+            files = [os.path.join(tempdir, 'synthetic.en.vtt')]
+            write_rolling_vtt(files[0], args.minutes)
+
+        for path in files:
+            size = os.path.getsize(path) / 1024
+            print(f"{os.path.basename(path)} ({size:.0f} KiB)")
+            for name, parse in (('legacy', legacy_parse), ('streaming', streaming_parse)):
+                times, result = run(parse, path, args.repeat)
+                chars = sum(len(r['s']) for r in result)
+                print(f"  {name:<10} median {statistics.median(times) * 1000:8.1f} ms   "
+                      f"best {min(times) * 1000:8.1f} ms   {len(result):6d} lines   {chars:8d} chars")
+
+if __name__ == '__main__':
+    main()
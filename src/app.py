@@ -1,26 +1,28 @@
 import os
 import atexit
+import threading
 from flask import Flask, request
 from dotenv import load_dotenv
-from controllers.home_controller import home_controller, manual_generation_api, show_manual
-from controllers.llm_controller import start_ollama, stop_ollama
+from controllers.home_controller import home_controller, manual_generation_api, show_manual, show_bundle, bundle_api, manual_list_api
+from controllers.job_controller import manual_generation_job_api, job_status_api, job_events_api
+from controllers.llm_controller import supervise_ollama
+from controllers.autocomplete_controller import autocomplete_api, get_device_index
+from controllers.health_controller import health_api
+from controllers.metrics_controller import metrics_api
 
 # Load environment variables from .env file
 load_dotenv()
 
-OLLAMA_PATH = os.getenv('OLLAMA_PATH')
-OLLAMA_TEST = os.getenv('OLLAMA_TEST')
-MAX_RETRIES = int(os.getenv('MAX_RETRIES'))
-RETRY_DELAY = float(os.getenv('RETRY_DELAY'))
-REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT'))
-
 app = Flask(__name__)
 
-# Start Ollama LLM service
-ollama_process = start_ollama(OLLAMA_PATH, OLLAMA_TEST, MAX_RETRIES, RETRY_DELAY, REQUEST_TIMEOUT)
+# Attach to Ollama in the background, starting it once per host if it is not running
+ollama_supervisor = supervise_ollama()
+
+# Hand Ollama over to the other processes of the host when this one exits, the last one terminates it
+atexit.register(ollama_supervisor.stop)
 
-# Ensure Ollama is terminated when the application exits
-atexit.register(lambda: stop_ollama(ollama_process))
+# Build the device autocomplete index in the background
+threading.Thread(target=get_device_index, daemon=True).start()
 
 # API route for home page
 @app.route('/')
@@ -32,6 +34,51 @@ def index():
 def manual_generation():
     return manual_generation_api()
 
+# API route to start a manual generation in the background
+@app.route('/api/jobs', methods=['POST'])
+def manual_generation_job():
+    return manual_generation_job_api()
+
+# API route to poll the progress of a background manual generation
+@app.route('/api/jobs/<job_id>')
+def manual_generation_job_status(job_id):
+    return job_status_api(job_id)
+
+# API route streaming the progress and the manuals of a background generation as server-sent events
+@app.route('/api/jobs/<job_id>/events')
+def manual_generation_job_events(job_id):
+    return job_events_api(job_id)
+
+# API route reporting whether the application is ready to generate manuals
+@app.route('/api/health')
+def health():
+    return health_api()
+
+# Metrics of the generation stages in the Prometheus text format
+@app.route('/metrics')
+def metrics():
+    return metrics_api()
+
+# API route suggesting device names while the user types
+@app.route('/api/devices/autocomplete')
+def device_autocomplete():
+    return autocomplete_api()
+
+# API route listing the generated manuals, optionally filtered by device or video
+@app.route('/api/manuals')
+def manual_list():
+    return manual_list_api()
+
+# API route returning the ranked manuals of a search
+@app.route('/api/bundles/<bundle_id>')
+def manual_bundle(bundle_id):
+    return bundle_api(bundle_id)
+
+# Short route to display the manuals of a search
+@app.route('/m/<bundle_id>')
+def display_bundle(bundle_id):
+    return show_bundle(bundle_id)
+
 # Route to display generated manual
 @app.route('/api/manual')
 def display_manual():
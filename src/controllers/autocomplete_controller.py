@@ -0,0 +1,227 @@
+from flask import request, jsonify
+import os
+import bisect
+import pathlib
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(BASE_DIR, '..', 'devices_database', 'device.sqlite')
+
+# Seconds between two checks of the device database modification time
+AUTOCOMPLETE_CHECK_INTERVAL = float(os.getenv('AUTOCOMPLETE_CHECK_INTERVAL', '5'))
+AUTOCOMPLETE_LIMIT = int(os.getenv('AUTOCOMPLETE_LIMIT', '8'))
+
+PREFIX_PENALTY = 0.1
+
+"""
+Maximum edit distance accepted between a typed word and a word of a device name.
+@param word: typed word
+@return: 0 for words up to 3 characters, 1 up to 6 characters, 2 for longer words
+"""
+def max_distance(word):
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 6:
+        return 1
+    return 2
+
+"""
+Levenshtein distance between two strings, giving up as soon as it exceeds a limit.
+@param a: first string
+@param b: second string
+@param limit: maximum distance of interest
+@return: edit distance, or limit + 1 if it is greater than limit
+"""
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+"""
+Trigrams of a word, padded so that its beginning and end are indexed too.
+@param word: lowercase word
+@return: set of trigrams
+"""
+def trigrams(word):
+    padded = f"^{word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+"""
+In-memory index of the device names for typo-tolerant autocompletion. Every distinct word of the
+catalog is indexed by its trigrams and kept in a sorted list for prefix lookups; every word points
+to the names containing it.
+"""
+class DeviceIndex:
+
+    """
+    @param names: device names of the catalog
+    """
+    def __init__(self, names):
+        self.names = list(names)
+        self.name_words = []
+        self.word_names = defaultdict(set)
+        self.trigram_words = defaultdict(set)
+
+        for name_id, name in enumerate(self.names):
+            words = name.lower().split()
+            self.name_words.append(words)
+            for word in words:
+                self.word_names[word].add(name_id)
+
+        for word in self.word_names:
+            for trigram in trigrams(word):
+                self.trigram_words[trigram].add(word)
+
+        self.sorted_words = sorted(self.word_names)
+
+    """
+    Find the catalog words close to a typed word.
+    @param word: typed word
+    @param prefix: True if the word may be incomplete (the word being typed)
+    @return: dictionary catalog word -> edit distance (PREFIX_PENALTY for a word only starting with it)
+    """
+    def _match_word(self, word, prefix):
+        limit = max_distance(word)
+        matches = {}
+
+        if prefix:
+            start = bisect.bisect_left(self.sorted_words, word)
+            for candidate in self.sorted_words[start:]:
+                if not candidate.startswith(word):
+                    break
+                # a whole word ranks before a longer word it is the beginning of ("x1" before "x13")
+                matches[candidate] = 0 if candidate == word else PREFIX_PENALTY
+
+        if limit:
+            # words sharing at least one trigram are the only ones within the edit distance limit
+            candidates = set()
+            for trigram in trigrams(word):
+                candidates |= self.trigram_words.get(trigram, set())
+            for candidate in candidates:
+                if candidate in matches:
+                    continue
+                target = candidate[:len(word)] if prefix else candidate
+                distance = edit_distance(word, target, limit)
+                if distance <= limit:
+                    matches[candidate] = distance
+        elif word in self.word_names:
+            matches[word] = 0
+
+        return matches
+
+    """
+    Suggest device names for a partial, possibly misspelled, query.
+    @param query: text typed by the user
+    @param limit: maximum number of suggestions
+    @return: list of device names, best match first
+    """
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        words = query.lower().split()
+        if not words:
+            return []
+
+        scores = None
+        for position, word in enumerate(words):
+            # only the last word can still be incomplete
+            matches = self._match_word(word, prefix=position == len(words) - 1 and not query.endswith(' '))
+            word_scores = {}
+            for catalog_word, distance in matches.items():
+                for name_id in self.word_names[catalog_word]:
+                    if distance < word_scores.get(name_id, distance + 1):
+                        word_scores[name_id] = distance
+
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {name_id: scores[name_id] + distance for name_id, distance in word_scores.items() if name_id in scores}
+            if not scores:
+                return []
+
+        ranked = sorted(scores, key=lambda name_id: (scores[name_id], len(self.name_words[name_id]), self.names[name_id]))
+        return [self.names[name_id] for name_id in ranked[:limit]]
+
+_index = None
+_index_version = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+"""
+@return: True once the device index has been built
+"""
+def device_index_ready():
+    return _index is not None
+
+"""
+Get the device index, building it on first use and rebuilding it when create_db.py regenerates the database.
+@return: DeviceIndex instance, or None if the database cannot be read
+"""
+def get_device_index():
+    global _index, _index_version, _index_checked_at
+
+    now = time.monotonic()
+    if _index is not None and now - _index_checked_at < AUTOCOMPLETE_CHECK_INTERVAL:
+        return _index
+
+    with _index_lock:
+        try:
+            stat = os.stat(DB_PATH)
+        except OSError:
+            return _index
+
+        _index_checked_at = now
+        version = (stat.st_mtime_ns, stat.st_size)
+        if _index is not None and version == _index_version:
+            return _index
+
+        start_time = time.perf_counter()
+        try:
+            conn = sqlite3.connect(f"{pathlib.Path(DB_PATH).resolve().as_uri()}?mode=ro", uri=True)
+            try:
+                names = [row[0] for row in conn.execute("SELECT DEVICE FROM devices")]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Cannot build the device index: {e}", flush=True)
+            return _index
+
+        _index = DeviceIndex(names)
+        _index_version = version
+        print(f"Device index built with {len(names)} names in {time.perf_counter() - start_time:.3f}s", flush=True)
+        return _index
+
+"""
+Suggest device names for the text typed in the search box.
+@return JSON response with the list of suggestions.
+"""
+def autocomplete_api():
+    # the raw text is searched: a trailing space tells that the last word is complete
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int), 50))
+
+    if len(query.strip()) < 2:
+        return jsonify({'success': True, 'query': query, 'suggestions': []}), 200
+
+    index = get_device_index()
+    if index is None:
+        return jsonify({
+            'success': False,
+            'status': 'error',
+            'error': 'Device database not available'
+        }), 503
+
+    return jsonify({'success': True, 'query': query, 'suggestions': index.search(query, limit)}), 200
@@ -0,0 +1,318 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DB_PATH = os.path.join(BASE_DIR, '..', os.getenv('CACHE_DB_PATH', 'cache/cache.sqlite'))
+
+"""
+Build a stable cache key from any JSON-serializable parts.
+@param parts: values identifying the cached item
+@return: hexadecimal SHA-256 digest of the parts
+"""
+def make_key(*parts):
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+"""
+Persistent key/value cache stored in a SQLite table, shared by all the workers of the host.
+Values are stored as JSON, entries older than ttl seconds are treated as missing and
+the least recently used entries are evicted when the table grows over max_entries.
+"""
+class PersistentCache:
+
+    """
+    @param name: name of the SQLite table holding the entries
+    @param ttl: seconds an entry stays valid, None to keep it forever
+    @param max_entries: maximum number of entries kept, None for no limit
+    @param path: path of the SQLite database file
+    """
+    def __init__(self, name, ttl=None, max_entries=None, path=CACHE_DB_PATH):
+        if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', name):
+            raise ValueError(f"Invalid cache name: {name}")
+
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._counters_lock = threading.Lock()
+
+    """
+    Get the SQLite connection of the current thread, creating the table on first use.
+    @return: sqlite3 connection
+    """
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.name} ("
+                "KEY TEXT PRIMARY KEY, VALUE TEXT NOT NULL, CREATED_AT REAL NOT NULL, ACCESSED_AT REAL NOT NULL);"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_accessed ON {self.name} (ACCESSED_AT);")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    """
+    Count a cache hit or miss.
+    @param hit: True for a hit, False for a miss
+    @return: None
+    """
+    def _count(self, hit):
+        with self._counters_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    """
+    Read an entry together with its age.
+    @param key: cache key
+    @return: (value, age in seconds) or (None, None) if the entry is missing or expired
+    """
+    def get_with_age(self, key):
+        try:
+            conn = self._connection()
+            row = conn.execute(f"SELECT VALUE, CREATED_AT FROM {self.name} WHERE KEY = ?", (key,)).fetchone()
+
+            if row is None:
+                self._count(False)
+                return None, None
+
+            now = time.time()
+            age = now - row[1]
+
+            if self.ttl is not None and age > self.ttl:
+                conn.execute(f"DELETE FROM {self.name} WHERE KEY = ?", (key,))
+                conn.commit()
+                self._count(False)
+                return None, None
+
+            conn.execute(f"UPDATE {self.name} SET ACCESSED_AT = ? WHERE KEY = ?", (now, key))
+            conn.commit()
+            self._count(True)
+            return json.loads(row[0]), age
+
+        except sqlite3.Error as e:
+            print(f"Cache '{self.name}' read error: {e}", flush=True)
+            self._count(False)
+            return None, None
+
+    """
+    Read an entry.
+    @param key: cache key
+    @return: cached value or None if the entry is missing or expired
+    """
+    def get(self, key):
+        return self.get_with_age(key)[0]
+
+    """
+    Store an entry, evicting the least recently used ones if the cache is full.
+    @param key: cache key
+    @param value: JSON-serializable value
+    @return: None
+    """
+    def set(self, key, value):
+        try:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.name} (KEY, VALUE, CREATED_AT, ACCESSED_AT) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+
+            if self.max_entries is not None:
+                conn.execute(
+                    f"DELETE FROM {self.name} WHERE KEY IN ("
+                    f"SELECT KEY FROM {self.name} ORDER BY ACCESSED_AT DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+            conn.commit()
+
+        except sqlite3.Error as e:
+            print(f"Cache '{self.name}' write error: {e}", flush=True)
+
+    """
+    Remove an entry.
+    @param key: cache key
+    @return: None
+    """
+    def delete(self, key):
+        try:
+            conn = self._connection()
+            conn.execute(f"DELETE FROM {self.name} WHERE KEY = ?", (key,))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Cache '{self.name}' write error: {e}", flush=True)
+
+    """
+    List the stored keys, optionally only the ones written more than older_than seconds ago, oldest first.
+    @param older_than: minimum age in seconds of the returned entries, None for all of them
+    @return: list of keys
+    """
+    def keys(self, older_than=None):
+        try:
+            conn = self._connection()
+            if older_than is None:
+                rows = conn.execute(f"SELECT KEY FROM {self.name}").fetchall()
+            else:
+                rows = conn.execute(
+                    f"SELECT KEY FROM {self.name} WHERE CREATED_AT < ? ORDER BY CREATED_AT", (time.time() - older_than,)
+                ).fetchall()
+            return [row[0] for row in rows]
+        except sqlite3.Error as e:
+            print(f"Cache '{self.name}' read error: {e}", flush=True)
+            return []
+
+    """
+    Report the cache counters.
+    @return: dictionary with hits, misses, hit ratio and number of stored entries
+    """
+    def stats(self):
+        try:
+            size = self._connection().execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+
+        with self._counters_lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'entries': size
+            }
+
+"""
+In-memory cache of the current process for values too costly to rebuild on every request,
+the least recently used entries are evicted when it grows over max_entries.
+"""
+class LRUCache:
+
+    """
+    @param max_entries: maximum number of entries kept, 0 disables the cache
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    """
+    Read an entry, marking it as the most recently used.
+    @param key: hashable cache key
+    @return: cached value or None if the entry is missing
+    """
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    """
+    Store an entry, evicting the least recently used ones if the cache is full.
+    @param key: hashable cache key
+    @param value: value to store
+    @return: None
+    """
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    """
+    Remove all the entries.
+    @return: None
+    """
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    """
+    Report the cache counters.
+    @return: dictionary with hits, misses, hit ratio and number of stored entries
+    """
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'entries': len(self._entries)
+            }
+
+"""
+Coalesces concurrent calls with the same key: the first caller runs the function, the callers
+arriving while it runs wait for it and get the same result (or the same exception).
+"""
+class SingleFlight:
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    """
+    Run fn once for all the concurrent callers with the same key.
+    @param key: hashable key identifying the call
+    @param fn: function without arguments
+    @return: result of fn
+    """
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+    """
+    Tell whether a call with the given key is running.
+    @param key: hashable key identifying the call
+    @return: True if a call is in flight
+    """
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
@@ -0,0 +1,93 @@
+import math
+
+# Llama-style tokenizers average about 4 characters of English text per token
+CHARS_PER_TOKEN = 4
+
+"""
+Estimate the number of tokens of a text without running the model tokenizer.
+@param text: text to measure
+@return: estimated number of tokens
+"""
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+"""
+Split subtitles into consecutive chunks fitting a token budget. Chunks are only cut where a new cue
+timestamp starts, so lines of the same cue always stay together.
+@param subtitles_data: list of subtitles lines ({'t': start time, 's': text})
+@param token_budget: maximum estimated tokens of the text of a chunk
+@return: list of chunks, each a list of subtitles lines
+"""
+def split_subtitles(subtitles_data, token_budget):
+    chunks = []
+    current = []
+    current_tokens = 0
+    cue = []
+    cue_tokens = 0
+    cue_time = object()
+
+    def close_cue():
+        nonlocal current, current_tokens
+        if current and current_tokens + cue_tokens > token_budget:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.extend(cue)
+        current_tokens += cue_tokens
+
+    for sub in subtitles_data:
+        if sub.get('t') != cue_time and cue:
+            close_cue()
+            cue = []
+            cue_tokens = 0
+        cue_time = sub.get('t')
+        cue.append(sub)
+        # +1 for the newline joining the lines
+        cue_tokens += estimate_tokens(sub['s']) + 1
+
+    if cue:
+        close_cue()
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+"""
+Group consecutive texts so that each group fits a token budget.
+@param texts: list of texts
+@param token_budget: maximum estimated tokens of a group
+@return: list of groups, each a list of texts
+"""
+def group_texts(texts, token_budget):
+    groups = []
+    current = []
+    current_tokens = 0
+
+    for text in texts:
+        tokens = estimate_tokens(text) + 2
+        if current and current_tokens + tokens > token_budget:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+
+    if current:
+        groups.append(current)
+
+    return groups
+
+"""
+Cut a text to a token budget, at the last line break that fits when there is one.
+@param text: text to cut
+@param token_budget: maximum estimated tokens of the result
+@return: the text, cut if it is over the budget
+"""
+def truncate_text(text, token_budget):
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    limit = max(1, token_budget) * CHARS_PER_TOKEN
+    # a line break right after the limit still keeps the whole last line
+    line_end = text.rfind('\n', 0, limit + 1)
+    return text[:line_end] if line_end > 0 else text[:limit]
@@ -0,0 +1,235 @@
+import os
+import re
+import zlib
+from collections import Counter, deque
+from dotenv import load_dotenv
+from .chunk_controller import estimate_tokens
+
+load_dotenv()
+
+# Transcripts are compressed before being summarized, 0 sends them as they are
+COMPRESS_TRANSCRIPTS = os.getenv('COMPRESS_TRANSCRIPTS', '1') == '1'
+# A line is dropped when at least this share of its word shingles appeared in the previous lines
+COMPRESS_DUPLICATE_THRESHOLD = float(os.getenv('COMPRESS_DUPLICATE_THRESHOLD', '0.8'))
+# Number of previous lines a line is compared with, so that a step repeated later in the video is kept
+COMPRESS_DUPLICATE_WINDOW = max(1, int(os.getenv('COMPRESS_DUPLICATE_WINDOW', '10')))
+# Only the lines within this many lines of a repair word are kept, 0 keeps every line
+COMPRESS_REPAIR_WINDOW = int(os.getenv('COMPRESS_REPAIR_WINDOW', '0'))
+# Lines without repair words are dropped, first ones first, until the transcript is at most this share
+# of its original tokens; 0 sets no target
+COMPRESS_TARGET_RATIO = float(os.getenv('COMPRESS_TARGET_RATIO', '0'))
+
+# Consecutive lines are joined up to this many characters, one line per cue costs a newline token each
+MERGE_CHARS = 300
+# Words per shingle of the near-duplicate detection
+SHINGLE_WORDS = 4
+HASH_BASE = 1000003
+HASH_MOD = (1 << 61) - 1
+
+FILLER_RE = re.compile(
+    r"\[(?:music|applause|laughter|inaudible)\]|\b(?:um+|uh+|uhm+|erm+|hmm+|ah+|you know|i mean|basically|literally)\b,?",
+    re.IGNORECASE
+)
+# Stuttered words: "the the", "so so so"
+REPEAT_RE = re.compile(r"\b(\w+)(?:\s+\1\b)+", re.IGNORECASE)
+SPACES_RE = re.compile(r"\s+")
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+REPAIR_WORDS = frozenset({
+    "screw", "screws", "screwdriver", "connector", "connectors", "cable", "cables", "ribbon", "flex",
+    "battery", "batteries", "clip", "clips", "latch", "bracket", "adhesive", "glue", "tape",
+    "remove", "removing", "unscrew", "disconnect", "detach", "pry", "spudger", "pick", "heat",
+    "panel", "cover", "back", "bottom", "case", "housing", "frame", "bezel", "hinge", "keyboard",
+    "board", "motherboard", "logic", "fan", "heatsink", "thermal", "paste", "ssd", "ram", "memory",
+    "speaker", "camera", "display", "screen", "port", "socket", "torx", "phillips", "pentalobe", "tweezers"
+})
+
+# Settings that change the compressed text, part of the manual cache key
+COMPRESSION_SETTINGS = {
+    "enabled": COMPRESS_TRANSCRIPTS,
+    "duplicate_threshold": COMPRESS_DUPLICATE_THRESHOLD,
+    "duplicate_window": COMPRESS_DUPLICATE_WINDOW,
+    "repair_window": COMPRESS_REPAIR_WINDOW,
+    "target_ratio": COMPRESS_TARGET_RATIO,
+    "merge_chars": MERGE_CHARS,
+    "shingle_words": SHINGLE_WORDS,
+    "filler": FILLER_RE.pattern,
+    "repair_words": sorted(REPAIR_WORDS)
+}
+
+"""
+Compress the subtitles of a video before they are sent to the LLM: filler words are stripped,
+near-duplicate lines dropped, off-topic lines optionally dropped, and consecutive lines merged.
+The result only depends on the input and the settings, so it can be cached.
+@param subtitles_data: list of subtitles lines ({'t': start time, 's': text})
+@return: compressed subtitles lines and a dictionary with tokens_before, tokens_after and ratio
+"""
+def compress_subtitles(subtitles_data):
+    tokens_before = count_tokens(subtitles_data)
+
+    if not COMPRESS_TRANSCRIPTS or not subtitles_data:
+        return subtitles_data, {'tokens_before': tokens_before, 'tokens_after': tokens_before, 'ratio': 1.0}
+
+    lines = []
+    for sub in subtitles_data:
+        text = strip_filler(sub['s'])
+        if text:
+            lines.append({'t': sub.get('t'), 's': text})
+
+    lines = drop_near_duplicates(lines, COMPRESS_DUPLICATE_THRESHOLD, COMPRESS_DUPLICATE_WINDOW)
+
+    if COMPRESS_REPAIR_WINDOW > 0:
+        lines = keep_repair_windows(lines, COMPRESS_REPAIR_WINDOW)
+
+    if COMPRESS_TARGET_RATIO > 0:
+        lines = fit_target_ratio(lines, int(tokens_before * COMPRESS_TARGET_RATIO))
+
+    lines = merge_lines(lines)
+    tokens_after = count_tokens(lines)
+
+    return lines, {
+        'tokens_before': tokens_before,
+        'tokens_after': tokens_after,
+        'ratio': tokens_after / tokens_before if tokens_before else 1.0
+    }
+
+"""
+Estimate the tokens of subtitles lines joined by newlines, as they are sent to the LLM.
+@param lines: list of subtitles lines
+@return: estimated number of tokens
+"""
+def count_tokens(lines):
+    return estimate_tokens("\n".join(line['s'] for line in lines))
+
+"""
+Remove filler words, noise tags and stuttered words from a caption line.
+@param text: caption line
+@return: cleaned line, empty if nothing is left
+"""
+def strip_filler(text):
+    text = FILLER_RE.sub(' ', text)
+    text = REPEAT_RE.sub(r'\1', text)
+    return SPACES_RE.sub(' ', text).strip(' ,')
+
+"""
+Hashes of the word shingles of a line, computed with a polynomial rolling hash. Words are hashed with
+CRC32 rather than hash(), which changes at every run, so that the output is the same across runs.
+@param words: normalized words of the line
+@return: set of shingle hashes
+"""
+def shingle_hashes(words):
+    word_hashes = [zlib.crc32(word.encode('utf-8')) for word in words]
+
+    if len(word_hashes) <= SHINGLE_WORDS:
+        value = 0
+        for word_hash in word_hashes:
+            value = (value * HASH_BASE + word_hash) % HASH_MOD
+        return {value}
+
+    top = pow(HASH_BASE, SHINGLE_WORDS - 1, HASH_MOD)
+    hashes = set()
+    value = 0
+    for i, word_hash in enumerate(word_hashes):
+        if i >= SHINGLE_WORDS:
+            value = (value - word_hashes[i - SHINGLE_WORDS] * top) % HASH_MOD
+        value = (value * HASH_BASE + word_hash) % HASH_MOD
+        if i >= SHINGLE_WORDS - 1:
+            hashes.add(value)
+    return hashes
+
+"""
+Drop the lines whose shingles mostly appeared in the lines just before, such as captions rolling over
+several cues and echoed sentences. Only the last lines are compared, so that a step legitimately
+repeated later in the video (e.g. the same screws removed on both sides) is kept.
+@param lines: list of subtitles lines
+@param threshold: share of repeated shingles above which a line is dropped
+@param window: number of previous lines compared, dropped lines included
+@return: list of the lines kept, in order
+"""
+def drop_near_duplicates(lines, threshold, window):
+    recent = deque()
+    # occurrences of every shingle in the lines of the window
+    seen = Counter()
+    kept = []
+
+    for line in lines:
+        words = WORD_RE.findall(line['s'].lower())
+        if not words:
+            continue
+
+        hashes = shingle_hashes(words)
+        repeated = sum(1 for value in hashes if value in seen) / len(hashes)
+
+        recent.append(hashes)
+        seen.update(hashes)
+        if len(recent) > window:
+            for value in recent.popleft():
+                seen[value] -= 1
+                if not seen[value]:
+                    del seen[value]
+
+        if repeated < threshold:
+            kept.append(line)
+
+    return kept
+
+"""
+Count the repair words of a line.
+@param text: caption line
+@return: number of words of the line found in REPAIR_WORDS
+"""
+def repair_score(text):
+    return sum(1 for word in WORD_RE.findall(text.lower()) if word in REPAIR_WORDS)
+
+"""
+Keep only the lines close to a line with repair words.
+@param lines: list of subtitles lines
+@param window: number of lines kept before and after every line with repair words
+@return: list of the lines kept, in order
+"""
+def keep_repair_windows(lines, window):
+    keep = [False] * len(lines)
+
+    for i, line in enumerate(lines):
+        if repair_score(line['s']):
+            for j in range(max(0, i - window), min(len(lines), i + window + 1)):
+                keep[j] = True
+
+    return [line for line, kept in zip(lines, keep) if kept]
+
+"""
+Drop lines until the transcript fits a token budget, starting from the lines with the fewest repair words
+and, among them, from the beginning of the video, where introductions and sponsors usually are.
+@param lines: list of subtitles lines
+@param token_budget: maximum estimated tokens of the result
+@return: list of the lines kept, in order
+"""
+def fit_target_ratio(lines, token_budget):
+    # +1 for the newline joining the lines
+    tokens = [estimate_tokens(line['s']) + 1 for line in lines]
+    total = sum(tokens)
+    dropped = set()
+
+    for i in sorted(range(len(lines)), key=lambda i: (repair_score(lines[i]['s']), i)):
+        if total <= token_budget:
+            break
+        dropped.add(i)
+        total -= tokens[i]
+
+    return [line for i, line in enumerate(lines) if i not in dropped]
+
+"""
+Join consecutive lines up to MERGE_CHARS characters. A merged line keeps the start time of its first line.
+@param lines: list of subtitles lines
+@return: list of merged lines
+"""
+def merge_lines(lines):
+    merged = []
+
+    for line in lines:
+        if merged and len(merged[-1]['s']) + 1 + len(line['s']) <= MERGE_CHARS:
+            merged[-1]['s'] += ' ' + line['s']
+        else:
+            merged.append({'t': line['t'], 's': line['s']})
+
+    return merged
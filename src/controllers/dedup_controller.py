@@ -0,0 +1,71 @@
+import os
+import heapq
+from dotenv import load_dotenv
+from .compress_controller import shingle_hashes, WORD_RE
+
+load_dotenv()
+
+# Videos whose transcripts are near-identical (re-uploads, mirrors) are summarized once, 0 summarizes all of them
+DEDUP_VIDEOS = os.getenv('DEDUP_VIDEOS', '1') == '1'
+# Estimated Jaccard similarity of the transcript shingles above which two videos are duplicates
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.7'))
+
+# Values of a signature, the similarity estimate has a standard error of about 1/sqrt(MINHASH_SIZE)
+MINHASH_SIZE = 128
+
+"""
+Compute the MinHash signature of a transcript over its word shingles, in its bottom-k form: the MINHASH_SIZE
+smallest shingle hashes. A single hash function is enough, so it costs one pass over the shingles.
+@param subtitles_data: list of subtitles lines ({'t': start time, 's': text})
+@return: set of at most MINHASH_SIZE values, or None if the transcript has no words
+"""
+def minhash_signature(subtitles_data):
+    words = WORD_RE.findall(" ".join(sub['s'] for sub in subtitles_data).lower())
+    if not words:
+        return None
+
+    shingles = shingle_hashes(words)
+    return frozenset(heapq.nsmallest(MINHASH_SIZE, shingles))
+
+"""
+Estimate the Jaccard similarity of two transcripts from their signatures: the share of the smallest hashes
+of the union that belong to both transcripts.
+@param first: MinHash signature
+@param second: MinHash signature
+@return: estimated similarity, between 0 and 1
+"""
+def similarity(first, second):
+    union = heapq.nsmallest(MINHASH_SIZE, first | second)
+    return sum(1 for value in union if value in first and value in second) / len(union)
+
+"""
+Group the videos whose transcripts are near-duplicates and keep one video per group: the best ranked one,
+since videos are in search rank order. The sources of its duplicates are attached to it as duplicate_sources,
+so that the manual still credits them.
+@param videos: list of videos with subtitles data, in search rank order
+@return: list of the videos kept, in the same order
+"""
+def deduplicate_videos(videos):
+    if not DEDUP_VIDEOS or len(videos) < 2:
+        return videos
+
+    kept = []
+    signatures = []
+
+    for video in videos:
+        signature = minhash_signature(video.get("subtitles_data") or [])
+
+        for representative, representative_signature in zip(kept, signatures):
+            if signature is not None and representative_signature is not None \
+                    and similarity(signature, representative_signature) >= DEDUP_THRESHOLD:
+                print(f"Video {video.get('video_id')} is a near-duplicate of {representative.get('video_id')}, skipped")
+                representative.setdefault("duplicate_sources", []).append(
+                    {"channel": video.get("channel"), "url": video.get("url")}
+                )
+                break
+        else:
+            kept.append(dict(video))
+            signatures.append(signature)
+
+    print(f"{len(kept)} unique videos out of {len(videos)}")
+    return kept
@@ -0,0 +1,28 @@
+from flask import jsonify
+from .llm_controller import ollama_status
+from .manual_controller import get_prompts
+from .autocomplete_controller import device_index_ready
+
+"""
+Report whether the application can generate manuals: Ollama answers and the prompt templates can be read.
+Whether the model is already loaded and the device index built is reported too, without affecting readiness.
+@return: JSON response, status 200 when ready and 503 otherwise
+"""
+def health_api():
+    ollama = ollama_status()
+
+    try:
+        get_prompts()
+        prompts_error = None
+    except (ValueError, OSError) as e:
+        prompts_error = str(e)
+
+    ready = ollama['ready'] and prompts_error is None
+
+    return jsonify({
+        'success': ready,
+        'status': 'ready' if ready else 'starting',
+        'ollama': ollama,
+        'prompts': {'ready': prompts_error is None, 'error': prompts_error},
+        'device_index': {'ready': device_index_ready()}
+    }), 200 if ready else 503
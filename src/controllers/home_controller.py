@@ -1,12 +1,32 @@
-from flask import render_template, request, jsonify, abort
+from flask import render_template, request, jsonify, abort, make_response
 import os
-import json
+import time
+import hashlib
+import sqlite3
 import datetime
-from .subtitles_controller import get_subtitles
-from .manual_controller import report_llm
+import threading
+from .subtitles_controller import get_subtitles, map_device_to_models
+from .manual_controller import generate_reports, generate_consolidated_manual, CONSOLIDATED_MANUAL
+from .dedup_controller import deduplicate_videos
+from .manual_store_controller import manual_store, import_report_file
+from .cache_controller import LRUCache
+from .metrics_controller import span
 
 COEF_VIEW = float(os.getenv('COEF_VIEW'))
 COEF_LIKE = float(os.getenv('COEF_LIKE'))
+# Number of rendered manual pages kept in memory, 0 disables the cache
+MANUAL_PAGE_CACHE_SIZE = int(os.getenv('MANUAL_PAGE_CACHE_SIZE', '256'))
+# Seconds browsers and proxies may show a manual page without revalidating it, 0 always revalidates
+MANUAL_PAGE_MAX_AGE = int(os.getenv('MANUAL_PAGE_MAX_AGE', '0'))
+
+manual_page_cache = LRUCache(MANUAL_PAGE_CACHE_SIZE)
+
+# Seconds the result of a finished generation is given to new requests for the same device models, 0 disables it
+GENERATION_RETENTION = float(os.getenv('GENERATION_RETENTION', '300'))
+
+# generations running or retained, by normalized device models
+_generations = {}
+_generations_lock = threading.Lock()
 
 """
 Home controller to render the home page.
@@ -19,142 +39,464 @@ def home_controller():
 Handle manual generation requests via API.
 @return JSON response with manual ID or error message.
 """
-
 def manual_generation_api():
-#    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'status': 'error',
-                'error': 'No data provided in request'
-            }), 400
-        
-        device = data.get('device', '').strip()
-        
-        if not device:
-            return jsonify({
-                'success': False,
-                'status': 'error',
-                'error': 'Device name is required'
-            }), 400
-        
+    device, error = parse_generation_request()
 
-        status, subtitles_data = get_subtitles(device)
+    if error:
+        return jsonify(error[0]), error[1]
 
-        if status == "device_not_found":
-            return jsonify({
-                'success': False,
-                'status': 'device_not_found',
-                'error': 'Device not found in database. Please check the model name and try again.'
-            }), 404
-        
-        if status != "ok" or not subtitles_data:
-            return jsonify({
+    body, status_code = run_manual_generation(device)
+    return jsonify(body), status_code
+
+"""
+Read and validate the device name of a manual generation request.
+@return: Device name and None, or None and an (error body, status code) tuple.
+"""
+def parse_generation_request():
+    data = request.get_json()
+
+    if not data:
+        return None, ({
+            'success': False,
+            'status': 'error',
+            'error': 'No data provided in request'
+        }, 400)
+
+    device = data.get('device', '').strip()
+
+    if not device:
+        return None, ({
+            'success': False,
+            'status': 'error',
+            'error': 'Device name is required'
+        }, 400)
+
+    return device, None
+
+"""
+Run the whole manual generation pipeline for a device: video search, subtitles download and manual generation.
+It does not need a request context, so it can also run in a background job. Requests for the same device models
+share a single run: a request arriving while the models are being generated gets the progress and the text
+generated so far, then the same result, and a successful result is reused for GENERATION_RETENTION seconds.
+@param device: Name of the device searched by the user.
+@param progress: Optional callback progress(phase, **details) notified at every pipeline step.
+@param on_token: Optional callback on_token(index, text) receiving the manual of each video while it is generated.
+@return: JSON-serializable response body and HTTP status code.
+"""
+def run_manual_generation(device, progress=None, on_token=None):
+    with span("device_lookup"):
+        mapped_models = map_device_to_models(device)
+
+    if not mapped_models:
+        return {
+            'success': False,
+            'status': 'device_not_found',
+            'error': 'Device not found in database. Please check the model name and try again.'
+        }, 404
+
+    key = tuple(sorted({model.lower() for model in mapped_models}))
+    listener = (progress, on_token)
+    now = time.time()
+
+    with _generations_lock:
+        for expired in [k for k, g in _generations.items() if g['finished_at'] and now - g['finished_at'] > GENERATION_RETENTION]:
+            del _generations[expired]
+
+        generation = _generations.get(key)
+        leader = generation is None
+        if leader:
+            generation = {
+                'lock': threading.Lock(),
+                'done': threading.Event(),
+                'listeners': [listener],
+                'events': [],
+                'text': {},
+                'result': None,
+                'error': None,
+                'finished_at': None
+            }
+            _generations[key] = generation
+
+    if not leader:
+        with generation['lock']:
+            if not generation['done'].is_set():
+                print(f"Attaching to the running generation of {' | '.join(key)}", flush=True)
+                # catch up on what the running generation already sent
+                for phase, details in generation['events']:
+                    if progress:
+                        progress(phase, **details)
+                for index, text in sorted(generation['text'].items()):
+                    if on_token:
+                        on_token(index, text)
+                generation['listeners'].append(listener)
+
+        generation['done'].wait()
+        with generation['lock']:
+            if listener in generation['listeners']:
+                generation['listeners'].remove(listener)
+        if generation['error'] is not None:
+            raise generation['error']
+        return generation['result']
+
+    def publish_progress(phase, **details):
+        with generation['lock']:
+            generation['events'].append((phase, details))
+            for listener_progress, _ in generation['listeners']:
+                if listener_progress:
+                    listener_progress(phase, **details)
+
+    def publish_token(index, text):
+        with generation['lock']:
+            generation['text'][index] = generation['text'].get(index, '') + text
+            for _, listener_on_token in generation['listeners']:
+                if listener_on_token:
+                    listener_on_token(index, text)
+
+    try:
+        with span("pipeline"):
+            generation['result'] = generate_device_manuals(device, mapped_models, publish_progress, publish_token)
+        return generation['result']
+    except Exception as e:
+        generation['error'] = e
+        raise
+    finally:
+        with _generations_lock:
+            body, status_code = generation['result'] or ({}, None)
+            if status_code == 200 and GENERATION_RETENTION > 0:
+                generation['finished_at'] = time.time()
+                generation['listeners'] = []
+                generation['events'] = []
+                generation['text'] = {}
+            else:
+                del _generations[key]
+        generation['done'].set()
+
+"""
+Generate the manuals of a device whose models are already mapped.
+@param device: Name of the device searched by the user.
+@param mapped_models: Device models matching the name.
+@param notify: Callback notify(phase, **details) notified at every pipeline step.
+@param on_token: Callback on_token(index, text) receiving the manual of each video while it is generated.
+@return: JSON-serializable response body and HTTP status code.
+"""
+def generate_device_manuals(device, mapped_models, notify, on_token):
+    subtitles_data, error = collect_device_videos(device, mapped_models, notify)
+
+    if error:
+        return error
+
+    return write_device_manuals(device, subtitles_data, notify, on_token)
+
+"""
+Search the videos of a device and get their subtitles, the YouTube stages of the generation.
+@param device: Name of the device searched by the user.
+@param mapped_models: Device models matching the name.
+@param notify: Callback notify(phase, **details) notified at every pipeline step.
+@return: Videos with subtitles and None, or None and an (error body, status code) tuple.
+"""
+def collect_device_videos(device, mapped_models, notify):
+    status, subtitles_data = get_subtitles(device, progress=notify, mapped_models=mapped_models)
+
+    if status == "device_not_found":
+        return None, ({
+            'success': False,
+            'status': 'device_not_found',
+            'error': 'Device not found in database. Please check the model name and try again.'
+        }, 404)
+
+    if status != "ok" or not subtitles_data:
+        return None, ({
+            'success': False,
+            'status': 'error',
+            'error': 'No subtitles found for the specified device. Try with a more specific model name'
+        }, 404)
+
+    # re-uploads of the same video are summarized once
+    with span("dedup"):
+        return deduplicate_videos(subtitles_data), None
+
+"""
+Generate, save and bundle the manuals of the videos of a device, the LLM stages of the generation.
+@param device: Name of the device searched by the user.
+@param subtitles_data: Videos with subtitles returned by collect_device_videos.
+@param notify: Callback notify(phase, **details) notified at every pipeline step.
+@param on_token: Optional callback on_token(index, text) receiving the manual of each video while it is generated.
+@return: JSON-serializable response body and HTTP status code.
+"""
+def write_device_manuals(device, subtitles_data, notify, on_token=None):
+    notify("generating", completed=0, total=len(subtitles_data), titles=[video["title"] for video in subtitles_data])
+    completed = []
+
+    def on_report(index, report_id):
+        completed.append(report_id)
+        notify("generating", completed=len(completed), total=len(subtitles_data), report_id=report_id)
+
+    with span("manuals"):
+        report_ids = generate_reports(subtitles_data, device, on_report=on_report, on_token=on_token)
+
+    for report_id in report_ids:
+        if not report_id or (isinstance(report_id, tuple) and report_id[0] == "error"):
+            return {
                 'success': False,
                 'status': 'error',
-                'error': 'No subtitles found for the specified device. Try with a more specific model name'
-            }), 404
-        
-        report_ids = []
-        for video in subtitles_data:
-            start_time = datetime.datetime.now()
-            nuovo_id = report_llm(video, device)
-            end_time = datetime.datetime.now()
-            report_ids.append(nuovo_id)
-            print(len(report_ids),nuovo_id, f"time: {end_time-start_time}")
-
-        for report_id in report_ids:
-            if not report_id or (isinstance(report_id, tuple) and report_id[0] == "error"):
-                return jsonify({
-                    'success': False,
-                    'status': 'error',
-                    'error': 'Failed to generate a valid manual'
-                }), 500
-            
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            reports_dir = os.path.join(base_dir, "..", "video_reports")
-            json_path = os.path.join(reports_dir, report_id)
-            
-            if not os.path.exists(json_path):
-                return jsonify({
-                    'success': False,
-                    'status': 'error',
-                    'error': 'Manual was generated but file could not be saved. Please try again.'
-                }), 500
+                'error': 'Failed to generate a valid manual'
+            }, 500
 
-        return jsonify({
-            'success': True,
-            'manual_id': report_ids
-        }), 200
+    if len(manual_store.get_many(report_ids)) != len(set(report_ids)):
+        return {
+            'success': False,
+            'status': 'error',
+            'error': 'Manual was generated but could not be saved. Please try again.'
+        }, 500
+
+    if CONSOLIDATED_MANUAL and len(report_ids) > 1:
+        notify("consolidating", completed=len(report_ids), total=len(report_ids))
+        with span("consolidate"):
+            consolidated_id = generate_consolidated_manual(report_ids, device)
+
+        if isinstance(consolidated_id, tuple):
+            print(f"Consolidated manual of '{device}' failed, returning the manuals of the videos", flush=True)
+        else:
+            consolidated = {
+                "view_score": max(video["view_score"] for video in subtitles_data),
+                "like_score": max(video["like_score"] for video in subtitles_data)
+            }
+            report_ids = [consolidated_id] + report_ids
+            subtitles_data = [consolidated] + subtitles_data
+
+    return {
+        'success': True,
+        'manual_id': report_ids,
+        'bundle_id': create_bundle(device, report_ids, subtitles_data)
+    }, 200
 
-#    except Exception:
-#        return jsonify({
-#            'success': False,
-#            'status': 'error',
-#            'error': 'An unexpected error occurred. Please try again later'
-#        }), 500
-    
 
 """
-Render the manual page based on manual ID.
+Render the manual page based on manual ID. Stored manuals never change, so the rendered page is
+cached in memory by ID list and score weights, and is sent with an ETag and a Last-Modified date:
+a repeated view is answered with 304 Not Modified, without reading the manuals again.
 @param manual_id: ID of the manual to be displayed.
 @return HTML template for manual page.
 """
 def show_manual(manual_id_list):
 
-    max_view = 0
-    max_like = 0
-    videos = []
-    for manual_id in manual_id_list:
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        manuals_dir = os.path.join(base_dir, "..", "video_reports")
-        json_path = os.path.join(manuals_dir, manual_id)
+    def build_page():
+        manuals = load_manuals(manual_id_list)
+        return rank_manuals(manuals), max(manual["created_at"] for manual in manuals)
+
+    return manual_page_response((tuple(sorted(manual_id_list)), COEF_VIEW, COEF_LIKE), build_page)
+
+"""
+Render the manual page of a search bundle. The manuals are shown in the order stored in the bundle,
+which is ranked again, from the stored normalized scores, only if COEF_VIEW or COEF_LIKE changed.
+@param bundle_id: Short ID of the bundle.
+@return HTML template for manual page.
+"""
+def show_bundle(bundle_id):
+
+    def build_page():
+        bundle = get_ranked_bundle(bundle_id)
+        if bundle is None:
+            abort(404)
+
+        manuals = manual_store.get_many([item["id"] for item in bundle["items"]])
+        videos = []
+        for item in bundle["items"]:
+            if item["id"] not in manuals:
+                abort(404)
+            video = manual_video(manuals[item["id"]])
+            video.update(view_score=item["view_score"], like_score=item["like_score"], score=item["score"])
+            videos.append(video)
+
+        return videos, bundle["created_at"]
+
+    return manual_page_response(('bundle', bundle_id, COEF_VIEW, COEF_LIKE), build_page)
+
+"""
+Return a search bundle as JSON.
+@param bundle_id: Short ID of the bundle.
+@return JSON response with the device, the ranked manual IDs and their normalized scores.
+"""
+def bundle_api(bundle_id):
+    bundle = get_ranked_bundle(bundle_id)
+
+    if bundle is None:
+        return jsonify({
+            'success': False,
+            'status': 'error',
+            'error': 'Bundle not found'
+        }), 404
+
+    return jsonify({'success': True, **bundle}), 200
 
-        if not os.path.exists(json_path):
+"""
+Send a manual page from the page cache, rendering it on a miss, with the headers needed to answer
+conditional requests with 304 Not Modified.
+@param cache_key: Key of the page in the page cache, it must include the score weights.
+@param build_page: Function returning the ranked videos of the page and the creation time of its newest manual.
+@return: Flask response.
+"""
+def manual_page_response(cache_key, build_page):
+    page = manual_page_cache.get(cache_key)
+
+    if page is None:
+        videos, last_modified = build_page()
+        html = render_template(
+            "manual.html",
+            videos=videos
+        )
+        page = {
+            'html': html,
+            'etag': hashlib.sha256(html.encode('utf-8')).hexdigest(),
+            'last_modified': datetime.datetime.fromtimestamp(last_modified, tz=datetime.timezone.utc)
+        }
+        manual_page_cache.set(cache_key, page)
+
+    response = make_response(page['html'])
+    response.set_etag(page['etag'])
+    response.last_modified = page['last_modified']
+    response.cache_control.public = True
+    if MANUAL_PAGE_MAX_AGE > 0:
+        response.cache_control.max_age = MANUAL_PAGE_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+
+    return response.make_conditional(request)
+
+"""
+Read the manuals of a page, aborting with 404 if any of them does not exist.
+@param manual_id_list: IDs of the manuals.
+@return: List of manual dictionaries, ordered by ID so that the same set of IDs always gives the same page.
+"""
+def load_manuals(manual_id_list):
+    manuals = manual_store.get_many(manual_id_list)
+    loaded = []
+
+    for manual_id in sorted(manual_id_list):
+        data = manuals.get(manual_id) or import_report_file(manual_id)
+
+        if data is None:
             abort(404)
 
-        with open(json_path, encoding="utf-8") as f:
-            data = json.load(f)
-
-        video_sources = []
-        channels = data.get("channels", [])
-        urls = data.get("urls", [])
-
-        for i in range(max(len(channels), len(urls))):
-            channel = channels[i] if i < len(channels) else "Unknown Channel"
-            url = urls[i] if i < len(urls) else "#"
-            video_sources.append({"channel": channel, "url": url})
-
-        vs = data["view_score"]
-        ls = data["like_score"]
-        videos.append({
-            "device_name": data["device"],
-            "manual_content": data["manual_text"],
-            "video_sources": video_sources,
-            "timestamp": data["timestamp"],
-            "title": data["title"],
-            "view_score": vs,
-            "like_score": ls
-            })
-        if vs > max_view:
-            max_view = vs
-        if ls > max_like:
-            max_like = ls
-
-    for i in range(len(videos)):
+        loaded.append(data)
+
+    return loaded
+
+"""
+Build the video shown by manual.html for a stored manual, with its raw view and like scores.
+@param data: Manual dictionary.
+@return: Video dictionary.
+"""
+def manual_video(data):
+    video_sources = []
+    channels = data.get("channels", [])
+    urls = data.get("urls", [])
+
+    for i in range(max(len(channels), len(urls))):
+        channel = channels[i] if i < len(channels) else "Unknown Channel"
+        url = urls[i] if i < len(urls) else "#"
+        video_sources.append({"channel": channel, "url": url})
+
+    return {
+        "device_name": data["device"],
+        "manual_content": data["manual_text"],
+        "video_sources": video_sources,
+        "timestamp": data["timestamp"],
+        "title": data["title"],
+        "view_score": data["view_score"],
+        "like_score": data["like_score"]
+        }
+
+"""
+Score the manuals of a page and sort them, best first.
+@param manuals: List of manual dictionaries.
+@return: List of videos as expected by manual.html.
+"""
+def rank_manuals(manuals):
+    return rank_scores(normalize_scores([manual_video(data) for data in manuals]))
+
+"""
+Divide the view and like scores of a list of videos by their maximum.
+@param items: List of dictionaries with view_score and like_score, modified in place.
+@return: The same list.
+"""
+def normalize_scores(items):
+    max_view = max((item["view_score"] for item in items), default=0) or 1
+    max_like = max((item["like_score"] for item in items), default=0) or 1
+
+    for item in items:
+        item["view_score"] /= max_view
+        item["like_score"] /= max_like
+
+    return items
+
+"""
+Score a list of videos with normalized view and like scores and sort them, best first.
+@param items: List of dictionaries with view_score and like_score, modified in place.
+@return: The same list, sorted by score.
+"""
+def rank_scores(items):
+    for item in items:
         # il punteggio dei video viene calcolato al volo prima della visualizzazione
         # in modo da poter cambiare i pesi senza riscaricare i video
-        videos[i]["view_score"] /= max_view
-        videos[i]["like_score"] /= max_like
-        videos[i]["score"] = (videos[i]["view_score"]*COEF_VIEW + videos[i]["like_score"]*COEF_LIKE)*100/(COEF_VIEW+COEF_LIKE)
+        item["score"] = (item["view_score"]*COEF_VIEW + item["like_score"]*COEF_LIKE)*100/(COEF_VIEW+COEF_LIKE)
+
+    items.sort(key=lambda x: x["score"], reverse=True)
+    return items
 
-    videos.sort(key=lambda x: x["score"], reverse=True)
+"""
+Save the bundle of a finished search: its manuals ranked with the current weights.
+@param device: Name of the device searched by the user.
+@param report_ids: IDs of the generated manuals.
+@param subtitles_data: Videos the manuals were generated from, in the same order.
+@return: Short ID of the bundle, or None if it could not be saved.
+"""
+def create_bundle(device, report_ids, subtitles_data):
+    items = [
+        {"id": report_id, "view_score": video["view_score"], "like_score": video["like_score"]}
+        for report_id, video in zip(report_ids, subtitles_data)
+    ]
 
-    return render_template(
-        "manual.html",
-        videos=videos
-    )
+    try:
+        return manual_store.add_bundle(device, rank_scores(normalize_scores(items)), COEF_VIEW, COEF_LIKE)
+    except sqlite3.Error as e:
+        print(f"Cannot save the bundle of '{device}': {e}", flush=True)
+        return None
+
+"""
+Read a bundle, ranking it again and saving the new order if the weights changed since it was ranked.
+@param bundle_id: Short ID of the bundle.
+@return: Bundle dictionary or None if it does not exist.
+"""
+def get_ranked_bundle(bundle_id):
+    bundle = manual_store.get_bundle(bundle_id)
+
+    if bundle is None:
+        return None
+
+    if (bundle["coef_view"], bundle["coef_like"]) != (COEF_VIEW, COEF_LIKE):
+        # the stored scores are already normalized, only the weighted score and the order change
+        bundle["items"] = rank_scores(bundle["items"])
+        bundle["coef_view"], bundle["coef_like"] = COEF_VIEW, COEF_LIKE
+        manual_store.update_bundle(bundle_id, bundle["items"], COEF_VIEW, COEF_LIKE)
+
+    return bundle
+
+"""
+List the generated manuals, newest first, optionally only the ones of a device or a video.
+@return JSON response with the manuals (without their text) and the pagination parameters.
+"""
+def manual_list_api():
+    device = request.args.get('device', '').strip()
+    video_id = request.args.get('video_id', '').strip()
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    offset = max(0, request.args.get('offset', 0, type=int))
 
+    manuals = manual_store.find(device=device or None, video_id=video_id or None, limit=limit, offset=offset)
 
+    return jsonify({
+        'success': True,
+        'manuals': manuals,
+        'limit': limit,
+        'offset': offset
+    }), 200
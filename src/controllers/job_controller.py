@@ -0,0 +1,472 @@
+from flask import jsonify, url_for, Response
+import os
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from .home_controller import parse_generation_request, run_manual_generation
+from .cache_controller import CACHE_DB_PATH
+
+load_dotenv()
+
+# Number of manual generations running in the background at the same time in each worker process
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# Seconds a finished job stays available to the status endpoint
+JOB_RETENTION = float(os.getenv('JOB_RETENTION', '3600'))
+# Seconds between keep-alive comments on an idle event stream
+SSE_KEEPALIVE = float(os.getenv('SSE_KEEPALIVE', '15'))
+# Seconds between two reads of a job by its event stream, and at most between two writes of its generated text
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '0.25'))
+# An unfinished job whose worker process gave no sign of life for this many seconds is marked as interrupted;
+# the worker touches its jobs every quarter of it
+JOB_STALE_TIMEOUT = float(os.getenv('JOB_STALE_TIMEOUT', '60'))
+
+JOB_COLUMNS = ('ID', 'DEVICE', 'STATUS', 'PHASE', 'MESSAGE', 'COMPLETED', 'TOTAL', 'MANUAL_ID',
+               'TITLES', 'RESULT', 'STATUS_CODE', 'VERSION', 'CREATED_AT', 'UPDATED_AT')
+# Result of a job whose worker was stopped before it finished
+JOB_INTERRUPTED = {
+    'success': False,
+    'status': 'error',
+    'error': 'The generation was interrupted. Please try again'
+}
+
+"""
+Store of the background jobs in a SQLite table of the cache database, shared by all the workers of the host:
+a job started by one worker can be polled and streamed from any other. The text generated so far is kept
+in a second table, one row per video, so that appending to it does not rewrite the whole job.
+"""
+class JobStore:
+
+    """
+    @param path: path of the SQLite database file
+    """
+    def __init__(self, path=CACHE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    """
+    Get the SQLite connection of the current thread, creating the tables on first use.
+    @return: sqlite3 connection
+    """
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "ID TEXT PRIMARY KEY, DEVICE TEXT NOT NULL, STATUS TEXT NOT NULL, PHASE TEXT NOT NULL, "
+                "MESSAGE TEXT NOT NULL, COMPLETED INTEGER NOT NULL, TOTAL INTEGER NOT NULL, MANUAL_ID TEXT NOT NULL, "
+                "TITLES TEXT NOT NULL, RESULT TEXT, STATUS_CODE INTEGER, VERSION INTEGER NOT NULL, "
+                "CREATED_AT REAL NOT NULL, UPDATED_AT REAL NOT NULL);"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (UPDATED_AT);")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_text ("
+                "JOB_ID TEXT NOT NULL, IDX INTEGER NOT NULL, TEXT TEXT NOT NULL, PRIMARY KEY (JOB_ID, IDX));"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    """
+    Save a new queued job.
+    @param job_id: ID of the job
+    @param device: name of the device searched by the user
+    @return: None
+    """
+    def create(self, job_id, device):
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))})",
+                (job_id, device, 'queued', 'queued', 'Waiting for a free worker...', 0, 0, '[]', '[]', None, None, 0, now, now)
+            )
+
+    """
+    Read a job.
+    @param job_id: ID of the job
+    @return: job dictionary, without the text generated so far, or None if the job does not exist
+    """
+    def get(self, job_id):
+        row = self._connection().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE ID = ?", (job_id,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        job = {column.lower(): value for column, value in zip(JOB_COLUMNS, row)}
+        job['job_id'] = job.pop('id')
+        job['manual_id'] = json.loads(job['manual_id'])
+        job['titles'] = json.loads(job['titles'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+    """
+    Read the version of a job, increased at every change, to poll it cheaply.
+    @param job_id: ID of the job
+    @return: version or None if the job does not exist
+    """
+    def version(self, job_id):
+        row = self._connection().execute("SELECT VERSION FROM jobs WHERE ID = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    """
+    Read the text generated so far for every video of a job.
+    @param job_id: ID of the job
+    @return: dictionary video index -> text
+    """
+    def get_text(self, job_id):
+        rows = self._connection().execute("SELECT IDX, TEXT FROM job_text WHERE JOB_ID = ?", (job_id,)).fetchall()
+        return dict(rows)
+
+    """
+    Update the progress of a job.
+    @param job_id: ID of the job
+    @param phase: current pipeline phase
+    @param details: fields sent by the pipeline (status, completed, total, titles, report_id, result, status_code)
+    @return: None
+    """
+    def update(self, job_id, phase, **details):
+        conn = self._connection()
+        with conn:
+            # the read and the write are in the same write transaction, so updates cannot overwrite each other
+            conn.execute("BEGIN IMMEDIATE")
+            job = self.get(job_id)
+            # a job marked as interrupted keeps its result even if its worker comes back
+            if job is None or job['status'] == 'done':
+                return
+
+            report_id = details.pop('report_id', None)
+            if isinstance(report_id, str):
+                job['manual_id'].append(report_id)
+
+            job.update({key: value for key, value in details.items() if key in job})
+            job['phase'] = phase
+            job['message'] = _phase_message(job)
+
+            conn.execute(
+                "UPDATE jobs SET STATUS = ?, PHASE = ?, MESSAGE = ?, COMPLETED = ?, TOTAL = ?, MANUAL_ID = ?, TITLES = ?, "
+                "RESULT = ?, STATUS_CODE = ?, VERSION = VERSION + 1, UPDATED_AT = ? WHERE ID = ?",
+                (job['status'], job['phase'], job['message'], job['completed'], job['total'],
+                 json.dumps(job['manual_id']), json.dumps(job['titles'], ensure_ascii=False),
+                 json.dumps(job['result'], ensure_ascii=False) if job['result'] is not None else None,
+                 job['status_code'], time.time(), job_id)
+            )
+
+    """
+    Append pieces of generated manuals to a job.
+    @param job_id: ID of the job
+    @param pieces: dictionary video index -> new text
+    @return: None
+    """
+    def append_text(self, job_id, pieces):
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO job_text (JOB_ID, IDX, TEXT) VALUES (?, ?, ?) "
+                "ON CONFLICT (JOB_ID, IDX) DO UPDATE SET TEXT = TEXT || excluded.TEXT",
+                [(job_id, index, text) for index, text in pieces.items()]
+            )
+            conn.execute("UPDATE jobs SET VERSION = VERSION + 1, UPDATED_AT = ? WHERE ID = ?", (time.time(), job_id))
+
+    """
+    Record that the worker running some jobs is alive, without changing their version.
+    @param job_ids: IDs of the jobs
+    @return: None
+    """
+    def touch(self, job_ids):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                f"UPDATE jobs SET UPDATED_AT = ? WHERE STATUS != 'done' AND ID IN ({', '.join('?' * len(job_ids))})",
+                [time.time()] + job_ids
+            )
+
+    """
+    Give up the unfinished jobs not updated for timeout seconds. Their worker touches them regularly,
+    so they are only left behind when it was stopped or crashed.
+    @param timeout: seconds
+    @return: number of jobs marked as interrupted
+    """
+    def interrupt_stale(self, timeout):
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            return conn.execute(
+                "UPDATE jobs SET STATUS = 'done', PHASE = 'done', MESSAGE = 'Completed', RESULT = ?, STATUS_CODE = 500, "
+                "VERSION = VERSION + 1, UPDATED_AT = ? WHERE STATUS != 'done' AND UPDATED_AT < ?",
+                (json.dumps(JOB_INTERRUPTED), now, now - timeout)
+            ).rowcount
+
+    """
+    Remove the finished jobs not updated for max_age seconds.
+    @param max_age: seconds
+    @return: None
+    """
+    def prune(self, max_age):
+        limit = time.time() - max_age
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM job_text WHERE JOB_ID IN (SELECT ID FROM jobs WHERE STATUS = 'done' AND UPDATED_AT < ?)", (limit,))
+            conn.execute("DELETE FROM jobs WHERE STATUS = 'done' AND UPDATED_AT < ?", (limit,))
+
+"""
+Start a background manual generation job.
+@return JSON response with the job ID and the URL to poll for its progress.
+"""
+def manual_generation_job_api():
+    device, error = parse_generation_request()
+
+    if error:
+        return jsonify(error[0]), error[1]
+
+    job_id = submit_job(device)
+
+    return jsonify({
+        'success': True,
+        'status': 'queued',
+        'job_id': job_id,
+        'status_url': url_for('manual_generation_job_status', job_id=job_id)
+    }), 202
+
+"""
+Report the progress of a background manual generation job.
+@param job_id: ID returned when the job was started.
+@return JSON response with the job phase, the manuals generated so far and, once done, the final result.
+"""
+def job_status_api(job_id):
+    job = get_job(job_id)
+
+    if job is None:
+        return jsonify({
+            'success': False,
+            'status': 'error',
+            'error': 'Job not found or expired'
+        }), 404
+
+    return jsonify(job), 200
+
+"""
+Stream the progress and the manuals of a background job as server-sent events.
+Events: "progress" (phase, message, counters, titles, manual IDs), "token" (text generated for
+the video at index, to be written at offset) and "done" (final result, same body as /api/video_search).
+@param job_id: ID returned when the job was started.
+@return: text/event-stream response, or JSON error if the job does not exist.
+"""
+def job_events_api(job_id):
+    if get_job(job_id) is None:
+        return jsonify({
+            'success': False,
+            'status': 'error',
+            'error': 'Job not found or expired'
+        }), 404
+
+    return Response(job_events(job_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+"""
+Queue the manual generation of a device on the background executor of this worker process.
+The job is saved in the shared store first, so its status and events can be served by any worker.
+@param device: Name of the device searched by the user.
+@return: ID of the new job.
+"""
+def submit_job(device):
+    job_store.prune(JOB_RETENTION)
+    job_store.interrupt_stale(JOB_STALE_TIMEOUT)
+
+    job_id = uuid.uuid4().hex
+    job_store.create(job_id, device)
+
+    with _owned_jobs_lock:
+        _owned_jobs.add(job_id)
+    _start_heartbeat()
+
+    _executor.submit(_run_job, job_id, device)
+    return job_id
+
+"""
+Get a snapshot of a job state. An unfinished job whose worker stopped touching it is marked as interrupted first.
+@param job_id: ID of the job.
+@return: Job dictionary or None if the job does not exist.
+"""
+def get_job(job_id):
+    job = job_store.get(job_id)
+
+    if job is not None and job['status'] != 'done' and job['updated_at'] < time.time() - JOB_STALE_TIMEOUT:
+        job_store.interrupt_stale(JOB_STALE_TIMEOUT)
+        job = job_store.get(job_id)
+    return job
+
+_owned_jobs = set()
+_owned_jobs_lock = threading.Lock()
+_heartbeat_thread = None
+
+"""
+Start, once per process, the thread touching the queued and running jobs of this process
+every quarter of JOB_STALE_TIMEOUT, so that they are not taken for interrupted.
+@return: None
+"""
+def _start_heartbeat():
+    global _heartbeat_thread
+    with _owned_jobs_lock:
+        if _heartbeat_thread is not None:
+            return
+        _heartbeat_thread = threading.Thread(target=_heartbeat, name="job_heartbeat", daemon=True)
+        _heartbeat_thread.start()
+
+"""
+Touch the jobs of this process forever.
+@return: None
+"""
+def _heartbeat():
+    while True:
+        time.sleep(JOB_STALE_TIMEOUT / 4)
+        with _owned_jobs_lock:
+            job_ids = list(_owned_jobs)
+        try:
+            job_store.touch(job_ids)
+        except sqlite3.Error as e:
+            print(f"Job heartbeat failed: {type(e).__name__}: {e}", flush=True)
+
+"""
+Generate the server-sent events of a job until it is done, polling the shared store every JOB_POLL_INTERVAL
+seconds. The whole text generated so far is sent on the first iteration, so a client reconnecting after
+a network error gets the manuals back.
+@param job_id: ID of the job.
+@return: generator of server-sent event strings
+"""
+def job_events(job_id):
+    version = None
+    sent_progress = None
+    sent_text = {}
+    idle_since = time.monotonic()
+
+    while True:
+        current_version = job_store.version(job_id)
+        if current_version is None:
+            return
+
+        if current_version == version:
+            if time.monotonic() - idle_since >= SSE_KEEPALIVE:
+                idle_since = time.monotonic()
+                # a job left behind by a stopped worker is marked as interrupted, which changes its version
+                get_job(job_id)
+                yield ": keep-alive\n\n"
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+
+        # the text is read before the job, so that a job read as done has all its text
+        partial_text = job_store.get_text(job_id)
+        job = job_store.get(job_id)
+        if job is None:
+            return
+        version = job['version']
+        idle_since = time.monotonic()
+
+        progress = {key: job[key] for key in ('status', 'phase', 'message', 'completed', 'total', 'titles', 'manual_id')}
+        if progress != sent_progress:
+            sent_progress = progress
+            yield _sse('progress', progress)
+
+        for index, text in sorted(partial_text.items()):
+            offset = sent_text.get(index, 0)
+            if len(text) > offset:
+                yield _sse('token', {'index': index, 'offset': offset, 'text': text[offset:]})
+                sent_text[index] = len(text)
+
+        if job['status'] == 'done':
+            yield _sse('done', job['result'])
+            return
+
+"""
+Format a server-sent event.
+@param event: event name
+@param data: JSON-serializable event data
+@return: event string
+"""
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+"""
+Run the generation pipeline of a job and store its outcome. The generated text is buffered and written
+to the store at most every JOB_POLL_INTERVAL seconds, and before every progress update.
+@param job_id: ID of the job.
+@param device: Name of the device searched by the user.
+@return: None
+"""
+def _run_job(job_id, device):
+    pending = {}
+    pending_lock = threading.Lock()
+    last_flush = [time.monotonic()]
+
+    def flush():
+        with pending_lock:
+            if pending:
+                job_store.append_text(job_id, pending)
+                pending.clear()
+            last_flush[0] = time.monotonic()
+
+    def progress(phase, **details):
+        flush()
+        job_store.update(job_id, phase, **details)
+
+    def on_token(index, text):
+        with pending_lock:
+            pending[index] = pending.get(index, '') + text
+        if time.monotonic() - last_flush[0] >= JOB_POLL_INTERVAL:
+            flush()
+
+    job_store.update(job_id, 'starting', status='running')
+
+    try:
+        body, status_code = run_manual_generation(device, progress=progress, on_token=on_token)
+    except Exception as e:
+        print(f"Job {job_id} failed: {type(e).__name__}: {e}", flush=True)
+        body, status_code = {
+            'success': False,
+            'status': 'error',
+            'error': 'An unexpected error occurred. Please try again later'
+        }, 500
+
+    flush()
+    job_store.update(job_id, 'done', status='done', result=body, status_code=status_code)
+
+    with _owned_jobs_lock:
+        _owned_jobs.discard(job_id)
+
+"""
+Build a human readable description of the job phase.
+@param job: Job dictionary.
+@return: Description of the current phase.
+"""
+def _phase_message(job):
+    phase = job['phase']
+
+    if phase == 'searching':
+        return 'Searching for videos...'
+    if phase == 'downloading subtitles':
+        return f"Downloading subtitles of {job['total']} videos..."
+    if phase == 'generating':
+        return f"Generating manuals {job['completed']}/{job['total']}..."
+    if phase == 'consolidating':
+        return 'Merging the manuals into a single manual...'
+    if phase == 'done':
+        return 'Completed'
+    return 'Starting...'
+
+job_store = JobStore()
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="manual_job")
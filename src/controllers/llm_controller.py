@@ -1,6 +1,45 @@
+import os
+import glob
+import json
+import signal
 import requests
 import subprocess
+import threading
 import time
+import datetime
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+from .chunk_controller import estimate_tokens
+
+load_dotenv()
+
+# Comma-separated generate endpoints of the Ollama servers sharing the load (default: OLLAMA_URL)
+OLLAMA_URLS = os.getenv('OLLAMA_URLS') or os.getenv('OLLAMA_URL') or ''
+# Requests sent at the same time to each server, keep it equal to the server OLLAMA_NUM_PARALLEL
+OLLAMA_NUM_PARALLEL = int(os.getenv('OLLAMA_NUM_PARALLEL', '2'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+LLM_RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF', '1.0'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '1200'))
+# Seconds a server that refused a connection is skipped by the load balancer
+LLM_ENDPOINT_COOLDOWN = float(os.getenv('LLM_ENDPOINT_COOLDOWN', '30'))
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL')
+
+# Seconds the model stays loaded after a request outside business hours
+OLLAMA_KEEP_ALIVE = int(os.getenv('OLLAMA_KEEP_ALIVE', '300'))
+# During these hours (e.g. 08:00-19:00) the model is kept loaded and loaded again if Ollama unloads it;
+# empty disables the schedule
+OLLAMA_BUSINESS_HOURS = os.getenv('OLLAMA_BUSINESS_HOURS', '')
+# ISO weekdays of the business hours, 1 is Monday
+OLLAMA_BUSINESS_DAYS = os.getenv('OLLAMA_BUSINESS_DAYS', '1-5')
+# Context sizes a request can use: the smallest one fitting the prompt and the answer is chosen.
+# Ollama reloads the model when num_ctx changes, so a few sizes are better than many
+OLLAMA_NUM_CTX = sorted(int(size) for size in os.getenv('OLLAMA_NUM_CTX', '4096,8192').split(','))
+# Tokens left for the answer when choosing num_ctx
+NUM_CTX_ANSWER_TOKENS = 1024
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 """
 Starts and manages the Ollama process.
@@ -12,30 +51,58 @@ Starts and manages the Ollama process.
 @return: The subprocess.Popen object representing the Ollama process.
 """
 def start_ollama(ollama_path, healthcheck_url, max_retries, retry_delay, request_timeout):
-    process = subprocess.Popen(
+    process = spawn_ollama(ollama_path)
+
+    try:
+        wait_for_ollama(process, healthcheck_url, max_retries, retry_delay, request_timeout)
+    except (RuntimeError, TimeoutError):
+        stop_ollama(process)
+        raise
+
+    return process
+
+"""
+Start `ollama serve` without waiting for it.
+@param ollama_path: Path to the Ollama executable.
+@return: The subprocess.Popen object representing the Ollama process.
+"""
+def spawn_ollama(ollama_path):
+    return subprocess.Popen(
         [ollama_path, "serve"],
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     )
 
-    for attempt in range(1, max_retries + 1):
+"""
+Wait until a started Ollama answers its health check.
+@param process: The subprocess.Popen object representing the Ollama process.
+@param healthcheck_url: URL to check if Ollama is ready.
+@param max_retries: Maximum number of retries for health checks.
+@param retry_delay: Delay between retries in seconds.
+@param request_timeout: Timeout for each health check request in seconds.
+@return: None, raises RuntimeError if the process exits and TimeoutError if it does not answer in time
+"""
+def wait_for_ollama(process, healthcheck_url, max_retries, retry_delay, request_timeout):
+    # one session for all the health checks, so the connection is reused once Ollama is up
+    with requests.Session() as session:
+        for attempt in range(1, max_retries + 1):
 
-        # Check if the process crashed
-        if process.poll() is not None:
-            raise RuntimeError("Ollama process exited during startup")
+            # Check if the process crashed
+            if process.poll() is not None:
+                raise RuntimeError("Ollama process exited during startup")
 
-        try:
-            response = requests.get(
-                healthcheck_url,
-                timeout=request_timeout,
-            )
-            response.raise_for_status()
-            print(f"Ollama is ready (attempt {attempt}/{max_retries})", flush=True)
-            return process
+            try:
+                response = session.get(
+                    healthcheck_url,
+                    timeout=request_timeout,
+                )
+                response.raise_for_status()
+                print(f"Ollama is ready (attempt {attempt}/{max_retries})", flush=True)
+                return
 
-        except requests.RequestException as e:
-            print(f"Attempt {attempt}/{max_retries}: Waiting for Ollama... ({type(e).__name__})", flush=True)
-            time.sleep(retry_delay)
+            except requests.RequestException as e:
+                print(f"Attempt {attempt}/{max_retries}: Waiting for Ollama... ({type(e).__name__})", flush=True)
+                time.sleep(retry_delay)
 
     raise TimeoutError("Ollama did not become available in time")
 
@@ -61,5 +128,614 @@ def stop_ollama(process):
         process.wait()
         print("Ollama process killed.", flush=True)
 
+"""
+Parse a time range such as 08:00-19:00.
+@param text: time range, empty for none
+@return: tuple of the start and end minutes of the day, or None
+"""
+def parse_hours(text):
+    if not text.strip():
+        return None
+
+    start, end = (int(hours) * 60 + int(minutes)
+                  for hours, minutes in (part.strip().split(':') for part in text.split('-')))
+    if end <= start:
+        raise ValueError(f"Invalid business hours: {text}")
+    return start, end
+
+"""
+Parse a list of ISO weekdays such as 1-5 or 1,3,5.
+@param text: list of days and ranges of days
+@return: set of ISO weekdays
+"""
+def parse_days(text):
+    days = set()
+    for part in text.split(','):
+        first, _, last = part.strip().partition('-')
+        days.update(range(int(first), int(last or first) + 1))
+    return days
+
+BUSINESS_HOURS = parse_hours(OLLAMA_BUSINESS_HOURS)
+BUSINESS_DAYS = parse_days(OLLAMA_BUSINESS_DAYS)
+
+"""
+Seconds left until the end of the business hours.
+@param now: datetime to check, default now
+@return: seconds, 0 outside business hours or when no business hours are set
+"""
+def business_seconds_left(now=None):
+    if BUSINESS_HOURS is None:
+        return 0
+
+    now = now or datetime.datetime.now()
+    if now.isoweekday() not in BUSINESS_DAYS:
+        return 0
+
+    start, end = BUSINESS_HOURS
+    minutes = now.hour * 60 + now.minute + now.second / 60
+    if not start <= minutes < end:
+        return 0
+    return int((end - minutes) * 60)
+
+"""
+Choose how long Ollama keeps the model loaded after a request: until the end of the business hours,
+OLLAMA_KEEP_ALIVE seconds outside them.
+@return: keep_alive in seconds
+"""
+def current_keep_alive():
+    return max(OLLAMA_KEEP_ALIVE, business_seconds_left())
+
+"""
+Choose the context size of a request: the smallest of OLLAMA_NUM_CTX fitting the prompt and the answer.
+@param prompt: complete prompt
+@return: num_ctx
+"""
+def choose_num_ctx(prompt):
+    needed = estimate_tokens(prompt) + NUM_CTX_ANSWER_TOKENS
+    for size in OLLAMA_NUM_CTX:
+        if needed <= size:
+            return size
+    return OLLAMA_NUM_CTX[-1]
+
+"""
+Take an exclusive lock on a file without waiting. The lock is released when the file is closed,
+including when the process dies, so another process can take over.
+@param path: path of the lock file
+@return: open lock file, or None if another process holds the lock
+"""
+def acquire_host_lock(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock_file = open(path, 'a+')
+
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+
+    return lock_file
+
+"""
+Check whether a process is running. Always False on Windows, where os.kill would terminate the process.
+@param pid: process ID, None for none
+@return: True if the process exists
+"""
+def pid_alive(pid):
+    if not pid or os.name == 'nt':
+        return False
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+"""
+Terminate a process that is not a child of this one, such as an Ollama started by another process of the host.
+@param pid: process ID
+@param timeout: seconds to wait before killing it
+@return: None
+"""
+def stop_pid(pid, timeout=10):
+    if not pid_alive(pid):
+        return
+
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    while pid_alive(pid):
+        if time.monotonic() > deadline:
+            os.kill(pid, signal.SIGKILL)
+            break
+        time.sleep(0.1)
+    print(f"Ollama process {pid} terminated.", flush=True)
+
+"""
+Read the ID of the Ollama process recorded in the host lock file.
+@param lock_file: open lock file
+@return: process ID or None
+"""
+def read_lock_pid(lock_file):
+    lock_file.seek(0)
+    content = lock_file.read().strip()
+    return int(content) if content.isdigit() else None
+
+"""
+Record the ID of the Ollama process in the host lock file, so that the next supervisor can adopt it.
+@param lock_file: open lock file
+@param pid: process ID, None to clear it
+@return: None
+"""
+def write_lock_pid(lock_file, pid):
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(pid) if pid else '')
+    lock_file.flush()
 
-     
\ No newline at end of file
+"""
+Check whether another application process of the host is running. Every process keeps its own member file
+(lock_path.<pid>) locked while it runs; the files of the processes that are gone are removed.
+@param lock_path: path of the host lock file
+@param own_path: member file of this process, skipped
+@return: True if another process holds its member file
+"""
+def other_members_alive(lock_path, own_path):
+    alive = False
+
+    for path in glob.glob(glob.escape(lock_path) + '.*'):
+        if path == own_path:
+            continue
+        member = acquire_host_lock(path)
+        if member is None:
+            alive = True
+            continue
+        member.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    return alive
+
+"""
+Read the settings of the Ollama supervision from the environment, when the supervision is set up.
+@return: dictionary of OllamaSupervisor arguments
+"""
+def ollama_settings():
+    return {
+        "ollama_path": os.getenv('OLLAMA_PATH'),
+        "healthcheck_url": os.getenv('OLLAMA_TEST') or 'http://localhost:11434/api/tags',
+        "max_retries": int(os.getenv('MAX_RETRIES') or '2'),
+        "retry_delay": float(os.getenv('RETRY_DELAY') or '2.0'),
+        "request_timeout": float(os.getenv('REQUEST_TIMEOUT') or '2.0'),
+        # When no Ollama answers, one app process per host starts `ollama serve` and restarts it if it exits;
+        # 0 only attaches to an Ollama managed elsewhere (service, container)
+        "supervise": os.getenv('OLLAMA_SUPERVISE', '1') == '1',
+        # Seconds between the health checks of Ollama
+        "check_interval": float(os.getenv('OLLAMA_CHECK_INTERVAL', '10')),
+        # The model is loaded in the background as soon as Ollama answers, 0 loads it with the first request
+        "warmup": os.getenv('OLLAMA_WARMUP', '1') == '1',
+        # Lock file electing the process that supervises Ollama among the processes of the host
+        "lock_path": os.path.join(BASE_DIR, '..', os.getenv('OLLAMA_LOCK_PATH', 'cache/ollama.lock'))
+    }
+
+"""
+Keeps the application connected to Ollama without blocking the startup. A background thread checks Ollama
+every check_interval seconds: when it answers, the process attaches to it and loads the model,
+again whenever Ollama unloaded it during business hours; when it does not, the process holding the host lock
+starts `ollama serve`, so that several workers on the same host never start several servers.
+The ID of the started Ollama is kept in the lock file: a process exiting while other processes of the host
+run, e.g. a recycled worker, leaves Ollama running for them and the next lock holder adopts it; only the last
+process of the host stops it.
+"""
+class OllamaSupervisor:
+
+    """
+    @param ollama_path: path to the Ollama executable
+    @param healthcheck_url: URL answering when Ollama is ready
+    @param max_retries: health checks while waiting for a started Ollama
+    @param retry_delay: seconds between those health checks
+    @param request_timeout: timeout of a health check in seconds
+    @param supervise: False to only attach to an Ollama started elsewhere
+    @param check_interval: seconds between the health checks
+    @param warmup: True to load the model as soon as Ollama answers
+    @param lock_path: path of the lock file electing the supervising process
+    """
+    def __init__(self, ollama_path, healthcheck_url, max_retries, retry_delay, request_timeout,
+                 supervise=True, check_interval=10, warmup=True, lock_path=None):
+        self.ollama_path = ollama_path
+        self.healthcheck_url = healthcheck_url
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.request_timeout = request_timeout
+        self.supervise = supervise and bool(ollama_path)
+        self.check_interval = check_interval
+        self.warmup = warmup
+        self.lock_path = lock_path or ollama_settings()["lock_path"]
+
+        self.process = None
+        self.ready = False
+        self.model_ready = not warmup
+        self.error = None
+        self._lock_file = None
+        self._member_path = f"{self.lock_path}.{os.getpid()}"
+        self._member_file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    """
+    Start the background thread.
+    @return: None
+    """
+    def start(self):
+        if self.supervise:
+            self._member_file = acquire_host_lock(self._member_path)
+        self._thread = threading.Thread(target=self._run, name="ollama_supervisor", daemon=True)
+        self._thread.start()
+
+    """
+    Stop the background thread. The last process of the host also stops the Ollama started by the supervisors;
+    otherwise Ollama keeps running for the other processes and the host lock is released for them.
+    @return: None
+    """
+    def stop(self):
+        self._stop.set()
+        last = False
+
+        if self._member_file is not None:
+            self._member_file.close()
+            self._member_file = None
+            try:
+                os.remove(self._member_path)
+            except OSError:
+                pass
+            last = not other_members_alive(self.lock_path, self._member_path)
+
+        if last:
+            if self._lock_file is None:
+                self._lock_file = acquire_host_lock(self.lock_path)
+            if self._lock_file is not None:
+                if self.process is not None:
+                    stop_ollama(self.process)
+                else:
+                    stop_pid(read_lock_pid(self._lock_file))
+                write_lock_pid(self._lock_file, None)
+        elif self.process is not None and self.process.poll() is None:
+            print(f"Leaving Ollama (pid {self.process.pid}) running for the other processes of the host", flush=True)
+
+        self.process = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    """
+    Describe the connection to Ollama.
+    @return: dictionary with ready, model_ready, role (supervisor if this process holds the host lock) and error
+    """
+    def status(self):
+        return {
+            'ready': self.ready,
+            'model_ready': self.model_ready,
+            'role': 'supervisor' if self._lock_file is not None else 'attached',
+            'error': self.error
+        }
+
+    """
+    Check Ollama until the supervisor is stopped.
+    @return: None
+    """
+    def _run(self):
+        with requests.Session() as session:
+            while not self._stop.is_set():
+                self.ready = self._healthy(session)
+
+                if self.ready:
+                    self.error = None
+                    if self.warmup and (not self.model_ready or (business_seconds_left() and not self._model_loaded())):
+                        self._warm_up()
+                elif self.supervise and self._can_start():
+                    try:
+                        # kept before waiting, so that stop() terminates an Ollama still starting
+                        self.process = spawn_ollama(self.ollama_path)
+                        write_lock_pid(self._lock_file, self.process.pid)
+                        wait_for_ollama(self.process, self.healthcheck_url, self.max_retries,
+                                        self.retry_delay, self.request_timeout)
+                        continue
+                    except (OSError, RuntimeError, TimeoutError) as e:
+                        self.error = f"{type(e).__name__}: {e}"
+                        print(f"Could not start Ollama: {self.error}", flush=True)
+                        # an Ollama that did not answer in time is stopped before the next attempt starts another
+                        stop_ollama(self.process)
+                        self.process = None
+                        write_lock_pid(self._lock_file, None)
+
+                if not self.ready and self.warmup:
+                    # a restarted Ollama has no model loaded
+                    self.model_ready = False
+
+                self._stop.wait(self.check_interval)
+
+    """
+    @param session: requests session of the health checks
+    @return: True if Ollama answers the health check
+    """
+    def _healthy(self, session):
+        try:
+            session.get(self.healthcheck_url, timeout=self.request_timeout).raise_for_status()
+            return True
+        except requests.RequestException as e:
+            self.error = f"Ollama unreachable ({type(e).__name__})"
+            return False
+
+    """
+    Check whether this process should start Ollama: it holds the host lock and has no Ollama process starting.
+    An Ollama left by the previous lock holder that does not answer is stopped first.
+    @return: True if Ollama should be started
+    """
+    def _can_start(self):
+        if self.process is not None and self.process.poll() is None:
+            # started but not answering yet
+            return False
+
+        if self._lock_file is None:
+            self._lock_file = acquire_host_lock(self.lock_path)
+            if self._lock_file is None:
+                return False
+            print(f"Process {os.getpid()} supervises Ollama", flush=True)
+
+        if self.process is not None:
+            print(f"Ollama exited with code {self.process.returncode}, restarting it", flush=True)
+        else:
+            adopted_pid = read_lock_pid(self._lock_file)
+            if pid_alive(adopted_pid):
+                print(f"Ollama {adopted_pid} started by another process does not answer, restarting it", flush=True)
+                stop_pid(adopted_pid)
+        return True
+
+    """
+    @return: True if the model is loaded on every server
+    """
+    def _model_loaded(self):
+        try:
+            return get_llm_client().is_loaded(OLLAMA_MODEL)
+        except (requests.RequestException, ValueError):
+            return False
+
+    """
+    Load the model on every server so that the first manual does not wait for it, with the smallest
+    context size, which most requests use.
+    @return: None
+    """
+    def _warm_up(self):
+        start_time = time.perf_counter()
+        try:
+            get_llm_client().warm_up(OLLAMA_MODEL, {"num_ctx": OLLAMA_NUM_CTX[0]}, current_keep_alive())
+            self.model_ready = True
+            print(f"Model {OLLAMA_MODEL} loaded in {time.perf_counter() - start_time:.1f}s", flush=True)
+        except (requests.RequestException, ValueError) as e:
+            self.error = f"Warm-up failed ({type(e).__name__})"
+
+"""
+Client for one or more Ollama servers. All the requests share a pooled HTTP session with keep-alive
+and retries with exponential backoff; at most num_parallel requests are sent to each server at the
+same time, further requests wait for a free slot (backpressure). Every request goes to the available
+server with the fewest requests in flight.
+"""
+class OllamaClient:
+
+    """
+    @param generate_urls: list of generate endpoints, e.g. http://localhost:11434/api/generate
+    @param num_parallel: maximum requests in flight per server
+    @param max_retries: retries of a request failing to connect or answered with 429/502/503/504
+    @param backoff: backoff factor in seconds between retries (backoff, 2*backoff, 4*backoff, ...)
+    @param timeout: read timeout of a request in seconds
+    """
+    def __init__(self, generate_urls, num_parallel=OLLAMA_NUM_PARALLEL, max_retries=LLM_MAX_RETRIES,
+                 backoff=LLM_RETRY_BACKOFF, timeout=LLM_TIMEOUT):
+        if not generate_urls:
+            raise ValueError("No Ollama endpoint configured")
+
+        self.endpoints = []
+        for url in generate_urls:
+            parts = urlsplit(url)
+            self.endpoints.append({
+                "generate_url": url,
+                "base_url": f"{parts.scheme}://{parts.netloc}",
+                "in_flight": 0,
+                "served": 0,
+                "down_until": 0.0
+            })
+
+        self.num_parallel = num_parallel
+        self.timeout = timeout
+        self._slots = threading.Condition()
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            # a generation that timed out would most likely time out again
+            read=0,
+            backoff_factor=backoff,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=None,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=num_parallel * 2, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    """
+    Wait for a free slot and reserve it on the least loaded available server.
+    @param exclude: endpoints not to use
+    @param endpoints: endpoints to choose from, all of them by default
+    @return: reserved endpoint
+    """
+    def _acquire(self, exclude=(), endpoints=None):
+        with self._slots:
+            while True:
+                now = time.monotonic()
+                candidates = [e for e in endpoints or self.endpoints if e not in exclude and e["in_flight"] < self.num_parallel]
+                up = [e for e in candidates if e["down_until"] <= now]
+                # when every free server is cooling down, try them anyway rather than failing
+                candidates = up or candidates
+                if candidates:
+                    endpoint = min(candidates, key=lambda e: (e["in_flight"], e["served"]))
+                    endpoint["in_flight"] += 1
+                    endpoint["served"] += 1
+                    return endpoint
+                self._slots.wait()
+
+    """
+    Release a slot reserved by _acquire.
+    @param endpoint: reserved endpoint
+    @return: None
+    """
+    def _release(self, endpoint):
+        with self._slots:
+            endpoint["in_flight"] -= 1
+            self._slots.notify_all()
+
+    """
+    Run a generate request, moving to another server if one cannot be reached before the first token.
+    @param payload: JSON body of the Ollama generate API
+    @param on_token: optional callback on_token(text); when given, the completion is streamed
+    @return: Ollama response; when streamed, the last chunk with the whole text in "response"
+    """
+    def generate(self, payload, on_token=None):
+        payload = dict(payload, stream=on_token is not None)
+        tried = []
+        streamed = False
+
+        def forward(text):
+            nonlocal streamed
+            streamed = True
+            on_token(text)
+
+        while True:
+            endpoint = self._acquire(exclude=tried)
+            try:
+                return self._generate(endpoint, payload, forward if on_token else None)
+            except requests.ConnectionError:
+                endpoint["down_until"] = time.monotonic() + LLM_ENDPOINT_COOLDOWN
+                tried.append(endpoint)
+                print(f"Ollama endpoint {endpoint['base_url']} unreachable", flush=True)
+                # the text already passed to on_token cannot be taken back, another server would repeat it
+                if streamed or len(tried) == len(self.endpoints):
+                    raise
+            finally:
+                self._release(endpoint)
+
+    """
+    Load a model on every server: a generate request without prompt only loads the model.
+    Each request takes a slot of its server like the generate requests.
+    @param model: name of the model
+    @param options: model options; a model loaded with another num_ctx is loaded again by the first request
+    @param keep_alive: seconds the model stays loaded
+    @return: None
+    """
+    def warm_up(self, model, options=None, keep_alive=None):
+        payload = {"model": model, "stream": False, "options": options or {}}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+
+        for endpoint in self.endpoints:
+            self._acquire(endpoints=[endpoint])
+            try:
+                r = self.session.post(endpoint["generate_url"], json=payload, timeout=self.timeout)
+                r.raise_for_status()
+            finally:
+                self._release(endpoint)
+
+    """
+    Check whether a model is loaded on every server. Each request takes a slot of its server.
+    @param model: name of the model
+    @return: True if every server lists the model among its running models
+    """
+    def is_loaded(self, model):
+        for endpoint in self.endpoints:
+            self._acquire(endpoints=[endpoint])
+            try:
+                r = self.session.get(f"{endpoint['base_url']}/api/ps", timeout=self.timeout)
+                r.raise_for_status()
+                models = r.json().get("models", [])
+            finally:
+                self._release(endpoint)
+            if not any(model in (loaded.get("name"), loaded.get("model")) for loaded in models):
+                return False
+        return True
+
+    """
+    Send a generate request to a server.
+    @param endpoint: reserved endpoint
+    @param payload: JSON body of the Ollama generate API
+    @param on_token: optional callback on_token(text) for streamed requests
+    @return: Ollama response
+    """
+    def _generate(self, endpoint, payload, on_token):
+        if on_token is None:
+            r = self.session.post(endpoint["generate_url"], json=payload, timeout=self.timeout)
+            r.raise_for_status()
+            return r.json()
+
+        pieces = []
+        last = {}
+        with self.session.post(endpoint["generate_url"], json=payload, timeout=self.timeout, stream=True) as r:
+            r.raise_for_status()
+            # Ollama streams one JSON object per line, the last one has "done": true
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                last = json.loads(line)
+                piece = last.get("response", "")
+                if piece:
+                    pieces.append(piece)
+                    on_token(piece)
+                if last.get("done"):
+                    break
+
+        return dict(last, response="".join(pieces))
+
+_client = None
+_client_lock = threading.Lock()
+
+"""
+Get the Ollama client shared by the whole process, created on first use from the environment.
+@return: OllamaClient instance
+"""
+def get_llm_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            urls = [url.strip() for url in OLLAMA_URLS.split(',') if url.strip()]
+            _client = OllamaClient(urls)
+        return _client
+
+_supervisor = None
+
+"""
+Start the supervision of Ollama in the background with the settings of the environment, see OllamaSupervisor.
+@param overrides: OllamaSupervisor arguments replacing those of ollama_settings
+@return: OllamaSupervisor instance
+"""
+def supervise_ollama(**overrides):
+    global _supervisor
+    _supervisor = OllamaSupervisor(**dict(ollama_settings(), **overrides))
+    _supervisor.start()
+    return _supervisor
+
+"""
+Describe the connection to Ollama, see OllamaSupervisor.status.
+@return: dictionary with ready, model_ready, role and error
+"""
+def ollama_status():
+    if _supervisor is None:
+        return {'ready': False, 'model_ready': False, 'role': None, 'error': 'Ollama supervision not started'}
+    return _supervisor.status()
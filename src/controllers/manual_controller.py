@@ -1,41 +1,94 @@
 import os
-import requests
-from flask import render_template
-import json
-import re
 import datetime
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from .cache_controller import PersistentCache, make_key
+from .chunk_controller import split_subtitles, group_texts, truncate_text
+from .llm_controller import get_llm_client, choose_num_ctx, current_keep_alive, OLLAMA_NUM_CTX
+from .manual_store_controller import manual_store
+from .compress_controller import compress_subtitles, COMPRESSION_SETTINGS
+from .metrics_controller import span, record_llm_response
 
 load_dotenv()
 
-OLLAMA_URL = os.getenv('OLLAMA_URL')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL')
 PROMPT_TEMPLATE_MANUAL_PATH = os.getenv('PROMPT_MANUAL')
+# Number of videos summarized at the same time, keep it in line with OLLAMA_NUM_PARALLEL
+LLM_WORKERS = int(os.getenv('LLM_WORKERS', '2'))
+# Generated manuals are reused for MANUAL_CACHE_TTL seconds, 0 disables the cache
+MANUAL_CACHE_TTL = float(os.getenv('MANUAL_CACHE_TTL', '2592000'))
+MANUAL_CACHE_MAX_ENTRIES = int(os.getenv('MANUAL_CACHE_MAX_ENTRIES', '5000'))
 
+# num_ctx is chosen for each request among OLLAMA_NUM_CTX
+GENERATION_OPTIONS = {
+    "temperature": 0.2
+}
+GENERATION_STOP = ["```", "\n```", "\n\n\n"]
 
-if not PROMPT_TEMPLATE_MANUAL_PATH:
-    raise ValueError("Prompt template path not set in environment variables")
+# Transcripts longer than CHUNK_TOKEN_BUDGET estimated tokens are summarized in chunks and then merged,
+# so that nothing is truncated by num_ctx
+CHUNK_TOKEN_BUDGET = int(os.getenv('CHUNK_TOKEN_BUDGET', '2048'))
+CHUNK_WORKERS = int(os.getenv('CHUNK_WORKERS', str(LLM_WORKERS)))
+# The manuals of a search are also merged into a single consolidated manual, 0 disables it
+CONSOLIDATED_MANUAL = os.getenv('CONSOLIDATED_MANUAL', '0') == '1'
 
-try:
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    FULL_PROMPT_PATH = os.path.join(BASE_DIR, '..', PROMPT_TEMPLATE_MANUAL_PATH) 
+manual_cache = PersistentCache('manuals', ttl=MANUAL_CACHE_TTL, max_entries=MANUAL_CACHE_MAX_ENTRIES)
+chunk_cache = PersistentCache('manual_chunks', ttl=MANUAL_CACHE_TTL, max_entries=MANUAL_CACHE_MAX_ENTRIES)
 
-    with open(FULL_PROMPT_PATH, 'r', encoding='utf-8') as f:
-        FILTER_PROMPT_TEMPLATE = f.read().strip()
-    
-except FileNotFoundError:
-    raise FileNotFoundError(f"Error: Could not find file at path.")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+"""
+Read a prompt template.
+@param relative_path: path of the template, relative to the src folder.
+@return: Content of the template.
+"""
+def load_prompt_template(relative_path):
+    if not relative_path:
+        raise ValueError("Prompt template path not set in environment variables")
+
+    try:
+        with open(os.path.join(BASE_DIR, '..', relative_path), 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Error: Could not find file at path.")
+
+_prompts = None
+_prompts_lock = threading.Lock()
+
+"""
+Get the prompt templates, read on first use so that importing the controller does not touch the disk.
+@return: Dictionary with the manual, chunk, merge and consolidate templates and the hash of those summarizing
+a video, part of the cache keys.
+"""
+def get_prompts():
+    global _prompts
+    with _prompts_lock:
+        if _prompts is None:
+            manual = load_prompt_template(PROMPT_TEMPLATE_MANUAL_PATH)
+            chunk = load_prompt_template(os.getenv('PROMPT_MANUAL_CHUNK', 'utils/prompt_manual_chunk.txt'))
+            merge = load_prompt_template(os.getenv('PROMPT_MANUAL_MERGE', 'utils/prompt_manual_merge.txt'))
+            consolidate = load_prompt_template(os.getenv('PROMPT_MANUAL_CONSOLIDATE', 'utils/prompt_manual_consolidate.txt'))
+            _prompts = {
+                "manual": manual,
+                "chunk": chunk,
+                "merge": merge,
+                "consolidate": consolidate,
+                "hash": make_key(manual, chunk, merge, CHUNK_TOKEN_BUDGET, COMPRESSION_SETTINGS)
+            }
+        return _prompts
 
 """
 Generate device manual using LLM based on subtitles data.
 @param data: List of videos with subtitles data.
 @param device_name: Name of the device for which manual is generated.
-@return: Filename of the saved manual JSON or "error" in case of failure.
+@param on_token: Optional callback on_token(text) receiving the manual text while it is generated.
+@return: ID of the saved manual or "error" in case of failure.
 """
-def report_llm(data, device_name):
+def report_llm(data, device_name, on_token=None):
 
 
-    all_subs = []
     video_channels = []
     video_urls = []
 
@@ -45,45 +98,36 @@ def report_llm(data, device_name):
         video_channels.append(video["channel"])
     if "url" in video and video["url"] not in video_urls:
         video_urls.append(video["url"])
+    # near-duplicate videos summarized through this one
+    for source in video.get("duplicate_sources", []):
+        if source.get("channel") and source["channel"] not in video_channels:
+            video_channels.append(source["channel"])
+        if source.get("url") and source["url"] not in video_urls:
+            video_urls.append(source["url"])
         
-    for sub in video.get("subtitles_data", []):
-        all_subs.append(sub["s"])
-
-    subtitles_text = "\n".join(all_subs)
- 
-
-    prompt = f"""{FILTER_PROMPT_TEMPLATE} {subtitles_text}"""
-
-
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "num_ctx": 4096,
-            "temperature": 0.2
-        }, "stop": ["```", "\n```", "\n\n\n"] }
-
     try:
-        r = requests.post(OLLAMA_URL, json=payload, timeout=1200)
-        r.raise_for_status()
-        response = r.json() 
-        manual_text = response.get("response", "")
+        cache_key = manual_cache_key(video)
+        cached = get_cached_manual(cache_key)
 
-        if not manual_text:
-            return "error", None
+        if cached:
+            manual_text = cached["manual_text"]
+            print(f"Manual cache hit for {video['video_id']} {manual_cache.stats()}", flush=True)
+            if on_token:
+                on_token(manual_text)
+        else:
+            with span("compress"):
+                subtitles_data, compression = compress_subtitles(video.get("subtitles_data", []))
+            print(f"Transcript of {video.get('video_id')}: {compression['tokens_before']} -> "
+                  f"{compression['tokens_after']} tokens ({compression['ratio']:.0%})", flush=True)
 
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        manuals_dir = os.path.join(base_dir, '..', 'video_reports')
+            manual_text = summarize_subtitles(subtitles_data, on_token=on_token)
 
-        if not os.path.exists(manuals_dir):
-            os.makedirs(manuals_dir)
+            if not manual_text:
+                return "error", None
 
-        timestamp = datetime.datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
-        safe_device_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', device_name.lower())
+            cached = {"manual_text": manual_text, "manual_ids": {}}
 
-        file_name = f"{safe_device_name}_{timestamp}.json"
-        file_path = os.path.join(manuals_dir, file_name)
+        timestamp = datetime.datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
 
         print(video["title"])
         print(manual_text)
@@ -91,6 +135,7 @@ def report_llm(data, device_name):
         manual_json = {
             "title": video["title"],
             "device": device_name,
+            "video_id": video.get("video_id"),
             "manual_text": manual_text,
             "timestamp": timestamp,
             "channels": video_channels,
@@ -99,15 +144,254 @@ def report_llm(data, device_name):
             "like_score": video["like_score"]  # per evitare di riscaricare i video al cambiamento dei pesi
         }
 
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(manual_json, f, ensure_ascii=False, indent=4)
-
-        return file_name
+        return save_manual(cache_key, cached, manual_json)
 
     except Exception:
         return "error", None
 
-    
 
-    
+"""
+Summarize the subtitles of a video. A transcript fitting CHUNK_TOKEN_BUDGET is summarized with a single call,
+a longer one is split on cue timestamps into chunks summarized in parallel (map) whose notes are then merged (reduce).
+@param subtitles_data: List of subtitles lines of the video.
+@param on_token: Optional callback on_token(text) receiving the text of the final call while it is generated.
+@return: Text of the manual, empty if the LLM returned nothing.
+"""
+def summarize_subtitles(subtitles_data, on_token=None):
+    chunks = split_subtitles(subtitles_data, CHUNK_TOKEN_BUDGET)
+
+    if len(chunks) <= 1:
+        subtitles_text = "\n".join(sub["s"] for sub in subtitles_data)
+        return generate(f"""{get_prompts()['manual']} {subtitles_text}""", on_token=on_token)
+
+    workers = max(1, min(CHUNK_WORKERS, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="manual_chunk") as executor:
+        notes = list(executor.map(summarize_chunk, chunks))
+
+    print(f"Summarized {len(chunks)} chunks of {CHUNK_TOKEN_BUDGET} tokens", flush=True)
 
+    return reduce_notes(notes, on_token=on_token)
+
+"""
+Merge the notes of the chunks of a transcript, see reduce_texts.
+@param notes: List of notes, in order.
+@param on_token: Optional callback on_token(text) receiving the text of the final call while it is generated.
+@return: Merged text.
+"""
+def reduce_notes(notes, on_token=None):
+    return reduce_texts(notes, merge_notes, on_token=on_token)
+
+"""
+Merge groups of texts until they fit a single prompt, then merge them into one text. Every prompt stays within
+CHUNK_TOKEN_BUDGET: a text over the budget is cut, and when no two texts fit together they are cut to half
+the budget, so that every round at least halves their number.
+@param texts: List of texts, in order.
+@param merge: Function merge(texts, on_token=None) merging a group of texts with the LLM.
+@param on_token: Optional callback on_token(text) receiving the text of the final call while it is generated.
+@return: Merged text.
+"""
+def reduce_texts(texts, merge, on_token=None):
+    texts = [truncate_text(text, CHUNK_TOKEN_BUDGET) for text in texts]
+
+    while len(texts) > 1:
+        groups = group_texts(texts, CHUNK_TOKEN_BUDGET)
+        if len(groups) == len(texts):
+            print(f"Cutting {len(texts)} texts to fit {CHUNK_TOKEN_BUDGET} tokens by pairs", flush=True)
+            # group_texts counts 2 tokens per text for the separator
+            texts = [truncate_text(text, CHUNK_TOKEN_BUDGET // 2 - 2) for text in texts]
+            groups = group_texts(texts, CHUNK_TOKEN_BUDGET)
+            if len(groups) == len(texts):
+                break
+        if len(groups) == 1:
+            break
+        texts = [truncate_text(merge(group), CHUNK_TOKEN_BUDGET) for group in groups]
+
+    return merge(texts, on_token=on_token)
+
+"""
+Merge the notes of consecutive chunks into a single summary.
+@param notes: List of notes, in transcript order.
+@param on_token: Optional callback on_token(text) receiving the summary while it is generated.
+@return: Merged summary.
+"""
+def merge_notes(notes, on_token=None):
+    notes_text = "\n".join(notes)
+    return generate(f"""{get_prompts()['merge']} {notes_text}""", on_token=on_token)
+
+"""
+Merge the manuals of different videos into one manual, see reduce_texts.
+@param manual_texts: List of manual texts, in search rank order.
+@return: Consolidated manual text.
+"""
+def reduce_manuals(manual_texts):
+    return reduce_texts(manual_texts, consolidate_manuals)
+
+"""
+Merge independent manuals of the same device into a single manual keeping the unique steps of each one.
+@param manual_texts: List of manual texts.
+@param on_token: Optional callback on_token(text) receiving the manual while it is generated.
+@return: Consolidated manual text.
+"""
+def consolidate_manuals(manual_texts, on_token=None):
+    manuals_text = "\n\n".join(manual_texts)
+    return generate(f"""{get_prompts()['consolidate']} {manuals_text}""", on_token=on_token)
+
+"""
+Summarize one chunk of subtitles into notes, reusing the cached notes of an identical chunk.
+@param chunk: List of subtitles lines.
+@return: Notes of the chunk.
+"""
+def summarize_chunk(chunk):
+    chunk_text = "\n".join(sub["s"] for sub in chunk)
+    chunk_prompt = get_prompts()['chunk']
+    cache_key = None
+
+    if MANUAL_CACHE_TTL > 0:
+        cache_key = make_key("chunk", chunk_text, chunk_prompt, OLLAMA_MODEL, GENERATION_OPTIONS, OLLAMA_NUM_CTX, GENERATION_STOP)
+        notes = chunk_cache.get(cache_key)
+        if notes:
+            return notes
+
+    notes = generate(f"""{chunk_prompt} {chunk_text}""")
+
+    if notes and cache_key:
+        chunk_cache.set(cache_key, notes)
+    return notes
+
+"""
+Send a prompt to Ollama. With on_token the completion is streamed and every new piece of text
+is passed to the callback as soon as Ollama produces it.
+@param prompt: Complete prompt.
+@param on_token: Optional callback on_token(text) receiving the generated text piece by piece.
+@return: Generated text.
+"""
+def generate(prompt, on_token=None):
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "options": dict(GENERATION_OPTIONS, num_ctx=choose_num_ctx(prompt)),
+        "keep_alive": current_keep_alive(),
+        "stop": GENERATION_STOP }
+
+    with span("llm_generate"):
+        response = get_llm_client().generate(payload, on_token=on_token)
+
+    record_llm_response(response)
+    return response.get("response", "")
+
+"""
+Build the manual cache key of a video: the same video summarized with the same prompt,
+model and generation options always gives back the cached manual.
+@param video: Video with subtitles data.
+@return: Cache key or None if the cache is disabled or the video has no ID.
+"""
+def manual_cache_key(video):
+    if MANUAL_CACHE_TTL <= 0 or not video.get("video_id"):
+        return None
+    return make_key("manual", video["video_id"], get_prompts()["hash"], OLLAMA_MODEL, GENERATION_OPTIONS, OLLAMA_NUM_CTX, GENERATION_STOP)
+
+"""
+Read a manual cache entry.
+@param cache_key: Manual cache key, None if the cache is disabled.
+@return: Dictionary with manual_text and manual_ids (device -> ID of the stored manual), or None on a miss.
+"""
+def get_cached_manual(cache_key):
+    cached = manual_cache.get(cache_key) if cache_key else None
+    # entries cached before the manual IDs were kept hold only the text
+    if isinstance(cached, str):
+        cached = {"manual_text": cached, "manual_ids": {}}
+    return cached
+
+"""
+Save a manual once per cache entry and device: a manual whose text came from the cache reuses the manual
+stored the first time, so that repeated searches do not pile up identical manuals in the store.
+@param cache_key: Manual cache key, None if the cache is disabled.
+@param cached: Cache entry of the text, see get_cached_manual.
+@param manual_json: Manual to save.
+@return: ID of the manual.
+"""
+def save_manual(cache_key, cached, manual_json):
+    device_key = manual_json["device"].lower()
+    manual_id = cached["manual_ids"].get(device_key)
+
+    # the stored manual may have been deleted since it was cached
+    if manual_id and manual_store.get(manual_id):
+        return manual_id
+
+    manual_id = manual_store.add(manual_json)
+    if cache_key:
+        cached["manual_ids"][device_key] = manual_id
+        manual_cache.set(cache_key, cached)
+    return manual_id
+
+"""
+Generate the manuals of several videos concurrently.
+@param subtitles_data: List of videos with subtitles data.
+@param device_name: Name of the device for which manuals are generated.
+@param on_report: Optional callback on_report(index, report_id) called as soon as each manual is ready.
+@param on_token: Optional callback on_token(index, text) receiving the manual text of each video while it is generated.
+@return: List of report_llm results, in the same order as subtitles_data.
+"""
+def generate_reports(subtitles_data, device_name, on_report=None, on_token=None):
+
+    def timed_report(index, video):
+        start_time = time.perf_counter()
+        video_on_token = (lambda text: on_token(index, text)) if on_token else None
+        with span("manual"):
+            report_id = report_llm(video, device_name, on_token=video_on_token)
+        elapsed = time.perf_counter() - start_time
+        print(f"[{index + 1}/{len(subtitles_data)}] {video.get('video_id')} -> {report_id} in {elapsed:.1f}s", flush=True)
+        if on_report:
+            on_report(index, report_id)
+        return report_id
+
+    start_time = time.perf_counter()
+    workers = max(1, min(LLM_WORKERS, len(subtitles_data)))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report_llm") as executor:
+        # executor.map yields results in submission order, whatever order they complete in
+        report_ids = list(executor.map(timed_report, range(len(subtitles_data)), subtitles_data))
+
+    print(f"Generated {len(report_ids)} manuals for '{device_name}' in {time.perf_counter() - start_time:.1f}s "
+          f"({workers} workers)", flush=True)
+    return report_ids
+
+"""
+Merge the manuals of a search into a single consolidated manual keeping the unique steps of every video.
+The consolidated manual credits all the sources and gets the best scores of its videos, so that it ranks first.
+@param report_ids: IDs of the manuals to merge, in search rank order.
+@param device_name: Name of the device.
+@return: ID of the saved manual or "error" in case of failure.
+"""
+def generate_consolidated_manual(report_ids, device_name):
+    try:
+        manuals = manual_store.get_many(report_ids)
+        manuals = [manuals[report_id] for report_id in report_ids if report_id in manuals]
+        if not manuals:
+            return "error", None
+
+        manual_texts = [manual["manual_text"] for manual in manuals]
+        cache_key = None
+
+        if MANUAL_CACHE_TTL > 0:
+            cache_key = make_key("consolidated", manual_texts, get_prompts()["consolidate"], CHUNK_TOKEN_BUDGET, OLLAMA_MODEL, GENERATION_OPTIONS, OLLAMA_NUM_CTX, GENERATION_STOP)
+        cached = get_cached_manual(cache_key)
+
+        if not cached:
+            manual_text = reduce_manuals(manual_texts)
+            if not manual_text:
+                return "error", None
+            cached = {"manual_text": manual_text, "manual_ids": {}}
+
+        return save_manual(cache_key, cached, {
+            "title": f"{device_name} - consolidated manual",
+            "device": device_name,
+            "manual_text": cached["manual_text"],
+            "channels": list(dict.fromkeys(channel for manual in manuals for channel in manual["channels"])),
+            "urls": list(dict.fromkeys(url for manual in manuals for url in manual["urls"])),
+            "view_score": max(manual["view_score"] for manual in manuals),
+            "like_score": max(manual["like_score"] for manual in manuals)
+        })
+
+    except Exception:
+        return "error", None
@@ -0,0 +1,310 @@
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import secrets
+import datetime
+import threading
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORTS_DIR = os.path.join(BASE_DIR, '..', 'video_reports')
+MANUAL_DB_PATH = os.path.join(BASE_DIR, '..', os.getenv('MANUAL_DB_PATH', 'video_reports/manuals.sqlite'))
+
+TIMESTAMP_FORMAT = "%d-%m-%Y_%H-%M-%S"
+# Name of a manual saved as a JSON file before the store existed
+REPORT_FILE_RE = re.compile(r'[A-Za-z0-9_\-]+\.json')
+
+COLUMNS = ('ID', 'DEVICE', 'VIDEO_ID', 'TITLE', 'MANUAL_TEXT', 'CHANNELS', 'URLS',
+           'VIEW_SCORE', 'LIKE_SCORE', 'TIMESTAMP', 'CREATED_AT')
+SUMMARY_COLUMNS = ('ID', 'DEVICE', 'VIDEO_ID', 'TITLE', 'TIMESTAMP', 'CREATED_AT')
+# Random bytes of a bundle ID, 6 bytes give 8 URL-safe characters
+BUNDLE_ID_BYTES = 6
+
+"""
+Store of the generated manuals, one row per video in a SQLite table indexed by device,
+video ID and creation time, and of the bundles grouping the manuals of each search.
+"""
+class ManualStore:
+
+    """
+    @param path: path of the SQLite database file
+    """
+    def __init__(self, path=MANUAL_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    """
+    Get the SQLite connection of the current thread, creating the table on first use.
+    @return: sqlite3 connection
+    """
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS manuals ("
+                "ID TEXT PRIMARY KEY, DEVICE TEXT NOT NULL, VIDEO_ID TEXT, TITLE TEXT NOT NULL, "
+                "MANUAL_TEXT TEXT NOT NULL, CHANNELS TEXT NOT NULL, URLS TEXT NOT NULL, "
+                "VIEW_SCORE REAL NOT NULL, LIKE_SCORE REAL NOT NULL, TIMESTAMP TEXT NOT NULL, CREATED_AT REAL NOT NULL);"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS manuals_device ON manuals (DEVICE COLLATE NOCASE, CREATED_AT);")
+            conn.execute("CREATE INDEX IF NOT EXISTS manuals_video ON manuals (VIDEO_ID, CREATED_AT);")
+            conn.execute("CREATE INDEX IF NOT EXISTS manuals_created ON manuals (CREATED_AT);")
+            # one bundle per search: the ranked manuals of a device and the weights used to rank them
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bundles ("
+                "ID TEXT PRIMARY KEY, DEVICE TEXT NOT NULL, ITEMS TEXT NOT NULL, "
+                "COEF_VIEW REAL NOT NULL, COEF_LIKE REAL NOT NULL, CREATED_AT REAL NOT NULL);"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS bundles_device ON bundles (DEVICE COLLATE NOCASE, CREATED_AT);")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    """
+    Save a manual.
+    @param manual: dictionary with title, device, manual_text, channels, urls, view_score, like_score
+                   and optionally id, video_id, timestamp and created_at
+    @return: ID of the manual
+    """
+    def add(self, manual):
+        return self.add_many([manual])[0]
+
+    """
+    Save several manuals in a single transaction. Manuals whose ID is already stored are skipped.
+    @param manuals: list of manual dictionaries, see add
+    @return: list of the manual IDs, in the same order
+    """
+    def add_many(self, manuals):
+        rows = [self._to_row(manual) for manual in manuals]
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO manuals ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows
+            )
+        return [row[0] for row in rows]
+
+    """
+    Read several manuals with a single query.
+    @param manual_ids: list of manual IDs
+    @return: dictionary manual ID -> manual, missing IDs are left out
+    """
+    def get_many(self, manual_ids):
+        manual_ids = list(dict.fromkeys(manual_ids))
+        if not manual_ids:
+            return {}
+
+        rows = self._connection().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM manuals WHERE ID IN ({', '.join('?' * len(manual_ids))})",
+            manual_ids
+        ).fetchall()
+        return {row[0]: self._from_row(row) for row in rows}
+
+    """
+    Read a manual.
+    @param manual_id: ID of the manual
+    @return: manual dictionary or None if it does not exist
+    """
+    def get(self, manual_id):
+        return self.get_many([manual_id]).get(manual_id)
+
+    """
+    List the stored manuals, newest first, without their text.
+    @param device: only the manuals of this device (case-insensitive)
+    @param video_id: only the manuals of this video
+    @param limit: maximum number of manuals returned
+    @param offset: number of manuals skipped, for pagination
+    @return: list of dictionaries with id, device, video_id, title, timestamp and created_at
+    """
+    def find(self, device=None, video_id=None, limit=50, offset=0):
+        conditions = []
+        params = []
+
+        if device:
+            conditions.append("DEVICE = ? COLLATE NOCASE")
+            params.append(device)
+        if video_id:
+            conditions.append("VIDEO_ID = ?")
+            params.append(video_id)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connection().execute(
+            f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM manuals {where} ORDER BY CREATED_AT DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [{column.lower(): value for column, value in zip(SUMMARY_COLUMNS, row)} for row in rows]
+
+    """
+    List the most searched devices, from the bundles saved at every search.
+    @param limit: maximum number of devices
+    @param since: only the searches made after this time (seconds since the epoch)
+    @return: list of device names, most searched first
+    """
+    def top_devices(self, limit, since=0):
+        rows = self._connection().execute(
+            "SELECT DEVICE FROM bundles WHERE CREATED_AT >= ? "
+            "GROUP BY DEVICE COLLATE NOCASE ORDER BY COUNT(*) DESC, MAX(CREATED_AT) DESC LIMIT ?",
+            (since, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    """
+    Save the bundle of a search under a new short ID.
+    @param device: name of the device searched
+    @param items: ranked list of {'id', 'view_score', 'like_score', 'score'} dictionaries
+    @param coef_view: weight of the view score used for the ranking
+    @param coef_like: weight of the like score used for the ranking
+    @return: ID of the bundle
+    """
+    def add_bundle(self, device, items, coef_view, coef_like):
+        conn = self._connection()
+        items_json = json.dumps(items, ensure_ascii=False)
+
+        while True:
+            bundle_id = secrets.token_urlsafe(BUNDLE_ID_BYTES)
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT INTO bundles (ID, DEVICE, ITEMS, COEF_VIEW, COEF_LIKE, CREATED_AT) VALUES (?, ?, ?, ?, ?, ?)",
+                        (bundle_id, device, items_json, coef_view, coef_like, time.time())
+                    )
+                return bundle_id
+            except sqlite3.IntegrityError:
+                # the short ID is already taken, draw another one
+                continue
+
+    """
+    Read a bundle.
+    @param bundle_id: ID of the bundle
+    @return: dictionary with id, device, items, coef_view, coef_like and created_at, or None if it does not exist
+    """
+    def get_bundle(self, bundle_id):
+        row = self._connection().execute(
+            "SELECT ID, DEVICE, ITEMS, COEF_VIEW, COEF_LIKE, CREATED_AT FROM bundles WHERE ID = ?", (bundle_id,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            'id': row[0],
+            'device': row[1],
+            'items': json.loads(row[2]),
+            'coef_view': row[3],
+            'coef_like': row[4],
+            'created_at': row[5]
+        }
+
+    """
+    Replace the ranking of a bundle after the weights changed.
+    @param bundle_id: ID of the bundle
+    @param items: ranked list of items
+    @param coef_view: weight of the view score used for the ranking
+    @param coef_like: weight of the like score used for the ranking
+    @return: None
+    """
+    def update_bundle(self, bundle_id, items, coef_view, coef_like):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "UPDATE bundles SET ITEMS = ?, COEF_VIEW = ?, COEF_LIKE = ? WHERE ID = ?",
+                (json.dumps(items, ensure_ascii=False), coef_view, coef_like, bundle_id)
+            )
+
+    """
+    Convert a manual dictionary into a table row, assigning the missing ID and dates.
+    @param manual: manual dictionary
+    @return: tuple of the COLUMNS values
+    """
+    def _to_row(self, manual):
+        created_at = manual.get('created_at') or time.time()
+        timestamp = manual.get('timestamp') or datetime.datetime.fromtimestamp(created_at).strftime(TIMESTAMP_FORMAT)
+
+        return (
+            manual.get('id') or uuid.uuid4().hex,
+            manual['device'],
+            manual.get('video_id'),
+            manual['title'],
+            manual['manual_text'],
+            json.dumps(manual.get('channels', []), ensure_ascii=False),
+            json.dumps(manual.get('urls', []), ensure_ascii=False),
+            manual['view_score'],
+            manual['like_score'],
+            timestamp,
+            created_at
+        )
+
+    """
+    Convert a table row into a manual dictionary with the same fields as the old JSON files.
+    @param row: tuple of the COLUMNS values
+    @return: manual dictionary
+    """
+    def _from_row(self, row):
+        manual = {column.lower(): value for column, value in zip(COLUMNS, row)}
+        manual['channels'] = json.loads(manual['channels'])
+        manual['urls'] = json.loads(manual['urls'])
+        return manual
+
+"""
+Read a manual saved as a JSON file in video_reports/ before the store existed.
+The file name is kept as the manual ID, so the old links keep working.
+@param path: path of the JSON file
+@return: manual dictionary ready for ManualStore.add
+"""
+def read_report_file(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    try:
+        created_at = datetime.datetime.strptime(data["timestamp"], TIMESTAMP_FORMAT).timestamp()
+    except (KeyError, ValueError):
+        created_at = os.path.getmtime(path)
+
+    video_id = None
+    for url in data.get("urls", []):
+        video_id = parse_qs(urlparse(url).query).get("v", [None])[0]
+        if video_id:
+            break
+
+    return {
+        "id": os.path.basename(path),
+        "device": data["device"],
+        "video_id": video_id,
+        "title": data["title"],
+        "manual_text": data["manual_text"],
+        "channels": data.get("channels", []),
+        "urls": data.get("urls", []),
+        "view_score": data.get("view_score", 0),
+        "like_score": data.get("like_score", 0),
+        "timestamp": data.get("timestamp"),
+        "created_at": created_at
+    }
+
+"""
+Import a single old manual file on demand, for links to manuals that were not migrated yet.
+@param manual_id: ID of the manual, i.e. the name of its JSON file
+@return: manual dictionary or None if there is no such file
+"""
+def import_report_file(manual_id):
+    if not REPORT_FILE_RE.fullmatch(manual_id):
+        return None
+
+    path = os.path.join(REPORTS_DIR, manual_id)
+    if not os.path.exists(path):
+        return None
+
+    manual = read_report_file(path)
+    manual_store.add(manual)
+    return manual_store.get(manual_id)
+
+manual_store = ManualStore()
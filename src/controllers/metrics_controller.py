@@ -0,0 +1,159 @@
+import time
+import threading
+from contextlib import contextmanager
+from flask import Response
+
+# Upper bounds of the duration buckets in seconds, from a cache hit to a long generation
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+"""
+Histogram in the Prometheus text format: the count of the observed values below each bucket bound,
+their sum and their count, for every combination of label values.
+"""
+class Histogram:
+
+    """
+    @param name: metric name
+    @param description: help text of the metric
+    @param buckets: increasing upper bounds of the buckets
+    @param label: name of the label distinguishing the series
+    """
+    def __init__(self, name, description, buckets, label):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    """
+    Record a value.
+    @param label_value: value of the label
+    @param value: observed value
+    @return: None
+    """
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    """
+    @return: lines of the histogram in the Prometheus text format
+    """
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                label = f'{self.label}="{label_value}"'
+                for bound, count in zip(self.buckets, series['counts']):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series["count"]}')
+                lines.append(f'{self.name}_sum{{{label}}} {series["sum"]}')
+                lines.append(f'{self.name}_count{{{label}}} {series["count"]}')
+
+        return lines
+
+"""
+Counter in the Prometheus text format, one monotonic total for every label value.
+"""
+class Counter:
+
+    """
+    @param name: metric name, ending in _total
+    @param description: help text of the metric
+    @param label: name of the label distinguishing the series
+    """
+    def __init__(self, name, description, label):
+        self.name = name
+        self.description = description
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    """
+    Increment the total of a label value.
+    @param label_value: value of the label
+    @param amount: increment
+    @return: None
+    """
+    def inc(self, label_value, amount=1):
+        with self._lock:
+            self._series[label_value] = self._series.get(label_value, 0) + amount
+
+    """
+    @return: lines of the counter in the Prometheus text format
+    """
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+
+        with self._lock:
+            for label_value, total in sorted(self._series.items()):
+                lines.append(f'{self.name}{{{self.label}="{label_value}"}} {total}')
+
+        return lines
+
+stage_seconds = Histogram(
+    'manual_stage_seconds', 'Duration of each stage of the manual generation', SECONDS_BUCKETS, 'stage'
+)
+stage_errors = Counter(
+    'manual_stage_errors_total', 'Stages of the manual generation that ended with an exception', 'stage'
+)
+llm_tokens = Histogram(
+    'ollama_tokens', 'Prompt and completion tokens of each Ollama request', TOKEN_BUCKETS, 'kind'
+)
+llm_seconds = Histogram(
+    'ollama_seconds', 'Load, prompt evaluation and generation time reported by Ollama', SECONDS_BUCKETS, 'kind'
+)
+
+METRICS = (stage_seconds, stage_errors, llm_tokens, llm_seconds)
+
+"""
+Time a stage of the manual generation and record its duration in stage_seconds,
+and count it in stage_errors if the stage raises an exception.
+@param stage: name of the stage
+"""
+@contextmanager
+def span(stage):
+    start_time = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage)
+        raise
+    finally:
+        stage_seconds.observe(stage, time.perf_counter() - start_time)
+
+"""
+Record the token counts and durations of an Ollama generate response.
+Ollama reports durations in nanoseconds, and leaves the prompt fields out when the prompt was cached.
+@param response: Ollama response, the last chunk when streamed
+@return: None
+"""
+def record_llm_response(response):
+    for kind, field in (('prompt', 'prompt_eval_count'), ('completion', 'eval_count')):
+        if response.get(field) is not None:
+            llm_tokens.observe(kind, response[field])
+
+    for kind, field in (('load', 'load_duration'), ('prompt_eval', 'prompt_eval_duration'),
+                        ('eval', 'eval_duration'), ('total', 'total_duration')):
+        if response.get(field) is not None:
+            llm_seconds.observe(kind, response[field] / 1e9)
+
+"""
+Expose the metrics of this process in the Prometheus text format.
+@return: text response
+"""
+def metrics_api():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
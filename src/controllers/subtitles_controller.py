@@ -1,12 +1,16 @@
-from yt_dlp import YoutubeDL
 import os
-import json
-import re
 import tempfile
 import sqlite3
+import pathlib
 import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from dotenv import load_dotenv
 from .video_validator_controller import is_valid_video
+from .cache_controller import PersistentCache, SingleFlight, make_key
+from .vtt_controller import iter_cues
+from .metrics_controller import span
 
 
 load_dotenv()
@@ -16,15 +20,60 @@ OLLAMA_URL = os.getenv('OLLAMA_URL')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL')
 COEF_VIEW = float(os.getenv('COEF_VIEW'))
 COEF_LIKE = float(os.getenv('COEF_LIKE'))
+# Parsed subtitles are kept for SUBTITLE_CACHE_TTL seconds, videos without English subtitles for MISSING_SUBTITLES_TTL
+SUBTITLE_CACHE_TTL = float(os.getenv('SUBTITLE_CACHE_TTL', '7776000'))
+SUBTITLE_CACHE_MAX_ENTRIES = int(os.getenv('SUBTITLE_CACHE_MAX_ENTRIES', '20000'))
+MISSING_SUBTITLES_TTL = float(os.getenv('MISSING_SUBTITLES_TTL', '86400'))
+# Subtitles of different videos are downloaded by SUBTITLE_WORKERS threads, each video within SUBTITLE_TIMEOUT seconds
+SUBTITLE_WORKERS = int(os.getenv('SUBTITLE_WORKERS', '4'))
+SUBTITLE_TIMEOUT = float(os.getenv('SUBTITLE_TIMEOUT', '60'))
+# Views and likes are fetched again when older than VIDEO_STATS_TTL seconds
+VIDEO_STATS_TTL = float(os.getenv('VIDEO_STATS_TTL', '86400'))
+# YouTube search results are reused for SEARCH_CACHE_TTL seconds, 0 disables the cache,
+# and for SEARCH_CACHE_STALE more seconds while they are refreshed in the background
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '21600'))
+SEARCH_CACHE_STALE = float(os.getenv('SEARCH_CACHE_STALE', '86400'))
+# Subtitles are loaded, best search results first, until VIDEOS_WANTED videos with English subtitles are found;
+# every one of them gets a manual, so it is also the number of manuals of a search. By default every search
+# result with subtitles gets a manual, a smaller value saves the extraction of the other results
+VIDEOS_WANTED = int(os.getenv('VIDEOS_WANTED') or MAX_SEARCH)
+# Maximum yt-dlp extractions per minute of this process, shared by searches, subtitle downloads and stats;
+# 0 sets no limit
+YTDLP_RATE_LIMIT = float(os.getenv('YTDLP_RATE_LIMIT', '0'))
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, '..', 'devices_database', 'device.sqlite')
 
+subtitle_store = PersistentCache('subtitles', ttl=SUBTITLE_CACHE_TTL or None, max_entries=SUBTITLE_CACHE_MAX_ENTRIES)
+stats_store = PersistentCache('video_stats', max_entries=SUBTITLE_CACHE_MAX_ENTRIES)
+search_store = PersistentCache('video_searches', ttl=SEARCH_CACHE_TTL + SEARCH_CACHE_STALE, max_entries=SUBTITLE_CACHE_MAX_ENTRIES)
+search_flight = SingleFlight()
+
+_device_db = threading.local()
+
 # Keywords to refine YouTube search for relevant videos
 KEYWORDS = [
     "teardown", "disassembly", "repair"
 ]
 
+# Fields of the search results used by the pipeline, the only ones kept in the search cache
+SEARCH_ENTRY_FIELDS = (
+    "id", "title", "description", "uploader", "channel", "duration",
+    "webpage_url", "url", "view_count", "like_count", "timestamp"
+)
+
+"""
+Get the read-only connection to the device database of the current thread, opened on first use
+and then reused by all the lookups of the thread.
+@return: sqlite3 connection
+"""
+def get_device_db():
+    conn = getattr(_device_db, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(f"{pathlib.Path(DB_PATH).resolve().as_uri()}?mode=ro", uri=True)
+        _device_db.conn = conn
+    return conn
+
 """
 Map user research term to device models in the database.
 @param research: user input search term
@@ -35,17 +84,17 @@ def map_device_to_models(research):
     
     models = []
     lower_research = research.strip().lower() 
-    word_count = len(lower_research.split())
+    words = lower_research.split()
 
-    if len(lower_research) < 4 or word_count < 3:
+    if len(lower_research) < 4 or len(words) < 3:
             return []
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        cursor = get_device_db().cursor()
         
+        # served by the devices_device_nocase index
         cursor.execute(
-            "SELECT DISTINCT DEVICE FROM devices WHERE LOWER(DEVICE) = ? LIMIT 5", 
+            "SELECT DEVICE FROM devices WHERE DEVICE = ? COLLATE NOCASE LIMIT 5", 
             (lower_research,) 
         )
         
@@ -56,42 +105,74 @@ def map_device_to_models(research):
             return models
         
 
-        cleaned_research = lower_research.replace(' ', '%')
+        cleaned_research = '%'.join(words)
 
         if len(cleaned_research.replace('%', '')) < 3:
             return []
 
         search_term_like = f'%{cleaned_research}%'
-        
-
-        cursor.execute(
-            "SELECT DISTINCT DEVICE FROM devices WHERE LOWER(DEVICE) LIKE ? LIMIT 5", 
-            (search_term_like,)
-        )
-        
-        results = cursor.fetchall()
-        models = [row[0] for row in results]
+        models = search_devices(cursor, words, search_term_like)
         
     except sqlite3.Error:
         return [research]
-        
-    finally:
-        if conn:
-            conn.close()
 
     if not models:
         return [research]
     
     return models
 
+"""
+Find the devices containing all the words of the research, in order.
+The FTS5 trigram index narrows the candidates to the names containing every word of 3+ characters,
+the LIKE pattern checks the word order and the shorter words, and the candidates are ranked by
+number of words matching whole and then by bm25.
+Without the index (database built by an older create_db.py) it falls back to the LIKE scan.
+@param cursor: cursor on the device database
+@param words: lowercase words of the research
+@param search_term_like: LIKE pattern with the words in order ('%w1%w2%w3%')
+@return: list of up to 5 device names, best match first
+"""
+def search_devices(cursor, words, search_term_like):
+    terms = [word for word in words if len(word) >= 3]
+
+    if terms:
+        match = ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        try:
+            cursor.execute(
+                "SELECT DEVICE FROM devices_fts WHERE devices_fts MATCH ? AND DEVICE LIKE ? ORDER BY rank LIMIT 50",
+                (match, search_term_like)
+            )
+            candidates = [row[0] for row in cursor.fetchall()]
+        except sqlite3.OperationalError:
+            candidates = None
+
+        if candidates is not None:
+            # names where the words appear whole ("x1" in "ThinkPad X1 Carbon", not in "ThinkPad X13") come first
+            def whole_words(name):
+                tokens = set(name.lower().split())
+                return sum(word in tokens for word in words)
+
+            ranked = sorted(enumerate(candidates), key=lambda item: (-whole_words(item[1]), item[0]))
+            return [name for _, name in ranked[:5]]
+
+    cursor.execute(
+        "SELECT DEVICE FROM devices WHERE DEVICE LIKE ? LIMIT 5", 
+        (search_term_like,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
 """
 Fetch subtitles for videos related to the research term.
 @param research: user input search term
+@param progress: optional callback progress(phase, **details) notified when the search and the downloads start
+@param mapped_models: device models of the research, if the caller already mapped them
 @return: status and list of videos with subtitles data
 """
-def get_subtitles(research):
+def get_subtitles(research, progress=None, mapped_models=None):
 
-    mapped_models = map_device_to_models(research)
+    if mapped_models is None:
+        with span("device_lookup"):
+            mapped_models = map_device_to_models(research)
 
     if not mapped_models:
         print('no models')
@@ -101,132 +182,521 @@ def get_subtitles(research):
     models_query_part = ' | '.join(mapped_models)
     print(f"Mapped models for '{research}': {models_query_part}")
 
-    with tempfile.TemporaryDirectory() as tempdir:
+    if progress:
+        progress("searching", query=models_query_part)
 
-        downloader = YoutubeDL({
-            "skip_download": True,
-            "writesubtitles": True,
-            "writeautomaticsub": True,
-            "ignoreerrors": True,
-            "subtitlesformat": "vtt",
-            "subtitleslangs": ["en", "-livechat"],
-            "outtmpl":{
-                'subtitle': f"{tempdir}/%(id)s",
-                'default': f"{tempdir}/%(id)s.mhtml" 
-                }
-        })
+    search_query = ' '.join([models_query_part] + KEYWORDS)
+    with span("search"):
+        entries = search_videos(search_query)
 
-        search_query = ' '.join([models_query_part] + KEYWORDS)
-        data = downloader.extract_info(f"ytsearch{MAX_SEARCH}:{search_query}")
+    chosen_videos = []
 
-        valid_videos = []
-        chosen_videos = []
+    for entry in entries:
+        if not entry:
+            continue
 
-        for entry in data.get('entries', []):
-            if not entry:
-                continue
+        title = entry.get("title", "")
 
-            title = entry.get("title", "")
+        if not is_valid_video(entry):
+            print(f"Skipping invalid video: {title}")
+            continue
+        else:
+            chosen_videos.append(entry)
+        
+    if len(chosen_videos) == 0:
+        print('no chosen')
+        return "error", None
 
-            if not is_valid_video(entry):
-                print(f"Skipping invalid video: {title}")
-                continue
+    
+    llm_context_models = ' | '.join(mapped_models)
+    print("-------------------")
+    print('\n'.join([x['title'] for x in chosen_videos]))
+
+    wanted = min(VIDEOS_WANTED, len(chosen_videos))
+
+    if progress:
+        progress("downloading subtitles", total=wanted)
+
+    valid_videos = []
+    with span("subtitles"):
+        videos = iter_videos(chosen_videos)
+        for video in videos:
+            if video:
+                valid_videos.append(video)
+                if len(valid_videos) >= wanted:
+                    break
+        # the candidates not started yet are never extracted, the downloads in flight are cancelled
+        videos.close()
+    print(f"{len(valid_videos)} videos with subtitles out of {len(chosen_videos)} candidates")
+
+    if valid_videos is None or len(valid_videos) == 0:
+        print('no valid')
+        return "error", None
+
+    return "ok", valid_videos
+
+"""
+Search YouTube for videos with a flat search, which only lists the results (ID, title, duration, views)
+without extracting every video. Results of the same query are reused: fresh results are returned as they are,
+stale ones are returned at once and refreshed in the background, and concurrent searches of the same query
+share a single extraction.
+@param search_query: text searched on YouTube
+@return: list of search results, with only the SEARCH_ENTRY_FIELDS of each video
+"""
+def search_videos(search_query):
+    key = make_key("ytsearch_flat", ' '.join(search_query.lower().split()), MAX_SEARCH)
+
+    if SEARCH_CACHE_TTL > 0:
+        entries, age = search_store.get_with_age(key)
+
+        if entries is not None:
+            if age > SEARCH_CACHE_TTL and not search_flight.in_flight(key):
+                print(f"Search cache stale for '{search_query}', refreshing in the background")
+                threading.Thread(
+                    target=search_flight.do, args=(key, lambda: run_search(key, search_query)), daemon=True
+                ).start()
             else:
-                chosen_videos.append(entry)
-            
-        if len(chosen_videos) == 0:
-            print('no chosen')
-            return "error", None
+                print(f"Search cache hit for '{search_query}' {search_store.stats()}")
+            return entries
 
-        
-        llm_context_models = ' | '.join(mapped_models)
-        print("-------------------")
-        print('\n'.join([x['title'] for x in chosen_videos]))
-
-        for entry in chosen_videos:
-            video_id = entry["id"]
-            title = entry["title"]
-            print(title)
-            print(list(entry.keys()))
-            time_uploaded = datetime.datetime.fromtimestamp(entry['timestamp'])
-            time_since = datetime.datetime.now() - time_uploaded
-            print(time_uploaded, time_since)
-            
-            # Gestisci valori None per evitare errori di divisione
-            view_count = entry.get('view_count') or 0
-            like_count = entry.get('like_count') or 0
-            
-            view_score = view_count / time_since.days if time_since.days > 0 else 0
-            like_score = like_count / view_count if view_count > 0 else 0
-
-
-            entry["view_score"] = view_score
-            entry["like_score"] = like_score
-            url = entry["webpage_url"]
-            description = entry.get("description", "")
-
-            downloader.download([url])
-            
-            channel = entry.get("uploader") or entry.get("channel") or "Unknown"
-            duration = entry.get("duration", 0)
-            views = entry.get("view_count", 0)
-
-            vtt_path = os.path.join(tempdir, f"{video_id}.en.vtt")
-            
+    return search_flight.do(key, lambda: run_search(key, search_query))
+
+"""
+Spaces out calls so that at most rate calls start per minute, across all the threads.
+"""
+class RateLimiter:
+
+    """
+    @param rate: calls per minute, 0 for no limit
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    """
+    Wait for the turn of the calling thread. The time spent waiting is recorded as the ytdlp_wait stage.
+    @return: None
+    """
+    def wait(self):
+        if self.rate <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + 60 / self.rate
+
+        if start_at > now:
+            with span("ytdlp_wait"):
+                time.sleep(start_at - now)
+
+ytdlp_limiter = RateLimiter(YTDLP_RATE_LIMIT)
+
+"""
+Create a YoutubeDL instance. yt-dlp is imported on first use, being the slowest import of the application.
+@param options: dictionary of YoutubeDL options
+@param tasks: optional thread-local whose task attribute is the DownloadTask bounding the HTTP requests
+              the instance sends from the current thread
+@return: YoutubeDL instance
+"""
+def youtube_dl(options, tasks=None):
+    from yt_dlp import YoutubeDL
+    from yt_dlp.networking import Request
+    from yt_dlp.utils import DownloadCancelled
+
+    downloader = YoutubeDL(options)
+    if tasks is None:
+        return downloader
+
+    urlopen = downloader.urlopen
+
+    # extractors and subtitle downloads send all their requests through urlopen
+    def bounded_urlopen(request):
+        task = getattr(tasks, "task", None)
+        if task is not None:
+            remaining = task.remaining()
+            if remaining <= 0:
+                raise DownloadCancelled("Subtitles download abandoned")
+            if isinstance(request, str):
+                request = Request(request)
+            request.extensions["timeout"] = min(request.extensions.get("timeout") or remaining, remaining)
+        return urlopen(request)
+
+    downloader.urlopen = bounded_urlopen
+    return downloader
+
+"""
+Subtitles download of a video, shared by the worker running it and the consumer waiting for it. The deadline
+runs from when a worker picks the video up. Every HTTP request of yt-dlp gets the time left as socket timeout,
+and once the task is cancelled or past its deadline the next request raises DownloadCancelled, so a download
+given up by the consumer stops instead of holding its worker.
+"""
+class DownloadTask:
+
+    """
+    @param timeout: seconds allowed to the download once started
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.started_at = None
+        self._cancelled = threading.Event()
+
+    """
+    Start the deadline.
+    @return: None
+    """
+    def start(self):
+        self.started_at = time.monotonic()
+
+    """
+    Give up the download, its next HTTP request fails.
+    @return: None
+    """
+    def cancel(self):
+        self._cancelled.set()
+
+    """
+    Wait for the turn of a rate limiter without counting the wait against the deadline,
+    which starts again once the turn comes.
+    @param limiter: RateLimiter
+    @return: None
+    """
+    def wait_turn(self, limiter):
+        self.started_at = None
+        limiter.wait()
+        self.start()
+
+    """
+    @return: seconds left before the deadline, 0 once cancelled or expired, the whole timeout until started
+    """
+    def remaining(self):
+        if self._cancelled.is_set():
+            return 0
+        if self.started_at is None:
+            return self.timeout
+        return max(0.0, self.started_at + self.timeout - time.monotonic())
+
+"""
+Run a YouTube search and save its results in the search cache.
+@param key: search cache key of the query
+@param search_query: text searched on YouTube
+@return: list of search results, with only the SEARCH_ENTRY_FIELDS of each video
+"""
+def run_search(key, search_query):
+    options = {"skip_download": True, "ignoreerrors": True, "extract_flat": "in_playlist", "socket_timeout": SUBTITLE_TIMEOUT}
+    # the wait for the rate limit is recorded as ytdlp_wait, not as search time
+    ytdlp_limiter.wait()
+    with span("ytsearch"), youtube_dl(options) as ydl:
+        # videos are extracted later, one by one, only until enough of them have subtitles
+        data = ydl.extract_info(f"ytsearch{MAX_SEARCH}:{search_query}", download=False)
+
+    if not data:
+        return []
+
+    entries = [
+        {field: entry.get(field) for field in SEARCH_ENTRY_FIELDS if entry.get(field) is not None}
+        for entry in data.get('entries', []) if entry
+    ]
+
+    if SEARCH_CACHE_TTL > 0 and entries:
+        search_store.set(key, entries)
+    return entries
+
+"""
+YoutubeDL options used to write the subtitles of the chosen videos into a directory.
+The directory is the home path, so a YoutubeDL instance can be moved to another one by changing params["paths"].
+@param directory: directory where the subtitles are downloaded
+@return: dictionary of YoutubeDL options
+"""
+def downloader_options(directory):
+    return {
+        "skip_download": True,
+        "writesubtitles": True,
+        "writeautomaticsub": True,
+        "ignoreerrors": True,
+        "socket_timeout": SUBTITLE_TIMEOUT,
+        "subtitlesformat": "vtt",
+        "subtitleslangs": ["en", "-livechat"],
+        "paths": {"home": directory},
+        "outtmpl":{
+            'subtitle': "%(id)s",
+            'default': "%(id)s.mhtml"
+            }
+    }
+
+"""
+Load the chosen videos lazily, in search rank order, on a bounded thread pool where each worker has its own
+YoutubeDL instance. Only the next SUBTITLE_WORKERS videos are loaded ahead of the consumer, so closing the
+generator leaves the other videos untouched. A video failing or taking more than SUBTITLE_TIMEOUT seconds
+is skipped like a video without subtitles, and its download stops at its next HTTP request. The downloads
+still running when the generator is closed are cancelled the same way. Every video is downloaded into its
+own temporary directory, created and removed by the worker, so a cancelled download cannot write into
+a directory the consumer already removed. The YoutubeDL instances are closed once the generator is closed
+and the last download in flight has stopped.
+@param chosen_videos: video metadata returned by the YouTube search, in search rank order
+@return: generator of the load_video results (None for skipped videos), in search rank order
+"""
+def iter_videos(chosen_videos):
+    local = threading.local()
+    downloaders = []
+
+    def worker(entry, task):
+        task.start()
+        local.task = task
+        try:
+            with tempfile.TemporaryDirectory(prefix="subtitles_") as directory:
+                if not hasattr(local, "downloader"):
+                    local.downloader = youtube_dl(downloader_options(directory), local)
+                    downloaders.append(local.downloader)
+                local.downloader.params["paths"] = {"home": directory}
+                return load_video(entry, local.downloader, directory, task)
+        finally:
+            local.task = None
+
+    workers = max(1, min(SUBTITLE_WORKERS, len(chosen_videos)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="subtitles")
+    futures = {}
+    submitted_futures = []
+    submitted = 0
+
+    try:
+        for index in range(len(chosen_videos)):
+            while submitted < len(chosen_videos) and submitted < index + workers:
+                task = DownloadTask(SUBTITLE_TIMEOUT)
+                futures[submitted] = (executor.submit(worker, chosen_videos[submitted], task), task)
+                submitted_futures.append(futures[submitted][0])
+                submitted += 1
+
+            future, task = futures.pop(index)
+            video_id = chosen_videos[index]["id"]
             try:
-                with open(vtt_path, 'r', encoding='utf-8') as f:
-                    subtitles = f.readlines()
-            except FileNotFoundError:
-                print(f"Subtitles not found for {video_id}. Skipping.")
-                continue
-
-            subtitles = subtitles[3:]
-            subtitles = [r for r in subtitles if not re.match("^\\s*\n", r)]
-            subtitles = [re.sub("<[^>]*>","",r) for r in subtitles]
-
-            complete = []
-            prev = ''
-            time_str = None
-            for r in subtitles:
-                if r != prev:
-                    if mm := re.match("^([0-9]{2}:[0-9]{2}:[0-9]{2}.[0-9]{3}) --> ([0-9]{2}):([0-9]{2}):([0-9]{2}).([0-9]{3})", r):
-                        time_str = mm.group(1) 
-                    else:
-                        complete.append({
-                            't': time_str if 'time_str' in locals() else None, 
-                            's': r.strip()
-                            })
-                        prev = r
-            
-            results = complete
-
-            print(video_id)
-            valid_videos.append({
-                "video_id": video_id,
-                "title": title,
-                "description": description,
-                "channel": channel,
-                "duration": duration,
-                "views": views,
-                "url": url,
-                "subtitles_data": results, 
-                "copyright_note": f"'{title}' by {channel} on YouTube.",
-                "view_score": entry["view_score"], # view_score e like_score tenuti separati nei dati del video
-                "like_score": entry["like_score"]  # vengono combinati al momento della visualizzazione
-            })
-
-        if valid_videos is None or len(valid_videos) == 0:
-            print('no valid')
-            return "error", None
-            
-        output_dir = "subtitles"
-        os.makedirs(output_dir, exist_ok=True)
-
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_filename = f"{research.replace(' ', '_')}_subtitles_{timestamp}.json"
-        output_path = os.path.join(output_dir, output_filename)
-    
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(valid_videos, f, ensure_ascii=False, indent=2)
+                while True:
+                    try:
+                        result = future.result(timeout=0.5)
+                        break
+                    except FuturesTimeoutError:
+                        # the timeout counts from when a worker picked the video up, not from the submission
+                        if task.remaining() <= 0:
+                            task.cancel()
+                            print(f"Subtitles download timed out for {video_id}. Skipping.")
+                            result = None
+                            break
+            except Exception as e:
+                print(f"Subtitles download failed for {video_id} ({type(e).__name__}: {e}). Skipping.")
+                result = None
+
+            yield result
+    finally:
+        # the downloads in flight stop at their next request and remove their own directory
+        for future, task in futures.values():
+            task.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        close_when_done(submitted_futures, downloaders)
+
+"""
+Close YoutubeDL instances, releasing their HTTP handlers and connections, once some futures are done,
+without waiting for them. A downloader is not closed while a worker may still send requests through it,
+since yt-dlp would open new handlers for them.
+@param futures: futures of the workers using the downloaders
+@param downloaders: list of YoutubeDL instances
+@return: None
+"""
+def close_when_done(futures, downloaders):
+    pending = [future for future in futures if not future.done()]
+    lock = threading.Lock()
+
+    def close_all():
+        for downloader in downloaders:
+            try:
+                downloader.close()
+            except Exception as e:
+                print(f"Closing a subtitles downloader failed ({type(e).__name__}: {e})")
+
+    if not pending:
+        close_all()
+        return
+
+    left = len(pending)
+
+    def on_done(_):
+        nonlocal left
+        with lock:
+            left -= 1
+            last = left == 0
+        if last:
+            close_all()
+
+    for future in pending:
+        future.add_done_callback(on_done)
+
+"""
+Build the data of a chosen video, downloading its subtitles only when they are not in the subtitle store.
+@param entry: video metadata returned by the flat YouTube search
+@param downloader: YoutubeDL instance writing subtitles into directory
+@param directory: directory where the subtitles are downloaded
+@param task: optional DownloadTask of the video; a download cancelled or past its deadline is not stored
+@return: video dictionary with subtitles data, or None if the video has no English subtitles
+"""
+def load_video(entry, downloader, directory, task=None):
+    video_id = entry["id"]
+    url = entry.get("webpage_url") or entry.get("url") or f"https://www.youtube.com/watch?v={video_id}"
+
+    stored, age = subtitle_store.get_with_age(video_id)
+
+    if stored is None or (stored["subtitles_data"] is None and age > MISSING_SUBTITLES_TTL):
+        # the full extraction writes the subtitles and gives the details a flat search result lacks
+        if task is not None:
+            task.wait_turn(ytdlp_limiter)
+        else:
+            ytdlp_limiter.wait()
+        with span("subtitle_download"):
+            info = downloader.extract_info(url, download=True) or {}
+        if task is not None and task.remaining() <= 0:
+            # a request cut by the deadline leaves no subtitles file, which does not mean the video has none
+            print(f"Subtitles download of {video_id} abandoned, not stored")
+            return None
+        entry = {**entry, **{field: info[field] for field in SEARCH_ENTRY_FIELDS if info.get(field) is not None}}
+        stored = {
+            "title": entry["title"],
+            "description": entry.get("description", ""),
+            "channel": entry.get("uploader") or entry.get("channel") or "Unknown",
+            "duration": entry.get("duration", 0),
+            "url": url,
+            "subtitles_data": parse_subtitles(os.path.join(directory, f"{video_id}.en.vtt"))
+        }
+        # videos without English subtitles are remembered too, so they are not downloaded again at every search
+        subtitle_store.set(video_id, stored)
+    else:
+        print(f"Subtitle store hit for {video_id}")
+
+    if stored["subtitles_data"] is None:
+        print(f"Subtitles not found for {video_id}. Skipping.")
+        return None
+
+    stats = get_video_stats(entry)
+    view_score, like_score = video_scores(stats)
+    title = stored["title"]
+    channel = stored["channel"]
+
+    return {
+        "video_id": video_id,
+        "title": title,
+        "description": stored["description"],
+        "channel": channel,
+        "duration": stored["duration"],
+        "views": stats["view_count"],
+        "url": stored["url"],
+        "subtitles_data": stored["subtitles_data"],
+        "copyright_note": f"'{title}' by {channel} on YouTube.",
+        "view_score": view_score, # view_score e like_score tenuti separati nei dati del video
+        "like_score": like_score  # vengono combinati al momento della visualizzazione
+    }
+
+"""
+Parse a downloaded VTT subtitle file.
+@param vtt_path: path of the VTT file
+@return: list of subtitles lines with their start time, or None if the file does not exist
+"""
+def parse_subtitles(vtt_path):
+    try:
+        with span("vtt_parse"):
+            return [{'t': start, 's': text} for start, end, text in iter_cues(vtt_path)]
+    except FileNotFoundError:
+        return None
+
+"""
+Get the view and like counters of a video. Counters returned by the search are saved in the stats store,
+otherwise the stored ones are used until they are older than VIDEO_STATS_TTL and then fetched again.
+@param entry: video metadata returned by the YouTube search
+@return: dictionary with url, view_count, like_count and upload timestamp
+"""
+def get_video_stats(entry):
+    video_id = entry["id"]
+
+    if entry.get("view_count") is not None and entry.get("timestamp") is not None:
+        stats = {
+            "url": entry.get("webpage_url") or entry.get("url"),
+            "view_count": entry.get("view_count") or 0,
+            "like_count": entry.get("like_count") or 0,
+            "timestamp": entry["timestamp"]
+        }
+        stats_store.set(video_id, stats)
+        return stats
+
+    stats, age = stats_store.get_with_age(video_id)
+    if stats is not None and age <= VIDEO_STATS_TTL:
+        return stats
+
+    url = entry.get("webpage_url") or entry.get("url")
+    fetched = fetch_video_stats(video_id, url)
+    if fetched is not None:
+        return fetched
+
+    # the counters could not be fetched, the stale ones are better than none
+    return stats or {"url": url, "view_count": 0, "like_count": 0, "timestamp": None}
+
+"""
+Download the view and like counters of a video and save them in the stats store.
+@param video_id: YouTube video ID
+@param url: URL of the video
+@return: dictionary with url, view_count, like_count and upload timestamp, or None if the video could not be extracted
+"""
+def fetch_video_stats(video_id, url):
+    ytdlp_limiter.wait()
+    with span("video_stats"), youtube_dl({"skip_download": True, "ignoreerrors": True, "quiet": True}) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    if not info:
+        # removed or unavailable video: the stored counters are left as they are
+        print(f"Stats not available for {video_id}", flush=True)
+        return None
+
+    stats = {
+        "url": url,
+        "view_count": info.get("view_count") or 0,
+        "like_count": info.get("like_count") or 0,
+        "timestamp": info.get("timestamp")
+    }
+    stats_store.set(video_id, stats)
+    return stats
+
+"""
+Refresh the stored counters older than max_age seconds, oldest first, independently from the searches.
+Run by utils/refresh_video_stats.py, so that the searches find fresh counters instead of fetching them.
+@param max_age: maximum age in seconds of the counters kept as they are, VIDEO_STATS_TTL by default
+@param limit: maximum number of videos refreshed, None for all the stale ones
+@return: number of stale videos and number of videos refreshed
+"""
+def refresh_video_stats(max_age=None, limit=None):
+    stale_ids = stats_store.keys(older_than=VIDEO_STATS_TTL if max_age is None else max_age)
+    if limit is not None:
+        stale_ids = stale_ids[:limit]
+
+    refreshed = 0
+    for video_id in stale_ids:
+        stats = stats_store.get(video_id)
+        if stats and stats.get("url") and fetch_video_stats(video_id, stats["url"]) is not None:
+            refreshed += 1
+
+    return len(stale_ids), refreshed
+
+"""
+Compute the view and like scores of a video.
+@param stats: dictionary with view_count, like_count and upload timestamp
+@return: view score (views per day since upload) and like score (likes per view)
+"""
+def video_scores(stats):
+    view_count = stats["view_count"]
+    like_count = stats["like_count"]
+
+    if stats["timestamp"] is None:
+        days = 0
+    else:
+        time_uploaded = datetime.datetime.fromtimestamp(stats["timestamp"])
+        days = (datetime.datetime.now() - time_uploaded).days
+
+    view_score = view_count / days if days > 0 else 0
+    like_score = like_count / view_count if view_count > 0 else 0
 
-        return "ok", valid_videos
+    return view_score, like_score
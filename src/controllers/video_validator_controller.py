@@ -15,20 +15,6 @@ PROMPT_TEMPLATE_SUBTITLES_PATH = os.getenv('PROMPT_SUBTITLES')
 MIN_DURATION = int(os.getenv('MIN_DURATION')) 
 
 
-if not PROMPT_TEMPLATE_SUBTITLES_PATH:
-    raise ValueError("Prompt template path not set in environment variables")
-
-try:
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    FULL_PROMPT_PATH = os.path.join(BASE_DIR, '..', PROMPT_TEMPLATE_SUBTITLES_PATH) 
-
-    with open(FULL_PROMPT_PATH, 'r', encoding='utf-8') as f:
-        FILTER_PROMPT_TEMPLATE = f.read().strip()
-    
-except FileNotFoundError:
-    raise FileNotFoundError(f"Error: Could not find file at path")
-
-
 """
 Validate if a video entry meets the criteria
 @param entry: video metadata dictionary
@@ -0,0 +1,68 @@
+import os
+import re
+import html
+from collections import deque
+
+# Cue timing line, hours are optional in WebVTT ("01:02.500 --> 01:04.000")
+TIMING_RE = re.compile(r"((?:\d+:)?\d{2}:\d{2}\.\d{3})\s+-->\s+((?:\d+:)?\d{2}:\d{2}\.\d{3})")
+# Inline tags: word timings (<00:00:01.000>), classes (<c>, </c>), voices (<v Speaker>)
+TAG_RE = re.compile(r"<[^>]*>")
+
+# YouTube auto-generated captions roll: every cue repeats the previous line(s) before the new words,
+# so a line is emitted only if it is not among the last ROLLING_WINDOW emitted lines
+ROLLING_WINDOW = 3
+
+"""
+Parse a WebVTT subtitle file lazily, in a single pass.
+@param source: path of the VTT file, or an open text or binary file (any iterable of lines)
+@return: generator of (start, end, text) cues, one per distinct caption line
+"""
+def iter_cues(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'r', encoding='utf-8-sig') as f:
+            yield from _parse_lines(f)
+    else:
+        yield from _parse_lines(source)
+
+"""
+Parse the lines of a WebVTT document.
+@param lines: iterable of str or bytes lines
+@return: generator of (start, end, text) cues
+"""
+def _parse_lines(lines):
+    recent = deque(maxlen=ROLLING_WINDOW)
+    start = end = None
+    in_cue = False
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        line = line.rstrip('\r\n')
+
+        # a blank line closes the cue, whitespace-only lines inside a cue are just empty captions
+        if not line:
+            in_cue = False
+            continue
+
+        timing = TIMING_RE.match(line)
+        if timing:
+            start, end = timing.group(1), timing.group(2)
+            in_cue = True
+            continue
+
+        # header, NOTE/STYLE blocks and cue identifiers
+        if not in_cue:
+            continue
+
+        text = line
+        if '<' in text:
+            text = TAG_RE.sub('', text)
+        if '&' in text:
+            text = html.unescape(text)
+        text = text.strip()
+
+        if not text or text in recent:
+            continue
+
+        recent.append(text)
+        yield start, end, text
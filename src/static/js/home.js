@@ -11,10 +11,14 @@ class TechGuideApp {
  
     this.searchBtn = document.getElementById('searchBtn'); 
     this.deviceInput = document.getElementById('deviceInput');
+    this.suggestions = document.getElementById('suggestions');
+    this.suggestionChips = document.getElementById('suggestionChips');
     
     
     this.searchSection = document.getElementById('searchSection');
     this.loadingSection = document.getElementById('loadingSection');
+    this.loadingText = document.getElementById('loadingText');
+    this.streamContainer = document.getElementById('streamContainer');
     this.resultsSection = document.getElementById('resultsSection');
     this.errorSection = document.getElementById('errorSection');
     
@@ -24,6 +28,11 @@ class TechGuideApp {
     
     
     this.currentDevice = '';
+    this.pollInterval = 1500;
+    this.streamBlocks = [];
+    this.autocompleteDelay = 150;
+    this.autocompleteTimer = null;
+    this.autocompleteRequest = 0;
     
     this.init();
 
@@ -74,12 +83,78 @@ class TechGuideApp {
           this.searchManual();
         }
       });
+      this.deviceInput.addEventListener('input', () => this.scheduleAutocomplete());
     }
 
   }
 
+  scheduleAutocomplete() {
+    clearTimeout(this.autocompleteTimer);
+    this.autocompleteTimer = setTimeout(() => this.fetchSuggestions(), this.autocompleteDelay);
+  }
+
+  async fetchSuggestions() {
+    const query = this.deviceInput.value;
+    const requestId = ++this.autocompleteRequest;
+
+    if (query.trim().length < 2) {
+      this.hideSuggestions();
+      return;
+    }
+
+    try {
+      const response = await fetch(`/api/devices/autocomplete?q=${encodeURIComponent(query)}`);
+      const data = await response.json();
+
+      // a newer request was sent while this one was running
+      if (requestId !== this.autocompleteRequest) {
+        return;
+      }
+
+      this.renderSuggestions(response.ok ? data.suggestions : []);
+    } catch (error) {
+      this.hideSuggestions();
+    }
+  }
+
+  renderSuggestions(names) {
+    if (!this.suggestions || !this.suggestionChips) {
+      return;
+    }
+
+    this.suggestionChips.innerHTML = '';
+
+    if (!names || !names.length) {
+      this.hideSuggestions();
+      return;
+    }
+
+    names.forEach((name) => {
+      const chip = document.createElement('button');
+      chip.type = 'button';
+      chip.className = 'suggestion-chip';
+      chip.textContent = name;
+      chip.addEventListener('click', () => {
+        this.deviceInput.value = name;
+        this.hideSuggestions();
+        this.deviceInput.focus();
+      });
+      this.suggestionChips.appendChild(chip);
+    });
+
+    this.suggestions.classList.remove('hidden');
+  }
+
+  hideSuggestions() {
+    this.autocompleteRequest++;
+    if (this.suggestions) {
+      this.suggestions.classList.add('hidden');
+    }
+  }
+
   showHomeScreen() {
     this.hideAllSections();
+    this.hideSuggestions();
     if (this.searchSection) {
       this.searchSection.classList.remove('hidden');
     }
@@ -117,10 +192,12 @@ class TechGuideApp {
     }
 
     this.currentDevice = device;
+    clearTimeout(this.autocompleteTimer);
+    this.hideSuggestions();
     this.showLoading();
 
     try {
-      const response = await fetch('/api/video_search', {
+      const response = await fetch('/api/jobs', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json'
@@ -128,30 +205,22 @@ class TechGuideApp {
         body: JSON.stringify({ device: device })
       });
 
-        const data = await response.json();
-
-        if (!response.ok) {
-          this.showError(data.error || `Server Error: ${response.status}`);
-          return;
-      } 
-
-      if (data.success && data.manual_id) {
-	const parameter = encodeURIComponent(data.manual_id.join(";"))
-	const manualUrl = `/api/manual?id=${parameter}`;
-        
-        try {
-          const checkResponse = await fetch(manualUrl, { method: 'HEAD' });
-          if (checkResponse.ok) {
-            window.location.href = manualUrl;
-          } else {
-            this.showError('Manual was generated but could not be loaded. Please try again.');
-          }
-        } catch (err) {
-          this.showError('Unable to verify manual. Please try again.');
-        }
+      const data = await response.json();
+
+      if (!response.ok) {
+        this.showError(data.error || `Server Error: ${response.status}`);
+        return;
+      }
+
+      const result = window.EventSource
+        ? await this.followJob(data.job_id, data.status_url)
+        : await this.pollJob(data.status_url);
+
+      if (result.success && result.manual_id) {
+        await this.openManual(result.manual_id, result.bundle_id);
       }
       else {
-        this.showError(data.error || 'Manual not found for this device');
+        this.showError(result.error || 'Manual not found for this device');
       }
 
     } catch (error) {
@@ -159,8 +228,122 @@ class TechGuideApp {
     }
   }
 
+  async pollJob(statusUrl) {
+    while (true) {
+      const response = await fetch(statusUrl);
+      const job = await response.json();
+
+      if (!response.ok) {
+        return job;
+      }
+
+      if (job.status === 'done') {
+        return job.result;
+      }
+
+      this.setLoadingText(job.message);
+      await new Promise((resolve) => setTimeout(resolve, this.pollInterval));
+    }
+  }
+
+  followJob(jobId, statusUrl) {
+    return new Promise((resolve) => {
+      const source = new EventSource(`/api/jobs/${encodeURIComponent(jobId)}/events`);
+
+      source.addEventListener('progress', (event) => {
+        const progress = JSON.parse(event.data);
+        this.setLoadingText(progress.message);
+        this.prepareStream(progress.titles);
+      });
+
+      source.addEventListener('token', (event) => {
+        const token = JSON.parse(event.data);
+        this.appendStreamText(token.index, token.offset, token.text);
+      });
+
+      source.addEventListener('done', (event) => {
+        source.close();
+        resolve(JSON.parse(event.data));
+      });
+
+      // the browser reconnects by itself, fall back to polling only if the stream is closed for good
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          resolve(this.pollJob(statusUrl));
+        }
+      };
+    });
+  }
+
+  prepareStream(titles) {
+    if (!this.streamContainer || !titles || this.streamBlocks.length) {
+      return;
+    }
+
+    titles.forEach((title) => {
+      const container = document.createElement('div');
+      container.className = 'manual-container';
+
+      const heading = document.createElement('h2');
+      heading.className = 'manual-title';
+      heading.textContent = title;
+
+      const body = document.createElement('div');
+      body.className = 'manual-content-body stream-text';
+
+      container.appendChild(heading);
+      container.appendChild(body);
+      this.streamContainer.appendChild(container);
+      this.streamBlocks.push(body);
+    });
+  }
+
+  appendStreamText(index, offset, text) {
+    const block = this.streamBlocks[index];
+    if (!block) {
+      return;
+    }
+
+    block.textContent = block.textContent.slice(0, offset) + text;
+    this.streamContainer.classList.remove('hidden');
+  }
+
+  resetStream() {
+    this.streamBlocks = [];
+    if (this.streamContainer) {
+      this.streamContainer.innerHTML = '';
+      this.streamContainer.classList.add('hidden');
+    }
+  }
+
+  async openManual(manualIds, bundleId) {
+    // the bundle keeps the link short whatever the number of manuals
+    const manualUrl = bundleId
+      ? `/m/${encodeURIComponent(bundleId)}`
+      : `/api/manual?id=${encodeURIComponent(manualIds.join(";"))}`;
+
+    try {
+      const checkResponse = await fetch(manualUrl, { method: 'HEAD' });
+      if (checkResponse.ok) {
+        window.location.href = manualUrl;
+      } else {
+        this.showError('Manual was generated but could not be loaded. Please try again.');
+      }
+    } catch (err) {
+      this.showError('Unable to verify manual. Please try again.');
+    }
+  }
+
+  setLoadingText(message) {
+    if (this.loadingText && message) {
+      this.loadingText.textContent = message;
+    }
+  }
+
   showLoading() {
     this.hideAllSections();
+    this.resetStream();
+    this.setLoadingText('Searching for videos...');
     this.loadingSection.classList.remove('hidden');
     this.homeBtn.classList.remove('hidden');
   }
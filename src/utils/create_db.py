@@ -1,6 +1,24 @@
 import sqlite3
 import os
 import sys
+import pathlib
+
+# Source rows read and written per batch, memory use does not grow with the size of the catalog
+BATCH_SIZE = 10000
+# Page cache of the output database during a rebuild, in KiB
+BULK_CACHE_KIB = 65536
+
+# Models in primary key order, so the source is scanned without a sort
+SOURCE_QUERY = """
+    SELECT 
+        MODEL.id, MODEL.prod, FAMILIES.fam, FAMILIES.subfam, FAMILIES.showsubfam, MODEL.model, MODEL.submodel 
+    FROM 
+        MODEL 
+    JOIN 
+        FAMILIES ON MODEL.idfam = FAMILIES.id
+    ORDER BY 
+        MODEL.id ASC;
+    """
 
 """
 Formats device name components into a single string.
@@ -29,79 +47,280 @@ def format_name(prod, fam, subfam, showsubfam, model, submodel):
 
 
 """
-Creates a new SQLite database with device names sorted alphabetically.
+Opens the source catalog read-only.
+@param input_db_path: path to the input database file
+@return: sqlite3 connection
+"""
+def open_input_database(input_db_path):
+    return sqlite3.connect(f"{pathlib.Path(input_db_path).resolve().as_uri()}?mode=ro", uri=True)
+
+"""
+Opens the device database for a bulk load. Transactions are handled explicitly, and WAL mode
+lets the application keep reading the current tables while they are rebuilt.
+@param output_db_path: path to the output database file
+@return: sqlite3 connection
+"""
+def open_output_database(output_db_path):
+    db = sqlite3.connect(output_db_path, timeout=30, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL;")
+    db.execute("PRAGMA synchronous=NORMAL;")
+    db.execute(f"PRAGMA cache_size=-{BULK_CACHE_KIB};")
+    return db
+
+"""
+Reads the models of the source catalog in batches and formats their names.
+@param cursor: cursor on the source database
+@return: generator of lists of (model ID, device name) tuples, models without a name are skipped
+"""
+def iter_model_names(cursor):
+    cursor.execute(SOURCE_QUERY)
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            return
+        yield [(row[0], name) for row in rows if (name := format_name(*row[1:]))]
+
+"""
+Copies the modified rows of the WAL back into the database file, so that the application sees
+the new modification time and reloads its device index.
+@param db: connection on the device database
+@return: None
+"""
+def checkpoint(db):
+    try:
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    except sqlite3.Error as e:
+        print(f"Checkpoint postponed: {e}", file=sys.stderr)
+
+"""
+Creates a new SQLite database with device names sorted alphabetically. The catalog is streamed
+in batches into shadow tables, de-duplicated and sorted by SQLite through an index instead of
+in memory, then swapped with the live tables in a single transaction.
 @param input_db_path: path to the input database file
 @param output_db_path: path to the output database file
 @return: None
 """
 def create_new_sorted_device_database(input_db_path="devices_database/modelli.sqlite", 
                                      output_db_path="devices_database/device.sqlite"): 
-    
-
 
     if not os.path.exists(input_db_path):
         print(f"Error: Input database not found at {input_db_path}", file=sys.stderr)
         return
 
-
     try:
-        db_input = sqlite3.connect(input_db_path)
+        db_input = open_input_database(input_db_path)
         cur_input = db_input.cursor()
     except sqlite3.Error as e:
         print(f"Error connecting to source database {input_db_path}: {e}", file=sys.stderr)
         return
 
-    db_output = sqlite3.connect(output_db_path)
+    db_output = open_output_database(output_db_path)
     cur_output = db_output.cursor()
-    
-
-    cur_output.execute("CREATE TABLE IF NOT EXISTS devices (ID INTEGER PRIMARY KEY, DEVICE TEXT NOT NULL UNIQUE);")
-    cur_output.execute("DELETE FROM devices;")
-    db_output.commit()
 
     print(f"Reading data from {input_db_path}...")
 
-
-    sql_query = """
-    SELECT 
-        MODEL.prod, FAMILIES.fam, FAMILIES.subfam, FAMILIES.showsubfam, MODEL.model, MODEL.submodel 
-    FROM 
-        MODEL 
-    JOIN 
-        FAMILIES ON MODEL.idfam = FAMILIES.id
-    ORDER BY 
-        MODEL.prod ASC, FAMILIES.fam ASC, FAMILIES.subfam ASC, MODEL.model ASC, MODEL.submodel ASC; 
-    """
-    
     try:
-        cur_input.execute(sql_query)
-        results = cur_input.fetchall()
-    except sqlite3.OperationalError as e:
-        print(f"Error executing query: {e}", file=sys.stderr)
+        cur_output.execute("BEGIN;")
+        cur_output.execute("DROP TABLE IF EXISTS devices_new;")
+        cur_output.execute("DROP TABLE IF EXISTS device_models_new;")
+        cur_output.execute("CREATE TABLE devices_new (ID INTEGER PRIMARY KEY, DEVICE TEXT NOT NULL UNIQUE);")
+        # name of every source model, used by the incremental update to find the changed rows
+        cur_output.execute("CREATE TABLE device_models_new (MODEL_ID INTEGER PRIMARY KEY, DEVICE TEXT NOT NULL);")
+
+        models = 0
+        for batch in iter_model_names(cur_input):
+            cur_output.executemany("INSERT INTO device_models_new (MODEL_ID, DEVICE) VALUES (?, ?);", batch)
+            models += len(batch)
+
+        # the index keeps the names sorted on disk, so DISTINCT ... ORDER BY is a single ordered scan
+        cur_output.execute("DROP INDEX IF EXISTS device_models_device;")
+        cur_output.execute("CREATE INDEX device_models_device ON device_models_new (DEVICE);")
+        cur_output.execute(
+            "INSERT INTO devices_new (DEVICE) SELECT DISTINCT DEVICE FROM device_models_new ORDER BY DEVICE;"
+        )
+        names = cur_output.execute("SELECT COUNT(*) FROM devices_new;").fetchone()[0]
+        cur_output.execute("COMMIT;")
+
+        print(f"Found {names} unique names in {models} models. Swapping in the new tables...")
 
+        cur_output.execute("BEGIN IMMEDIATE;")
+        cur_output.execute("DROP TABLE IF EXISTS devices_fts;")
+        cur_output.execute("DROP TABLE IF EXISTS devices;")
+        cur_output.execute("DROP TABLE IF EXISTS device_models;")
+        cur_output.execute("ALTER TABLE devices_new RENAME TO devices;")
+        cur_output.execute("ALTER TABLE device_models_new RENAME TO device_models;")
+
+        print("Building the search index...")
+        build_search_index(cur_output)
+        cur_output.execute("COMMIT;")
+
+    except sqlite3.Error as e:
+        print(f"Error rebuilding the device database: {e}", file=sys.stderr)
+        if db_output.in_transaction:
+            db_output.rollback()
         db_input.close()
         db_output.close()
         return
-    
 
-    unique_formatted_names = set(format_name(*row) for row in results if format_name(*row))
-    sorted_names_list = sorted(list(unique_formatted_names))
+    checkpoint(db_output)
+    db_input.close()
+    db_output.close()
     
-    print(f"Found {len(sorted_names_list)} unique names. Inserting them in alphabetical order...")
+    print("Operation completed successfully.")
+
+"""
+Updates the device database with the models added, renamed or removed in the source catalog since
+the last build. Only the names of the changed models are inserted or deleted, and the search index
+is kept in sync by triggers. Databases built before the model table existed are fully rebuilt.
+@param input_db_path: path to the input database file
+@param output_db_path: path to the output database file
+@return: None
+"""
+def update_device_database(input_db_path="devices_database/modelli.sqlite",
+                           output_db_path="devices_database/device.sqlite"):
+
+    if not os.path.exists(input_db_path):
+        print(f"Error: Input database not found at {input_db_path}", file=sys.stderr)
+        return
+
+    if os.path.exists(output_db_path):
+        db_output = open_output_database(output_db_path)
+        objects = {row[0] for row in db_output.execute("SELECT name FROM sqlite_master;")}
+    else:
+        db_output, objects = None, set()
+
+    if not {'devices', 'device_models', 'devices_fts', 'devices_fts_insert', 'devices_fts_delete'} <= objects:
+        print("No model table in the device database, running a full rebuild...")
+        if db_output is not None:
+            db_output.close()
+        create_new_sorted_device_database(input_db_path, output_db_path)
+        return
 
     try:
+        db_input = open_input_database(input_db_path)
+        cur_input = db_input.cursor()
+    except sqlite3.Error as e:
+        print(f"Error connecting to source database {input_db_path}: {e}", file=sys.stderr)
+        db_output.close()
+        return
 
-        cur_output.executemany("INSERT INTO devices (DEVICE) VALUES (?);", [(name,) for name in sorted_names_list])
-    except sqlite3.IntegrityError as e:
-        print(f"Integrity Error during insertion: {e}", file=sys.stderr)
-    
+    cur_output = db_output.cursor()
+
+    print(f"Reading data from {input_db_path}...")
+
+    try:
+        # the current catalog goes to a temporary table, the live tables are not locked meanwhile
+        cur_output.execute("BEGIN;")
+        cur_output.execute("CREATE TEMP TABLE source_models (MODEL_ID INTEGER PRIMARY KEY, DEVICE TEXT NOT NULL);")
+        for batch in iter_model_names(cur_input):
+            cur_output.executemany("INSERT INTO source_models (MODEL_ID, DEVICE) VALUES (?, ?);", batch)
+        cur_output.execute("COMMIT;")
 
-    db_output.commit()
+        cur_output.execute("BEGIN IMMEDIATE;")
+        # NEW_DEVICE is NULL for removed models, OLD_DEVICE is NULL for new ones
+        cur_output.execute("""
+            CREATE TEMP TABLE changed_models AS
+            SELECT source_models.MODEL_ID, device_models.DEVICE AS OLD_DEVICE, source_models.DEVICE AS NEW_DEVICE
+            FROM source_models LEFT JOIN device_models ON device_models.MODEL_ID = source_models.MODEL_ID
+            WHERE device_models.DEVICE IS NOT source_models.DEVICE
+            UNION ALL
+            SELECT device_models.MODEL_ID, device_models.DEVICE, NULL
+            FROM device_models
+            WHERE NOT EXISTS (SELECT 1 FROM source_models WHERE source_models.MODEL_ID = device_models.MODEL_ID);
+        """)
+        changed = cur_output.execute("SELECT COUNT(*) FROM changed_models;").fetchone()[0]
+
+        if not changed:
+            cur_output.execute("ROLLBACK;")
+            print("The device database is already up to date.")
+            db_input.close()
+            db_output.close()
+            return
+
+        cur_output.execute(
+            "DELETE FROM device_models WHERE MODEL_ID IN (SELECT MODEL_ID FROM changed_models WHERE NEW_DEVICE IS NULL);"
+        )
+        cur_output.execute(
+            "INSERT OR REPLACE INTO device_models (MODEL_ID, DEVICE) "
+            "SELECT MODEL_ID, NEW_DEVICE FROM changed_models WHERE NEW_DEVICE IS NOT NULL;"
+        )
+        cur_output.execute(
+            "INSERT OR IGNORE INTO devices (DEVICE) "
+            "SELECT DISTINCT NEW_DEVICE FROM changed_models WHERE NEW_DEVICE IS NOT NULL ORDER BY NEW_DEVICE;"
+        )
+        added = cur_output.execute("SELECT changes();").fetchone()[0]
+        # a name goes away only when no model is left with it
+        cur_output.execute(
+            "DELETE FROM devices WHERE DEVICE IN (SELECT OLD_DEVICE FROM changed_models WHERE OLD_DEVICE IS NOT NULL) "
+            "AND NOT EXISTS (SELECT 1 FROM device_models WHERE device_models.DEVICE = devices.DEVICE);"
+        )
+        removed = cur_output.execute("SELECT changes();").fetchone()[0]
+        cur_output.execute("COMMIT;")
+
+    except sqlite3.Error as e:
+        print(f"Error updating the device database: {e}", file=sys.stderr)
+        if db_output.in_transaction:
+            db_output.rollback()
+        db_input.close()
+        db_output.close()
+        return
+
+    checkpoint(db_output)
     db_input.close()
     db_output.close()
-    
-    print("Operation completed successfully.")
+
+    print(f"{changed} models changed: {added} names added, {removed} names removed.")
+
+"""
+Builds the indexes used by the device lookup: a case-insensitive index for exact matches and
+an FTS5 trigram index for substring matches, which a LIKE '%...%' query cannot use.
+@param cursor: cursor on the device database
+@return: None
+"""
+def build_search_index(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS devices_device_nocase ON devices (DEVICE COLLATE NOCASE);")
+    cursor.execute("DROP TABLE IF EXISTS devices_fts;")
+    # the trigram tokenizer is case-insensitive and matches any substring of at least 3 characters
+    cursor.execute(
+        "CREATE VIRTUAL TABLE devices_fts USING fts5(DEVICE, content='devices', content_rowid='ID', tokenize='trigram');"
+    )
+    cursor.execute("INSERT INTO devices_fts(devices_fts) VALUES ('rebuild');")
+    # keep the external content index in sync with the incremental updates
+    cursor.execute(
+        "CREATE TRIGGER IF NOT EXISTS devices_fts_insert AFTER INSERT ON devices BEGIN "
+        "INSERT INTO devices_fts(rowid, DEVICE) VALUES (new.ID, new.DEVICE); END;"
+    )
+    cursor.execute(
+        "CREATE TRIGGER IF NOT EXISTS devices_fts_delete AFTER DELETE ON devices BEGIN "
+        "INSERT INTO devices_fts(devices_fts, rowid, DEVICE) VALUES ('delete', old.ID, old.DEVICE); END;"
+    )
+
+"""
+Builds the search index of an existing device database without rebuilding its content.
+@param db_path: path to the device database file
+@return: None
+"""
+def create_search_index(db_path="devices_database/device.sqlite"):
+
+    if not os.path.exists(db_path):
+        print(f"Error: Device database not found at {db_path}", file=sys.stderr)
+        return
+
+    db = sqlite3.connect(db_path)
+    try:
+        build_search_index(db.cursor())
+        db.commit()
+        print("Search index built successfully.")
+    except sqlite3.Error as e:
+        print(f"Error building the search index: {e}", file=sys.stderr)
+    finally:
+        db.close()
 
 if __name__ == "__main__":
     os.makedirs("devices_database", exist_ok=True)
-    create_new_sorted_device_database()
\ No newline at end of file
+    if "--index-only" in sys.argv[1:]:
+        create_search_index()
+    elif "--incremental" in sys.argv[1:]:
+        update_device_database()
+    else:
+        create_new_sorted_device_database()
\ No newline at end of file
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from controllers.manual_store_controller import manual_store, read_report_file, REPORTS_DIR, REPORT_FILE_RE
+
+# Manuals inserted per transaction
+BATCH_SIZE = 500
+
+"""
+Moves the manuals saved as JSON files in video_reports/ into the manual store.
+File names are kept as manual IDs, so the links to the old manuals keep working,
+and files already migrated are skipped, so the migration can be run again safely.
+@param reports_dir: folder of the JSON files
+@param delete: True to delete every file once its manual is stored
+@return: None
+"""
+def migrate_reports(reports_dir=REPORTS_DIR, delete=False):
+
+    if not os.path.isdir(reports_dir):
+        print(f"Error: Reports folder not found at {reports_dir}", file=sys.stderr)
+        return
+
+    migrated = 0
+    failed = 0
+    batch = []
+    paths = []
+
+    def flush():
+        nonlocal migrated
+        manual_store.add_many(batch)
+        migrated += len(batch)
+        if delete:
+            for path in paths:
+                os.remove(path)
+        batch.clear()
+        paths.clear()
+
+    with os.scandir(reports_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or not REPORT_FILE_RE.fullmatch(entry.name):
+                continue
+
+            try:
+                batch.append(read_report_file(entry.path))
+                paths.append(entry.path)
+            except (OSError, ValueError, KeyError, json.JSONDecodeError) as e:
+                print(f"Skipping {entry.name}: {type(e).__name__}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+
+            if len(batch) >= BATCH_SIZE:
+                flush()
+
+    if batch:
+        flush()
+
+    print(f"Migrated {migrated} manuals, {failed} files skipped.")
+
+if __name__ == "__main__":
+    migrate_reports(delete="--delete" in sys.argv[1:])
@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from controllers.subtitles_controller import map_device_to_models, get_device_db, ytdlp_limiter
+from controllers.home_controller import collect_device_videos, write_device_manuals
+from controllers.manual_store_controller import manual_store
+from controllers.llm_controller import supervise_ollama, ollama_status
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# One JSON line per device processed, the last line of a device is its current state
+CHECKPOINT_PATH = os.path.join(BASE_DIR, '..', 'cache', 'pregenerate.jsonl')
+# Devices not processed again by a resumed run
+FINAL_STATUSES = ('ok', 'device_not_found')
+# yt-dlp extractions per minute when YTDLP_RATE_LIMIT is not set, a night of searches should not get the host blocked
+DEFAULT_YTDLP_RATE = 30
+
+"""
+Checkpoint of a batch run: an append-only JSON lines file, so that an interrupted run can be resumed
+and loses at most the devices being processed.
+"""
+class Checkpoint:
+
+    """
+    @param path: path of the checkpoint file
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    """
+    Read the last state of every device of the checkpoint.
+    @return: dictionary lowercase device name -> last record
+    """
+    def load(self):
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line cut by a crash
+                    continue
+                records[record['device'].lower()] = record
+        return records
+
+    """
+    Append the result of a device.
+    @param device: device name
+    @param status: ok, device_not_found or error
+    @param details: other fields of the record (bundle_id, manual_id, error)
+    @return: the record
+    """
+    def record(self, device, status, **details):
+        record = {'device': device, 'status': status, **details, 'finished_at': time.time()}
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+"""
+Read device names from a text file, one per line. Empty lines and lines starting with # are skipped.
+@param path: path of the file
+@return: list of device names
+"""
+def read_device_file(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+"""
+Select device names from the devices table.
+@param pattern: SQL LIKE pattern, e.g. 'Dell XPS%'
+@param limit: maximum number of devices
+@return: list of device names
+"""
+def query_devices(pattern, limit):
+    rows = get_device_db().execute(
+        "SELECT DEVICE FROM devices WHERE DEVICE LIKE ? ORDER BY DEVICE LIMIT ?", (pattern, limit)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+"""
+Wait until Ollama answers, starting it if this host runs none, like the web application does.
+@param timeout: maximum seconds to wait
+@return: OllamaSupervisor to stop at the end of the run, or None if Ollama did not answer in time
+"""
+def wait_for_ollama(timeout):
+    supervisor = supervise_ollama()
+    deadline = time.monotonic() + timeout
+    while not ollama_status()['ready']:
+        if time.monotonic() > deadline:
+            supervisor.stop()
+            return None
+        time.sleep(1)
+    return supervisor
+
+"""
+Generate the manuals of a list of devices in two stages connected by a bounded queue: the YouTube stage
+(search and subtitles) of the next devices runs while the LLM stage writes the manuals of the previous ones.
+Searches, subtitles and manuals go through the same caches as the web application, so the devices
+generated here are served instantly to the users afterwards.
+@param devices: list of device names
+@param checkpoint: Checkpoint of the run
+@param subtitle_workers: devices in the YouTube stage at the same time
+@param manual_workers: devices in the LLM stage at the same time
+@param prefetch: devices with subtitles waiting for the LLM stage at most
+@return: dictionary status -> number of devices
+"""
+def pregenerate(devices, checkpoint, subtitle_workers, manual_workers, prefetch):
+    ready = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    totals = {}
+    totals_lock = threading.Lock()
+    started_at = {}
+
+    def notify(phase, **details):
+        pass
+
+    def finish(device, status, **details):
+        checkpoint.record(device, status, **details)
+        with totals_lock:
+            totals[status] = totals.get(status, 0) + 1
+            done = sum(totals.values())
+        elapsed = time.monotonic() - started_at[device]
+        message = f" ({details['error']})" if details.get('error') else ""
+        print(f"[{done}/{len(devices)}] {device}: {status}{message} in {elapsed:.1f}s", flush=True)
+
+    def collect(device):
+        if stop.is_set():
+            return
+        started_at[device] = time.monotonic()
+        try:
+            mapped_models = map_device_to_models(device)
+            if not mapped_models:
+                finish(device, 'device_not_found')
+                return
+
+            videos, error = collect_device_videos(device, mapped_models, notify)
+            if error:
+                finish(device, error[0]['status'], error=error[0]['error'])
+                return
+            ready.put((device, videos))
+        except Exception as e:
+            finish(device, 'error', error=f"{type(e).__name__}: {e}")
+
+    def write():
+        while True:
+            item = ready.get()
+            if item is None:
+                return
+
+            device, videos = item
+            try:
+                body, status_code = write_device_manuals(device, videos, notify)
+                if body.get('success'):
+                    finish(device, 'ok', bundle_id=body['bundle_id'], manual_id=body['manual_id'])
+                else:
+                    finish(device, body.get('status', 'error'), error=body.get('error', ''))
+            except Exception as e:
+                finish(device, 'error', error=f"{type(e).__name__}: {e}")
+
+    writers = [threading.Thread(target=write, name=f"pregenerate_manuals_{i}", daemon=True) for i in range(manual_workers)]
+    for writer in writers:
+        writer.start()
+
+    executor = ThreadPoolExecutor(max_workers=subtitle_workers, thread_name_prefix="pregenerate_subtitles")
+    try:
+        list(executor.map(collect, devices))
+    except KeyboardInterrupt:
+        print("Interrupted, finishing the devices already started. Run again to resume.", flush=True)
+        stop.set()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for _ in writers:
+            ready.put(None)
+        for writer in writers:
+            writer.join()
+
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate the manuals of many devices in advance, e.g. overnight, so that users get them from the cache."
+    )
+    parser.add_argument('devices', nargs='*', help='device names')
+    parser.add_argument('--file', help='text file with one device name per line')
+    parser.add_argument('--like', help="devices of the devices table matching a SQL LIKE pattern, e.g. 'Dell XPS%%'")
+    parser.add_argument('--limit', type=int, default=100, help='maximum devices selected by --like (default: 100)')
+    parser.add_argument('--top', type=int, default=0, help='the N devices searched most by the users')
+    parser.add_argument('--days', type=float, default=30, help='searches of the last DAYS days counted by --top (default: 30)')
+    parser.add_argument('--subtitle-workers', type=int, default=2, help='devices searched at the same time (default: 2)')
+    parser.add_argument('--manual-workers', type=int, default=1,
+                        help='devices whose manuals are generated at the same time, each using LLM_WORKERS (default: 1)')
+    parser.add_argument('--prefetch', type=int, default=2, help='devices with subtitles waiting for the LLM at most (default: 2)')
+    parser.add_argument('--ytdlp-rate', type=float, default=ytdlp_limiter.rate or DEFAULT_YTDLP_RATE,
+                        help='maximum yt-dlp extractions per minute, 0 for no limit (default: YTDLP_RATE_LIMIT or 30)')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help='checkpoint file (default: cache/pregenerate.jsonl)')
+    parser.add_argument('--force', action='store_true', help='process again the devices already done in the checkpoint')
+    parser.add_argument('--ollama-timeout', type=float, default=300, help='seconds to wait for Ollama (default: 300)')
+    args = parser.parse_args()
+
+    devices = list(args.devices)
+    if args.file:
+        devices += read_device_file(args.file)
+    if args.like:
+        devices += query_devices(args.like, args.limit)
+    if args.top:
+        devices += manual_store.top_devices(args.top, since=time.time() - args.days * 86400)
+
+    # same device listed twice, in any case
+    devices = list({device.lower(): device for device in reversed(devices)}.values())[::-1]
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if not args.force:
+        done = checkpoint.load()
+        skipped = [device for device in devices if done.get(device.lower(), {}).get('status') in FINAL_STATUSES]
+        devices = [device for device in devices if device not in skipped]
+        if skipped:
+            print(f"Resuming: {len(skipped)} devices already done in {args.checkpoint}")
+
+    if not devices:
+        print("No device to process.")
+        return
+
+    supervisor = wait_for_ollama(args.ollama_timeout)
+    if supervisor is None:
+        print(f"Error: Ollama did not answer within {args.ollama_timeout:.0f}s", file=sys.stderr)
+        sys.exit(1)
+
+    ytdlp_limiter.rate = args.ytdlp_rate
+    start_time = time.monotonic()
+    try:
+        totals = pregenerate(devices, checkpoint, args.subtitle_workers, args.manual_workers, args.prefetch)
+    finally:
+        supervisor.stop()
+
+    print(f"Processed {sum(totals.values())} devices in {time.monotonic() - start_time:.0f}s: "
+          + ", ".join(f"{count} {status}" for status, count in sorted(totals.items())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from controllers.subtitles_controller import refresh_video_stats, ytdlp_limiter, VIDEO_STATS_TTL
+
+# yt-dlp extractions per minute when YTDLP_RATE_LIMIT is not set, the refresh runs alongside the searches
+DEFAULT_YTDLP_RATE = 30
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fetch again the view and like counters of the stored videos, e.g. from cron, "
+                    "so that the searches rank videos with fresh counters without fetching them."
+    )
+    parser.add_argument('--max-age', type=float, default=VIDEO_STATS_TTL,
+                        help='refresh the counters older than MAX_AGE seconds (default: VIDEO_STATS_TTL)')
+    parser.add_argument('--limit', type=int, default=None, help='maximum videos refreshed, oldest counters first (default: all)')
+    parser.add_argument('--ytdlp-rate', type=float, default=ytdlp_limiter.rate or DEFAULT_YTDLP_RATE,
+                        help='maximum yt-dlp extractions per minute, 0 for no limit (default: YTDLP_RATE_LIMIT or 30)')
+    args = parser.parse_args()
+
+    ytdlp_limiter.rate = args.ytdlp_rate
+    start_time = time.monotonic()
+    stale, refreshed = refresh_video_stats(max_age=args.max_age, limit=args.limit)
+
+    print(f"Refreshed the counters of {refreshed} videos out of {stale} stale in {time.monotonic() - start_time:.0f}s")
+
+if __name__ == "__main__":
+    main()
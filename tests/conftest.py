@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the application imports its modules relative to src, as when it is started from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# settings without a default, read when the controllers are imported
+for name, value in (('MAX_SEARCH', '20'), ('MIN_DURATION', '60'), ('COEF_VIEW', '1'), ('COEF_LIKE', '1')):
+    os.environ.setdefault(name, value)
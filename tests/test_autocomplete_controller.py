@@ -0,0 +1,94 @@
+import os
+import sqlite3
+
+import pytest
+
+from controllers import autocomplete_controller
+from controllers.autocomplete_controller import DeviceIndex, edit_distance, max_distance
+
+NAMES = ['MacBook Pro 14', 'MacBook Air 13', 'ThinkPad X1 Carbon', 'ThinkPad X13', 'Dell XPS 15', 'Lenovo Legion 5']
+
+
+def test_max_distance_tiers():
+    assert [max_distance(word) for word in ('x13', 'dell', 'legion', 'thinkpad')] == [0, 1, 1, 2]
+
+
+def test_edit_distance_gives_up_beyond_the_limit():
+    assert edit_distance('carbon', 'carbon', 2) == 0
+    assert edit_distance('carbno', 'carbon', 2) == 2
+    assert edit_distance('macbook', 'notebook', 1) == 2
+    assert edit_distance('xps', 'legion', 2) == 3
+
+
+def test_search_completes_the_last_word():
+    index = DeviceIndex(NAMES)
+
+    assert index.search('macbook p') == ['MacBook Pro 14']
+    assert index.search('thinkpad x1') == ['ThinkPad X1 Carbon', 'ThinkPad X13']
+    assert index.search('mac', limit=1) == ['MacBook Air 13']
+
+
+def test_search_tolerates_one_typo_in_words_of_four_to_six_characters():
+    index = DeviceIndex(NAMES)
+
+    assert index.search('lenvo legion ') == ['Lenovo Legion 5']
+    assert index.search('lgeion ') == []
+
+
+def test_search_tolerates_two_typos_in_longer_words():
+    index = DeviceIndex(NAMES)
+
+    assert index.search('thinpkad x13 ') == ['ThinkPad X13']
+    assert index.search('mcabok air ') == []
+
+
+def test_search_needs_short_words_exact():
+    index = DeviceIndex(NAMES)
+
+    assert index.search('dell xps ') == ['Dell XPS 15']
+    assert index.search('dell xpz ') == []
+
+
+@pytest.fixture
+def device_db(tmp_path, monkeypatch):
+    path = str(tmp_path / 'device.sqlite')
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE devices (DEVICE TEXT)")
+        conn.executemany("INSERT INTO devices VALUES (?)", [(name,) for name in NAMES])
+    conn.close()
+
+    monkeypatch.setattr(autocomplete_controller, 'DB_PATH', path)
+    monkeypatch.setattr(autocomplete_controller, 'AUTOCOMPLETE_CHECK_INTERVAL', 0)
+    monkeypatch.setattr(autocomplete_controller, '_index', None)
+    monkeypatch.setattr(autocomplete_controller, '_index_version', None)
+    monkeypatch.setattr(autocomplete_controller, '_index_checked_at', 0.0)
+    return path
+
+
+def test_device_index_is_rebuilt_when_the_database_changes(device_db):
+    index = autocomplete_controller.get_device_index()
+
+    assert autocomplete_controller.device_index_ready()
+    assert autocomplete_controller.get_device_index() is index
+    assert index.search('framework ') == []
+
+    conn = sqlite3.connect(device_db)
+    with conn:
+        conn.execute("INSERT INTO devices VALUES ('Framework Laptop 13')")
+    conn.close()
+    # make sure the modification time changes even on coarse file systems
+    stat = os.stat(device_db)
+    os.utime(device_db, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    rebuilt = autocomplete_controller.get_device_index()
+    assert rebuilt is not index
+    assert rebuilt.search('framework ') == ['Framework Laptop 13']
+
+
+def test_device_index_is_kept_when_the_database_goes_missing(device_db):
+    index = autocomplete_controller.get_device_index()
+
+    os.remove(device_db)
+
+    assert autocomplete_controller.get_device_index() is index
@@ -0,0 +1,140 @@
+import time
+import threading
+
+import pytest
+
+from controllers.cache_controller import PersistentCache, LRUCache, SingleFlight, make_key
+
+
+def test_make_key_is_stable_and_order_independent_for_dicts():
+    assert make_key('video', {'a': 1, 'b': 2}) == make_key('video', {'b': 2, 'a': 1})
+    assert make_key('video', 1) != make_key('video', 2)
+
+
+def test_persistent_cache_round_trip(tmp_path):
+    cache = PersistentCache('manuals', path=str(tmp_path / 'cache.sqlite'))
+
+    assert cache.get('missing') is None
+    cache.set('key', {'text': 'Remove the screws', 'ids': [1, 2]})
+
+    assert cache.get('key') == {'text': 'Remove the screws', 'ids': [1, 2]}
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['entries'] == 1
+
+
+def test_persistent_cache_is_shared_by_instances_on_the_same_file(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    PersistentCache('manuals', path=path).set('key', 'value')
+
+    assert PersistentCache('manuals', path=path).get('key') == 'value'
+
+
+def test_persistent_cache_expires_entries(tmp_path):
+    cache = PersistentCache('manuals', ttl=0.05, path=str(tmp_path / 'cache.sqlite'))
+    cache.set('key', 'value')
+    time.sleep(0.1)
+
+    assert cache.get('key') is None
+    assert cache.keys() == []
+
+
+def test_persistent_cache_evicts_least_recently_used(tmp_path):
+    cache = PersistentCache('manuals', max_entries=2, path=str(tmp_path / 'cache.sqlite'))
+    cache.set('a', 1)
+    time.sleep(0.01)
+    cache.set('b', 2)
+    time.sleep(0.01)
+    cache.get('a')
+    time.sleep(0.01)
+    cache.set('c', 3)
+
+    assert sorted(cache.keys()) == ['a', 'c']
+
+
+def test_persistent_cache_rejects_invalid_table_names(tmp_path):
+    with pytest.raises(ValueError):
+        PersistentCache('manuals; DROP TABLE x', path=str(tmp_path / 'cache.sqlite'))
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_lru_cache_disabled_with_zero_entries():
+    cache = LRUCache(0)
+    cache.set('a', 1)
+
+    assert cache.get('a') is None
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'manual'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('device', work)))
+    leader.start()
+    started.wait(5)
+    assert flight.in_flight('device')
+
+    followers = [threading.Thread(target=lambda: results.append(flight.do('device', work))) for _ in range(4)]
+    for follower in followers:
+        follower.start()
+    # the followers are waiting for the leader
+    time.sleep(0.2)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == ['manual'] * 5
+    assert not flight.in_flight('device')
+
+
+def test_single_flight_shares_the_exception_and_runs_again_afterwards():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('ollama down')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('device', fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.2)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert errors == ['ollama down', 'ollama down']
+    assert flight.do('device', lambda: 'retried') == 'retried'
@@ -0,0 +1,85 @@
+from controllers import manual_controller
+from controllers.chunk_controller import estimate_tokens, split_subtitles, group_texts, truncate_text
+
+MERGE_PROMPT = 'Merge:'
+
+
+def test_estimate_tokens_counts_four_characters_per_token():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('abcd') == 1
+    assert estimate_tokens('abcde') == 2
+
+
+def test_split_subtitles_fits_the_budget_and_keeps_cues_together():
+    subtitles = [
+        {'t': '00:00:01.000', 's': 'a' * 16},
+        {'t': '00:00:01.000', 's': 'b' * 16},
+        {'t': '00:00:02.000', 's': 'c' * 16},
+        {'t': '00:00:03.000', 's': 'd' * 16}
+    ]
+
+    # 5 tokens per line with its newline
+    chunks = split_subtitles(subtitles, 10)
+
+    assert chunks == [subtitles[:2], subtitles[2:]]
+    assert [sub for chunk in chunks for sub in chunk] == subtitles
+
+
+def test_split_subtitles_keeps_a_cue_over_the_budget_whole():
+    subtitles = [{'t': '00:00:01.000', 's': 'a' * 40}, {'t': '00:00:01.000', 's': 'b' * 40}]
+
+    assert split_subtitles(subtitles, 5) == [subtitles]
+
+
+def test_group_texts_fits_the_budget_in_order():
+    texts = ['a' * 8, 'b' * 8, 'c' * 8, 'd' * 40]
+
+    # 2 tokens per text plus 2 for the separator
+    groups = group_texts(texts, 8)
+
+    assert groups == [texts[:2], texts[2:3], texts[3:]]
+
+
+def test_truncate_text_cuts_at_a_line_break():
+    text = 'remove the screws\nlift the cover\nunplug the battery'
+
+    assert truncate_text(text, 100) == text
+    assert truncate_text(text, 8) == 'remove the screws\nlift the cover'
+    assert estimate_tokens(truncate_text('x' * 100, 8)) == 8
+
+
+def test_reduce_notes_keeps_every_prompt_within_the_budget_when_every_note_is_over_it(monkeypatch):
+    budget = 50
+    prompts = []
+
+    def fake_generate(prompt, on_token=None):
+        prompts.append(prompt)
+        return 'merged notes ' * 10
+
+    monkeypatch.setattr(manual_controller, 'CHUNK_TOKEN_BUDGET', budget)
+    monkeypatch.setattr(manual_controller, 'get_prompts', lambda: {'merge': MERGE_PROMPT})
+    monkeypatch.setattr(manual_controller, 'generate', fake_generate)
+    notes = [f'note {i} ' * 100 for i in range(5)]
+
+    assert manual_controller.reduce_notes(notes) == 'merged notes ' * 10
+
+    assert prompts
+    for prompt in prompts:
+        notes_text = prompt[len(MERGE_PROMPT) + 1:]
+        assert sum(estimate_tokens(note) + 2 for note in notes_text.split('\n')) <= budget
+
+
+def test_reduce_notes_streams_only_the_final_merge(monkeypatch):
+    streamed = []
+
+    def fake_generate(prompt, on_token=None):
+        if on_token:
+            on_token('final')
+        return 'final' if on_token else 'partial'
+
+    monkeypatch.setattr(manual_controller, 'CHUNK_TOKEN_BUDGET', 50)
+    monkeypatch.setattr(manual_controller, 'get_prompts', lambda: {'merge': MERGE_PROMPT})
+    monkeypatch.setattr(manual_controller, 'generate', fake_generate)
+
+    assert manual_controller.reduce_notes(['a' * 80] * 6, on_token=streamed.append) == 'final'
+    assert streamed == ['final']
@@ -0,0 +1,86 @@
+from controllers import compress_controller
+from controllers.compress_controller import (
+    strip_filler, drop_near_duplicates, fit_target_ratio, merge_lines, count_tokens, compress_subtitles, MERGE_CHARS
+)
+
+
+def lines_of(*texts):
+    return [{'t': f'00:00:{i:02d}.000', 's': text} for i, text in enumerate(texts)]
+
+
+def test_strip_filler_removes_fillers_noise_tags_and_stutters():
+    assert strip_filler('[Music] um so you know the the screws are uh here') == 'so the screws are here'
+    assert strip_filler('[Applause] uh, um') == ''
+
+
+def test_drop_near_duplicates_drops_rolling_captions():
+    lines = lines_of(
+        'now remove the four screws on the back cover',
+        'now remove the four screws on the back cover',
+        'then lift the cover with a plastic pick'
+    )
+
+    kept = drop_near_duplicates(lines, 0.8, 10)
+
+    assert [line['s'] for line in kept] == [lines[0]['s'], lines[2]['s']]
+
+
+def test_drop_near_duplicates_keeps_a_step_repeated_far_apart():
+    step = 'remove the two screws holding the hinge bracket'
+    filler = [f'line number {i} about something else entirely here' for i in range(12)]
+    lines = lines_of(step, *filler, step)
+
+    kept = drop_near_duplicates(lines, 0.8, 10)
+
+    assert [line['s'] for line in kept].count(step) == 2
+    assert len(kept) == len(lines)
+
+
+def test_fit_target_ratio_meets_the_budget_and_keeps_repair_lines():
+    lines = lines_of(
+        'hey guys welcome back to the channel',
+        'this video is sponsored by a vpn',
+        'remove the battery connector with a spudger',
+        'thanks for watching and subscribe'
+    )
+    budget = count_tokens(lines) // 2
+
+    kept = fit_target_ratio(lines, budget)
+
+    assert count_tokens(kept) <= budget
+    assert lines[2] in kept
+    assert kept == [line for line in lines if line in kept]
+
+
+def test_merge_lines_keeps_the_first_timestamp_and_the_length_limit():
+    lines = lines_of('remove the screws', 'lift the cover', 'x' * MERGE_CHARS)
+
+    merged = merge_lines(lines)
+
+    assert merged == [
+        {'t': lines[0]['t'], 's': 'remove the screws lift the cover'},
+        {'t': lines[2]['t'], 's': 'x' * MERGE_CHARS}
+    ]
+    # the input lines are not modified
+    assert lines[0]['s'] == 'remove the screws'
+
+
+def test_compress_subtitles_keeps_timestamps_and_meets_the_target_ratio(monkeypatch):
+    monkeypatch.setattr(compress_controller, 'COMPRESS_TARGET_RATIO', 0.5)
+    monkeypatch.setattr(compress_controller, 'COMPRESS_REPAIR_WINDOW', 0)
+    subtitles = lines_of(
+        'um hey guys welcome back',
+        'um hey guys welcome back',
+        'today we open the laptop',
+        'first remove the ten screws of the bottom cover',
+        'then disconnect the battery cable from the board',
+        'and that is it thanks for watching'
+    )
+
+    lines, stats = compress_subtitles(subtitles)
+
+    assert stats['tokens_after'] <= stats['tokens_before'] * 0.5
+    assert stats['ratio'] == stats['tokens_after'] / stats['tokens_before']
+    timestamps = [sub['t'] for sub in subtitles]
+    assert lines and all(line['t'] in timestamps for line in lines)
+    assert 'battery cable' in ' '.join(line['s'] for line in lines)
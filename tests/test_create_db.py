@@ -0,0 +1,124 @@
+import sqlite3
+
+import pytest
+
+from utils import create_db
+
+FAMILIES = [(1, 'MacBook', 'Pro', 0), (2, 'ThinkPad', 'X1', 1)]
+MODELS = [
+    (1, 'Apple', 1, '14', None),
+    (2, 'Apple', 1, '16', None),
+    (3, 'Lenovo', 2, 'Carbon', 'Gen 9'),
+    (4, 'Lenovo', 2, 'Carbon', 'Gen 9'),
+    (5, 'Lenovo', 2, 'Yoga', None)
+]
+
+
+def write_source(path, models):
+    db = sqlite3.connect(path)
+    with db:
+        db.execute("DROP TABLE IF EXISTS FAMILIES;")
+        db.execute("DROP TABLE IF EXISTS MODEL;")
+        db.execute("CREATE TABLE FAMILIES (id INTEGER PRIMARY KEY, fam TEXT, subfam TEXT, showsubfam INTEGER);")
+        db.execute("CREATE TABLE MODEL (id INTEGER PRIMARY KEY, prod TEXT, idfam INTEGER, model TEXT, submodel TEXT);")
+        db.executemany("INSERT INTO FAMILIES VALUES (?, ?, ?, ?);", FAMILIES)
+        db.executemany("INSERT INTO MODEL VALUES (?, ?, ?, ?, ?);", models)
+    db.close()
+
+
+def read_devices(path):
+    db = sqlite3.connect(path)
+    try:
+        devices = sorted(row[0] for row in db.execute("SELECT DEVICE FROM devices;"))
+        models = db.execute("SELECT MODEL_ID, DEVICE FROM device_models ORDER BY MODEL_ID;").fetchall()
+        # every name is found by a substring search, and the index holds no row of a removed name
+        matched = [row[0] for row in db.execute("SELECT rowid FROM devices_fts WHERE devices_fts MATCH 'Lenovo OR Apple';")]
+        indexed = sorted(
+            db.execute("SELECT DEVICE FROM devices WHERE ID = ?;", (rowid,)).fetchone()[0] for rowid in matched
+        )
+        db.execute("INSERT INTO devices_fts(devices_fts) VALUES ('integrity-check');")
+        tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+    finally:
+        db.close()
+    return devices, models, indexed, tables
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'modelli.sqlite'), str(tmp_path / 'device.sqlite')
+
+
+def test_full_build_sorts_and_deduplicates_the_names(paths):
+    source, output = paths
+    write_source(source, MODELS)
+
+    create_db.create_new_sorted_device_database(source, output)
+
+    devices, models, indexed, tables = read_devices(output)
+    assert devices == ['Apple MacBook 14', 'Apple MacBook 16', 'Lenovo ThinkPad X1 Carbon Gen 9', 'Lenovo ThinkPad X1 Yoga']
+    assert [model_id for model_id, _ in models] == [1, 2, 3, 4, 5]
+    assert indexed == devices
+    assert not {'devices_new', 'device_models_new'} & tables
+
+
+def test_incremental_update_matches_a_full_build(paths, tmp_path):
+    source, output = paths
+    write_source(source, MODELS)
+    create_db.create_new_sorted_device_database(source, output)
+
+    changed = [
+        (1, 'Apple', 1, '14', None),
+        # renamed
+        (2, 'Apple', 1, '16', 'M3'),
+        # renamed, but model 4 still has the old name
+        (3, 'Lenovo', 2, 'Carbon', 'Gen 10'),
+        (4, 'Lenovo', 2, 'Carbon', 'Gen 9'),
+        # model 5 removed, model 6 added
+        (6, 'Lenovo', 2, 'Nano', None)
+    ]
+    write_source(source, changed)
+
+    create_db.update_device_database(source, output)
+
+    rebuilt = str(tmp_path / 'rebuilt.sqlite')
+    create_db.create_new_sorted_device_database(source, rebuilt)
+    devices, models, indexed, _ = read_devices(output)
+    assert (devices, models, indexed) == read_devices(rebuilt)[:3]
+    assert devices == [
+        'Apple MacBook 14', 'Apple MacBook 16 M3',
+        'Lenovo ThinkPad X1 Carbon Gen 10', 'Lenovo ThinkPad X1 Carbon Gen 9', 'Lenovo ThinkPad X1 Nano'
+    ]
+    assert indexed == devices
+    db = sqlite3.connect(output)
+    assert db.execute("SELECT COUNT(*) FROM devices_fts WHERE devices_fts MATCH 'Yoga';").fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM devices_fts WHERE devices_fts MATCH ?;", ('"Gen 10"',)).fetchone()[0] == 1
+    db.close()
+
+
+def test_incremental_update_leaves_an_unchanged_database_alone(paths, capsys):
+    source, output = paths
+    write_source(source, MODELS)
+    create_db.create_new_sorted_device_database(source, output)
+    before = read_devices(output)
+
+    create_db.update_device_database(source, output)
+
+    assert read_devices(output) == before
+    assert 'already up to date' in capsys.readouterr().out
+
+
+def test_incremental_update_falls_back_to_a_full_build(paths):
+    source, output = paths
+    write_source(source, MODELS)
+    db = sqlite3.connect(output)
+    with db:
+        db.execute("CREATE TABLE devices (ID INTEGER PRIMARY KEY, DEVICE TEXT NOT NULL UNIQUE);")
+        db.execute("INSERT INTO devices (DEVICE) VALUES ('Old device');")
+    db.close()
+
+    create_db.update_device_database(source, output)
+
+    devices, models, indexed, _ = read_devices(output)
+    assert 'Old device' not in devices
+    assert len(models) == len(MODELS)
+    assert indexed == devices
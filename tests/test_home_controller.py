@@ -0,0 +1,107 @@
+import time
+import threading
+import types
+
+import pytest
+
+from controllers import home_controller
+
+RESULT = ({'success': True, 'manual_id': ['manual-1']}, 200)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    # every run notifies a phase and streams a token, then returns or raises the next queued result
+    state = types.SimpleNamespace(runs=0, results=[], release=threading.Event(), started=threading.Event())
+    state.release.set()
+
+    def fake_generate(device, mapped_models, notify, on_token):
+        state.runs += 1
+        notify('searching', device=device)
+        on_token(0, 'Remove ')
+        state.started.set()
+        state.release.wait(5)
+        result = state.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(home_controller, 'map_device_to_models', lambda device: ['MacBook Pro 14'])
+    monkeypatch.setattr(home_controller, 'generate_device_manuals', fake_generate)
+    monkeypatch.setattr(home_controller, '_generations', {})
+    return state
+
+
+def test_concurrent_calls_share_one_run(pipeline):
+    pipeline.results.append(RESULT)
+    pipeline.release.clear()
+    leader_events, follower_events, follower_text, results = [], [], [], []
+
+    leader = threading.Thread(target=lambda: results.append(
+        home_controller.run_manual_generation('MacBook Pro 14', progress=lambda phase, **d: leader_events.append(phase))
+    ))
+    leader.start()
+    assert pipeline.started.wait(5)
+
+    follower = threading.Thread(target=lambda: results.append(home_controller.run_manual_generation(
+        'macbook pro 14',
+        progress=lambda phase, **d: follower_events.append(phase),
+        on_token=lambda index, text: follower_text.append((index, text))
+    )))
+    follower.start()
+    generation = home_controller._generations[('macbook pro 14',)]
+    deadline = time.time() + 5
+    while len(generation['listeners']) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+
+    pipeline.release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert pipeline.runs == 1
+    assert results == [RESULT, RESULT]
+    # the follower caught up on what the run sent before it attached
+    assert leader_events == follower_events == ['searching']
+    assert follower_text == [(0, 'Remove ')]
+
+
+def test_failed_run_is_not_retained(pipeline):
+    pipeline.results += [RuntimeError('Ollama is down'), ({'success': False, 'status': 'error'}, 500), RESULT]
+
+    with pytest.raises(RuntimeError):
+        home_controller.run_manual_generation('MacBook Pro 14')
+    assert home_controller._generations == {}
+
+    assert home_controller.run_manual_generation('MacBook Pro 14')[1] == 500
+    assert home_controller._generations == {}
+
+    assert home_controller.run_manual_generation('MacBook Pro 14') == RESULT
+    assert pipeline.runs == 3
+
+
+def test_retained_result_expires_after_the_retention(pipeline, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(home_controller, 'time', types.SimpleNamespace(time=lambda: clock[0]))
+    monkeypatch.setattr(home_controller, 'GENERATION_RETENTION', 60)
+    pipeline.results += [RESULT, ({'success': True, 'manual_id': ['manual-2']}, 200)]
+
+    assert home_controller.run_manual_generation('MacBook Pro 14') == RESULT
+
+    clock[0] += 60
+    assert home_controller.run_manual_generation('MacBook Pro 14') == RESULT
+    assert pipeline.runs == 1
+
+    clock[0] += 1
+    assert home_controller.run_manual_generation('MacBook Pro 14')[0]['manual_id'] == ['manual-2']
+    assert pipeline.runs == 2
+
+
+def test_retention_disabled_runs_every_call(pipeline, monkeypatch):
+    monkeypatch.setattr(home_controller, 'GENERATION_RETENTION', 0)
+    pipeline.results += [RESULT, RESULT]
+
+    home_controller.run_manual_generation('MacBook Pro 14')
+    home_controller.run_manual_generation('MacBook Pro 14')
+
+    assert pipeline.runs == 2
+    assert home_controller._generations == {}
@@ -0,0 +1,108 @@
+import time
+import threading
+
+from controllers import job_controller
+from controllers.job_controller import JobStore, JOB_INTERRUPTED
+
+
+def test_job_store_create_and_get(tmp_path):
+    store = JobStore(path=str(tmp_path / 'cache.sqlite'))
+    store.create('job', 'MacBook Pro 14')
+
+    job = store.get('job')
+
+    assert job['job_id'] == 'job'
+    assert job['device'] == 'MacBook Pro 14'
+    assert job['status'] == 'queued'
+    assert job['manual_id'] == [] and job['titles'] == []
+    assert store.get('missing') is None
+    assert store.version('missing') is None
+
+
+def test_job_store_update_and_append_text_change_the_version(tmp_path):
+    store = JobStore(path=str(tmp_path / 'cache.sqlite'))
+    store.create('job', 'device')
+
+    store.update('job', 'generating', status='running', completed=1, total=2, report_id='manual-1', titles=['a', 'b'])
+    store.append_text('job', {0: 'Remove '})
+    store.append_text('job', {0: 'the screws', 1: 'Lift'})
+
+    job = store.get('job')
+    assert job['version'] == 3
+    assert job['status'] == 'running'
+    assert job['message'] == 'Generating manuals 1/2...'
+    assert job['manual_id'] == ['manual-1']
+    assert store.get_text('job') == {0: 'Remove the screws', 1: 'Lift'}
+
+
+def test_job_store_is_shared_across_connections(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    JobStore(path=path).create('job', 'device')
+    reads = []
+
+    # another store, as in another worker process, and another thread of the same store
+    other = JobStore(path=path)
+    other.update('job', 'done', status='done', result={'success': True}, status_code=200)
+    thread = threading.Thread(target=lambda: reads.append(other.get('job')))
+    thread.start()
+    thread.join()
+
+    assert JobStore(path=path).get('job')['result'] == {'success': True}
+    assert reads[0]['status'] == 'done'
+
+
+def test_job_store_interrupts_only_stale_unfinished_jobs(tmp_path):
+    store = JobStore(path=str(tmp_path / 'cache.sqlite'))
+    store.create('stale', 'device')
+    store.create('alive', 'device')
+    store.create('finished', 'device')
+    store.update('finished', 'done', status='done', result={'success': True}, status_code=200)
+    conn = store._connection()
+    with conn:
+        conn.execute("UPDATE jobs SET UPDATED_AT = UPDATED_AT - 120")
+    store.touch(['alive', 'finished'])
+
+    assert store.interrupt_stale(60) == 1
+
+    assert store.get('stale')['result'] == JOB_INTERRUPTED
+    assert store.get('stale')['status_code'] == 500
+    assert store.get('alive')['status'] == 'queued'
+    assert store.get('finished')['result'] == {'success': True}
+    # the worker of an interrupted job cannot bring it back
+    store.update('stale', 'generating', status='running')
+    assert store.get('stale')['status'] == 'done'
+
+
+def test_job_store_prune_removes_old_finished_jobs_and_their_text(tmp_path):
+    store = JobStore(path=str(tmp_path / 'cache.sqlite'))
+    store.create('old', 'device')
+    store.append_text('old', {0: 'text'})
+    store.update('old', 'done', status='done', result={'success': True}, status_code=200)
+    store.create('running', 'device')
+    conn = store._connection()
+    with conn:
+        conn.execute("UPDATE jobs SET UPDATED_AT = UPDATED_AT - 7200")
+
+    store.prune(3600)
+
+    assert store.get('old') is None
+    assert store.get_text('old') == {}
+    assert store.get('running') is not None
+
+
+def test_get_job_interrupts_a_job_left_by_a_stopped_worker(tmp_path, monkeypatch):
+    store = JobStore(path=str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(job_controller, 'job_store', store)
+    monkeypatch.setattr(job_controller, 'JOB_STALE_TIMEOUT', 60)
+    store.create('job', 'device')
+    store.update('job', 'generating', status='running')
+
+    assert job_controller.get_job('job')['status'] == 'running'
+
+    conn = store._connection()
+    with conn:
+        conn.execute("UPDATE jobs SET UPDATED_AT = ?", (time.time() - 120,))
+
+    job = job_controller.get_job('job')
+    assert job['status'] == 'done'
+    assert job['result'] == JOB_INTERRUPTED
@@ -0,0 +1,65 @@
+import io
+
+from controllers.vtt_controller import iter_cues
+
+ROLLING_VTT = """WEBVTT
+Kind: captions
+Language: en
+
+00:00:01.000 --> 00:00:03.000 align:start position:0%
+remove<00:00:01.500><c> the</c><00:00:02.000><c> screws</c>
+
+00:00:03.000 --> 00:00:03.010 align:start position:0%
+remove the screws
+
+00:00:03.010 --> 00:00:05.000 align:start position:0%
+remove the screws
+then<00:00:03.500><c> lift</c><00:00:04.000><c> the</c><c> cover</c>
+
+00:00:05.000 --> 00:00:07.000 align:start position:0%
+then lift the cover
+"""
+
+
+def test_iter_cues_drops_rolling_caption_repeats_and_tags(tmp_path):
+    path = tmp_path / 'video.en.vtt'
+    path.write_text(ROLLING_VTT, encoding='utf-8')
+
+    assert list(iter_cues(str(path))) == [
+        ('00:00:01.000', '00:00:03.000', 'remove the screws'),
+        ('00:00:03.010', '00:00:05.000', 'then lift the cover')
+    ]
+
+
+def test_iter_cues_skips_header_notes_and_identifiers_and_unescapes_entities(tmp_path):
+    path = tmp_path / 'video.en.vtt'
+    path.write_text(
+        "\ufeffWEBVTT\n\n"
+        "NOTE written by hand\n\n"
+        "1\n"
+        "01:02.500 --> 01:04.000\n"
+        "<v Speaker>Screws &amp; clips</v>\n\n"
+        "2\n"
+        "1:00:00.000 --> 1:00:01.000\n"
+        "Done\n",
+        encoding='utf-8'
+    )
+
+    assert list(iter_cues(path)) == [
+        ('01:02.500', '01:04.000', 'Screws & clips'),
+        ('1:00:00.000', '1:00:01.000', 'Done')
+    ]
+
+
+def test_iter_cues_reads_binary_files_with_crlf_lines():
+    source = io.BytesIO("WEBVTT\r\n\r\n00:00:01.000 --> 00:00:02.000\r\nUnplug the cable\r\n".encode('utf-8'))
+
+    assert list(iter_cues(source)) == [('00:00:01.000', '00:00:02.000', 'Unplug the cable')]
+
+
+def test_iter_cues_keeps_a_line_repeated_after_the_rolling_window():
+    source = ["WEBVTT", ""]
+    for i, text in enumerate(['one', 'two', 'three', 'four', 'one']):
+        source += [f"00:00:0{i}.000 --> 00:00:0{i + 1}.000", text, ""]
+
+    assert [text for _, _, text in iter_cues(source)] == ['one', 'two', 'three', 'four', 'one']